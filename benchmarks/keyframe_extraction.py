@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+'''
+Keyframe extraction time by engine
+
+Encodes sample clips with ffmpeg (or uses the given videos) and extracts
+their keyframes with the 'select' engine, which decodes every frame and
+filters the I-frames, and the 'skip' engine, which makes the decoder skip
+non-key frames. Checks that both engines save the same number of keyframes
+per video and reports the largest mean pixel difference between their
+images.
+
+Usage:
+    python benchmarks/keyframe_extraction.py --clips 8 --duration 30
+    python benchmarks/keyframe_extraction.py --videos output/downloaded_videos/*.mp4
+'''
+
+# import modules
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from PIL import Image
+
+# project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# local dependencies
+from media_handlers.utilities import build_keyframes_command
+
+def encode_clip(path: str, duration: int, gop: int, seed: int) -> None:
+    '''
+    Encodes a vertical H.264 test clip with a keyframe every `gop` frames.
+    '''
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size=720x1280:rate=30:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency={220 + seed * 20}:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-g', str(gop), '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def extract(videos: list, output: str, engine: str) -> float:
+    '''
+    Extracts the keyframes of every video and returns the elapsed seconds.
+    '''
+    start = time.perf_counter()
+    for video in videos:
+        name = os.path.splitext(os.path.basename(video))[0]
+        directory = f'{output}/{engine}/{name}'
+        os.makedirs(directory)
+        subprocess.run(
+            build_keyframes_command(video, f'{directory}/keyframe_%04d.jpg', engine),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+        )
+
+    return time.perf_counter() - start
+
+def compare(output: str) -> tuple:
+    '''
+    Compares the keyframes saved by both engines.
+
+    :return: The number of videos with a different keyframe count and the
+        largest mean absolute pixel difference between matching images.
+    '''
+    mismatches = 0
+    max_difference = 0.0
+    for directory in sorted(glob.glob(f'{output}/select/*')):
+        name = os.path.basename(directory)
+        selected = sorted(glob.glob(f'{directory}/*.jpg'))
+        skipped = sorted(glob.glob(f'{output}/skip/{name}/*.jpg'))
+        if len(selected) != len(skipped):
+            mismatches += 1
+            continue
+
+        for a, b in zip(selected, skipped):
+            a = np.asarray(Image.open(a).convert('L'), dtype=np.int16)
+            b = np.asarray(Image.open(b).convert('L'), dtype=np.int16)
+            max_difference = max(max_difference, float(np.abs(a - b).mean()))
+
+    return mismatches, max_difference
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--videos', nargs='+', default=None)
+    parser.add_argument('--clips', type=int, default=8)
+    parser.add_argument('--duration', type=int, default=30)
+    parser.add_argument('--gop', type=int, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output:
+        videos = args.videos
+        if not videos:
+            videos = []
+            for i in range(args.clips):
+                path = f'{output}/clip_{i}.mp4'
+                encode_clip(path, args.duration, args.gop, i)
+                videos.append(path)
+
+        print (f'{len(videos)} videos\n')
+        print (f'{"engine":<8} {"seconds":>9} {"keyframes":>10}')
+        timings = {}
+        for engine in ['select', 'skip']:
+            timings[engine] = extract(videos, output, engine)
+            keyframes = len(glob.glob(f'{output}/{engine}/*/*.jpg'))
+            print (f'{engine:<8} {timings[engine]:>9.2f} {keyframes:>10}')
+
+        mismatches, difference = compare(output)
+        print (f'\nspeedup: {timings["select"] / timings["skip"]:.1f}x')
+        print (
+            f'videos with a different keyframe count: {mismatches}, '
+            f'largest mean pixel difference: {difference:.2f}/255'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+'''
+Peak memory of concurrent video downloads
+
+Serves a fixed-size payload from a local aiohttp server and downloads it
+concurrently through RequestSession, once buffering each response in memory
+(the previous behaviour) and once streaming it to disk in chunks. Each mode
+runs in a separate process so its peak RSS can be measured independently.
+
+Usage:
+    python benchmarks/media_download_memory.py --downloads 200 --size-mb 8
+'''
+
+# import modules
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+# aiohttp
+from aiohttp import web, ClientSession
+
+# project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# local dependencies
+from media_handlers import RequestSession
+
+class BufferedRequestSession(RequestSession):
+    '''
+    RequestSession that reads each response fully before writing it.
+    '''
+    async def fetch_file(self, session: ClientSession, url: str,
+                         filename: str, **kwargs) -> int:
+        async with session.get(url) as res:
+            file_data = await res.read()
+            with open(filename, 'wb') as f:
+                f.write(file_data)
+
+        return len(file_data)
+
+def peak_rss_mb() -> float:
+    '''
+    :return: Peak resident set size of this process in MB.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is reported in bytes on macOS and in KB on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def run_child(mode: str, url: str, downloads: int) -> None:
+    '''
+    Downloads the payload `downloads` times concurrently and prints the
+    elapsed time and peak RSS.
+    '''
+    session_class = BufferedRequestSession if mode == 'buffered' else RequestSession
+    request_session = session_class()
+
+    with tempfile.TemporaryDirectory() as output:
+        links = [f'https://www.tiktok.com/@user/video/{i}' for i in range(downloads)]
+        start = time.perf_counter()
+        request_session.run(
+            request_session.download_files(
+                urls=[url] * downloads,
+                links=links,
+                output=output,
+                file_extension='mp4'
+            )
+        )
+        elapsed = time.perf_counter() - start
+        request_session.close()
+
+    print (f'{mode},{elapsed:.2f},{peak_rss_mb():.1f}')
+
+def start_server(payload: bytes) -> int:
+    '''
+    Starts a local server in a background thread.
+
+    :return: The server port.
+    '''
+    async def video(request: web.Request) -> web.Response:
+        return web.Response(body=payload, content_type='video/mp4')
+
+    app = web.Application()
+    app.router.add_get('/video.mp4', video)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return port
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--downloads', type=int, default=200)
+    parser.add_argument('--size-mb', type=float, default=8)
+    parser.add_argument('--child', choices=['buffered', 'streamed'])
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.url, args.downloads)
+        return
+
+    payload = os.urandom(int(args.size_mb * 1024 ** 2))
+    port = start_server(payload)
+    url = f'http://127.0.0.1:{port}/video.mp4'
+
+    print (f'{args.downloads} concurrent downloads of {args.size_mb} MB\n')
+    print (f'{"mode":<10} {"seconds":>8} {"peak RSS (MB)":>14}')
+    for mode in ['buffered', 'streamed']:
+        result = subprocess.run(
+            [
+                sys.executable, os.path.abspath(__file__),
+                '--child', mode,
+                '--url', url,
+                '--downloads', str(args.downloads)
+            ],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            print (result.stderr)
+            continue
+
+        _, elapsed, peak = result.stdout.strip().splitlines()[-1].split(',')
+        print (f'{mode:<10} {elapsed:>8} {peak:>14}')
+
+if __name__ == '__main__':
+    main()
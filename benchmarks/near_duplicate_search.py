@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+'''
+Near-duplicate search over perceptual hashes
+
+Generates random 64-bit hashes with planted near-duplicates and times the
+block-indexed Hamming search of PerceptualHashIndex against a brute-force
+batched XOR/popcount over every pair.
+
+Usage:
+    python benchmarks/near_duplicate_search.py --hashes 300000 --distance 6
+'''
+
+# import modules
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# local dependencies
+from media_handlers.perceptual_hash import hamming_pairs, popcount64
+
+def brute_force_pairs(hashes: np.ndarray, threshold: int,
+                      batch_size: int = 1 << 24) -> int:
+    '''
+    Counts the pairs within `threshold` bits by comparing every pair.
+
+    :return: The number of matching pairs.
+    '''
+    n = len(hashes)
+    rows = max(1, batch_size // n)
+    matches = 0
+    for start in range(0, n, rows):
+        batch = hashes[start:start + rows]
+        distance = popcount64(batch[:, None] ^ hashes[None, start:])
+
+        # upper triangle only
+        distance[np.tril_indices(len(batch), m=distance.shape[1])] = 64
+        matches += int((distance <= threshold).sum())
+
+    return matches
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--hashes', type=int, default=300000)
+    parser.add_argument('--distance', type=int, default=6)
+    parser.add_argument('--duplicates', type=int, default=1000)
+    parser.add_argument('--brute-force-max', type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 64, args.hashes, dtype=np.uint64)
+
+    # planted near-duplicates: copies with a few flipped bits
+    copies = hashes[:args.duplicates].copy()
+    for _ in range(max(1, args.distance // 2)):
+        flips = rng.integers(0, 64, args.duplicates).astype(np.uint64)
+        copies ^= np.uint64(1) << flips
+    hashes[-args.duplicates:] = copies
+    hashes = np.unique(hashes)
+
+    print (f'{len(hashes)} hashes, distance <= {args.distance}\n')
+    start = time.perf_counter()
+    i, _ = hamming_pairs(hashes, args.distance)
+    print (f'{"indexed":<12} {time.perf_counter() - start:>8.2f}s {len(i):>8} pairs')
+
+    if len(hashes) <= args.brute_force_max:
+        start = time.perf_counter()
+        matches = brute_force_pairs(hashes, args.distance)
+        print (f'{"brute force":<12} {time.perf_counter() - start:>8.2f}s {matches:>8} pairs')
+    else:
+        print (f'brute force skipped above {args.brute_force_max} hashes')
+
+if __name__ == '__main__':
+    main()
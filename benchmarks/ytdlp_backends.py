@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+'''
+yt-dlp download throughput by backend and worker count
+
+Serves small video files from a local server and downloads them through
+VideoDownloader on the thread and the process backends with an increasing
+number of workers. Payloads are small, so throughput is bound by yt-dlp's
+CPU work (extraction, format selection, bookkeeping) rather than the network.
+
+Usage:
+    python benchmarks/ytdlp_backends.py --urls 400 --workers 1 2 4 8 16
+'''
+
+# import modules
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# local dependencies
+from media_handlers import VideoDownloader
+from ytdlp_reuse import start_server
+
+def run(urls: list, workers: int, backend: str) -> float:
+    '''
+    Downloads the URLs and returns the throughput in URLs per second.
+    '''
+    with tempfile.TemporaryDirectory() as output:
+        downloader = VideoDownloader(output=output)
+
+        # plain files: no format selection or ffmpeg post-processing
+        for options in [downloader.video_options, downloader.audio_options]:
+            options['format'] = 'best'
+            options.pop('postprocessors', None)
+
+        start = time.perf_counter()
+        downloader.download_videos(urls=urls, max_workers=workers, backend=backend)
+        elapsed = time.perf_counter() - start
+
+    return len(urls) / elapsed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--urls', type=int, default=400)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    port = start_server(os.urandom(16 * 1024))
+    urls = [f'http://127.0.0.1:{port}/video/{i}.mp4' for i in range(args.urls)]
+
+    print (f'{args.urls} URLs, {os.cpu_count()} CPUs\n')
+    print (f'{"workers":<8} {"thread (URL/s)":>15} {"process (URL/s)":>16}')
+    for workers in args.workers:
+        threads = run(urls, workers, 'thread')
+        processes = run(urls, workers, 'process')
+        print (f'{workers:<8} {threads:>15.1f} {processes:>16.1f}')
+
+if __name__ == '__main__':
+    main()
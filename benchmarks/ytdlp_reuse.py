@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+'''
+Per-URL overhead of yt-dlp downloads
+
+Serves small video files from a local aiohttp server and downloads them
+through VideoDownloader, once building new YoutubeDL instances for every URL
+(the previous behaviour) and once reusing the instances of each worker
+thread. The payload is tiny, so the difference is the per-URL overhead of
+initializing extractors, cookie jars and HTTP openers.
+
+Usage:
+    python benchmarks/ytdlp_reuse.py --urls 200 --workers 1 4
+'''
+
+# import modules
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+# aiohttp
+from aiohttp import web
+
+# yt_dlp module
+from yt_dlp import YoutubeDL
+
+# project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# local dependencies
+from media_handlers import VideoDownloader
+
+class FreshVideoDownloader(VideoDownloader):
+    '''
+    VideoDownloader that builds new YoutubeDL instances for every URL.
+    '''
+    def _get_ydl(self, kind: str) -> YoutubeDL:
+        self._reset_thread_instances()
+        return super()._get_ydl(kind)
+
+def start_server(payload: bytes) -> int:
+    '''
+    Starts a local server in a background thread.
+
+    :return: The server port.
+    '''
+    async def video(request: web.Request) -> web.Response:
+        return web.Response(body=payload, content_type='video/mp4')
+
+    app = web.Application()
+    app.router.add_get('/video/{video_id}.mp4', video)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return port
+
+def run(downloader_class: type, urls: list, workers: int) -> float:
+    '''
+    Downloads the URLs and returns the elapsed time per URL in milliseconds.
+    '''
+    with tempfile.TemporaryDirectory() as output:
+        downloader = downloader_class(output=output)
+
+        # plain files: no format selection or ffmpeg post-processing
+        for options in [downloader.video_options, downloader.audio_options]:
+            options['format'] = 'best'
+            options.pop('postprocessors', None)
+
+        start = time.perf_counter()
+        downloader.download_videos(urls=urls, max_workers=workers)
+        elapsed = time.perf_counter() - start
+
+    return elapsed / len(urls) * 1000
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--urls', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    port = start_server(os.urandom(16 * 1024))
+    urls = [f'http://127.0.0.1:{port}/video/{i}.mp4' for i in range(args.urls)]
+
+    print (f'{args.urls} URLs, video and audio pass per URL\n')
+    print (f'{"workers":<8} {"fresh (ms/URL)":>15} {"reused (ms/URL)":>16}')
+    for workers in args.workers:
+        fresh = run(FreshVideoDownloader, urls, workers)
+        reused = run(VideoDownloader, urls, workers)
+        print (f'{workers:<8} {fresh:>15.1f} {reused:>16.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,11 @@ import time
 import json
 import uuid
 import httpx
+import asyncio
+import functools
 
 # typing
-from typing import Dict, List
-
-# SerpAPI module
-import serpapi
+from typing import Dict, List, Tuple
 
 # Apify client
 from apify_client import ApifyClient
@@ -22,8 +21,15 @@ from .utilities import (
     select_serpapi_parameters,
     extract_results_keys,
     extract_related_content_keys,
-    build_site_query
+    build_site_query,
+    split_date_range,
+    bisect_date_range,
+    date_range_filter,
+    parse_locales
 )
+from .key_pool import KeyPool
+from .rate_limiter import RateLimiter
+from .serpapi_client import SerpAPIClient
 
 # utils
 from pathlib import Path
@@ -32,7 +38,7 @@ from pathlib import Path
 from databases import SQLDatabaseManager
 
 # Media handlers
-from media_handlers import RequestSession
+from media_handlers import RequestSession, MediaStore, AIMDController
 
 # SerpAPI collector class
 class TikTokDataCollector:
@@ -51,17 +57,21 @@ class TikTokDataCollector:
         # get output data path
         self.output = self._sanitize_output_path(args['output'])
 
-        # endpoint for SerpAPI
-        self.api_key = args['api_key']
-        self.endpoint = 'https://serpapi.com/search'
-
-        # Apify token
-        self.apify_token = args['apify_token']
+        # SerpAPI keys and Apify tokens
+        self.serpapi_keys = KeyPool(
+            args.get('api_keys') or [args.get('api_key')],
+            name='SerpAPI'
+        )
+        self.apify_tokens = KeyPool(
+            args.get('apify_tokens') or [args.get('apify_token')],
+            name='Apify'
+        )
 
         # main site: tiktok.com
         self.site = 'tiktok.com'
 
         # build the search query string
+        self.base_query = args.get('q') or ''
         q = search_query(args=args)
 
         # get provided user and tag
@@ -79,15 +89,40 @@ class TikTokDataCollector:
         # store the parameters
         self.parameters = select_serpapi_parameters(args)
 
-        # SerpAPI client
-        self.client = serpapi.Client(api_key=self.api_key)
+        # result handlers: response field and processing method
+        self.result_handlers = {
+            'search_result': ('organic_results', self._process_search_results),
+            'image_result': ('images_results', self._process_images_results)
+        }
+
+        # sharded search over the --after/--before window
+        self.after = args.get('after')
+        self.before = args.get('before')
+        self.shard_days = args.get('shard_days')
+        self.shard_max_pages = args.get('shard_max_pages') or 3
+        self.search_workers = args.get('search_workers') or 4
+
+        # locale fan-out: gl:hl[:google_domain] combinations
+        self.locales = []
+        if args.get('locales'):
+            self.locales = parse_locales(
+                args['locales'],
+                default_domain=args.get('google_domain') or 'google.com'
+            )
+
+        # async SerpAPI client shared by every collector stage
+        self.serpapi_client = SerpAPIClient(
+            key_pool=self.serpapi_keys,
+            rate_limiter=RateLimiter(args.get('rate_limit') or 1.0),
+            max_concurrency=self.search_workers,
+            timeout=args.get('request_timeout') or 60.0
+        )
 
         # Apify client
         self.run_apify = args['apify']
         if self.run_apify:
             if self.user is not None or self.tag is not None:
                 self.should_download_videos = args['download']
-                self.apify_client = ApifyClient(self.apify_token)
 
                 # optional date filters
                 self.oldest_post_date = args['oldest_post_date']
@@ -96,13 +131,40 @@ class TikTokDataCollector:
                 # number of results
                 self.number_of_results = args['number_of_results']
 
+        # thumbnail normalization
+        self.thumbnail_format = args.get('thumbnail_format')
+        self.thumbnail_max_size = args.get('thumbnail_max_size') or 320
+        self.keep_original_thumbnails = args.get('keep_original_thumbnails', False)
+
         # database connection
         self.sql_database = SQLDatabaseManager(self.output, self.run_apify)
 
         # connections
         self.related_content_urls = []
+
+        # thumbnail downloads scheduled while the searches go on
+        self._media_tasks = []
         self.related_content_depth = args['depth']
-        self.http_session = RequestSession()
+        max_concurrency = args.get('media_concurrency') or 32
+        concurrency = None
+        if args.get('adaptive_concurrency'):
+            concurrency = AIMDController(
+                min_limit=args.get('min_workers') or 1,
+                max_limit=max_concurrency,
+                stage='media'
+            )
+
+        self.http_session = RequestSession(
+            max_concurrency=max_concurrency,
+            max_per_host=args.get('media_per_host') or 8,
+            connect_timeout=args.get('connect_timeout') or 10.0,
+            read_timeout=args.get('read_timeout') or 60.0,
+            max_retries=args.get('media_retries', 3),
+            sql_database=self.sql_database,
+            refresh_media=args.get('refresh_media', False),
+            media_store=MediaStore(self.output, self.sql_database),
+            concurrency=concurrency
+        )
     
     def _sanitize_output_path(self, output: str) -> str:
         '''
@@ -124,62 +186,171 @@ class TikTokDataCollector:
 
         return output
 
-    def collect_search_results(self) -> None:
-        '''
-        Makes an API call to SerpAPI and processes the response data.
+    def _run_apify_actor(self, actor_key: str, run_input: Dict,
+                         max_retries: int = 3) -> List[Dict]:
+        '''
+        Runs an Apify actor with the next token in the pool and returns the
+        items of its default dataset.
+
+        Tokens that are invalid or out of usage are dropped and the run
+        moves to the next token. Transient errors (rate limits, server and
+        network errors) are retried with backoff, up to `max_retries` times
+        in total. Any other error, e.g. an invalid actor input, is raised
+        without charging the token.
+
+        :param actor_key: The Apify actor ID.
+        :param run_input: The actor input.
+        :param max_retries: Maximum number of retries after transient
+            errors.
+        :return: A list with the dataset items.
+        :raises RuntimeError: If the pool has no usable tokens left.
+        '''
+        retries = 0
+        while True:
+            token = self.apify_tokens.acquire()
+            apify_client = ApifyClient(token)
+            try:
+                run = apify_client.actor(actor_key).call(run_input=run_input)
+                items = list(
+                    apify_client.dataset(run['defaultDatasetId']).iterate_items()
+                )
+                self.apify_tokens.report_success(token)
+                return items
+            except httpx.LocalProtocolError:
+                # missing or malformed token
+                self.apify_tokens.report_failure(
+                    token, 'missing or invalid token', drop=True
+                )
+            except Exception as e:
+                status = getattr(e, 'status_code', None)
 
-        Fetches data based on the initialized parameters and handles pagination
-        to retrieve data from all available pages.
-        '''
-        print (f'\nAPI call to Google search results\n')
-        print (f'> search query: {self.query}')
-        result_type = 'search_result'
-        try:
-            api_response = self.client.search(self.parameters)
-            print ('\n> Searching...')
+                # invalid token or usage limits reached
+                if status in (401, 402, 403):
+                    self.apify_tokens.report_failure(token, str(e), drop=True)
+                    continue
 
-            # save raw data
-            self._save_raw_data(
-                self.output,
-                result_type=result_type,
-                data=api_response.data
-            )
+                transient = status == 429 or (status or 0) >= 500 or \
+                    isinstance(e, httpx.TransportError)
+                if not transient or retries >= max_retries:
+                    raise
 
-            # found results
-            found_results = False
+                self.apify_tokens.report_failure(token, str(e))
+                retries += 1
+                time.sleep(min(30.0, 2 ** retries))
 
-            # process search results
-            self._process_search_results(api_response.data)
-            if api_response.data.get('organic_results', []):
-                found_results = True
+    def report_key_usage(self) -> None:
+        '''
+        Prints the requests, errors and remaining quota of every SerpAPI key
+        and Apify token.
+        '''
+        pools = [self.serpapi_keys]
+        if self.run_apify:
+            pools.append(self.apify_tokens)
+
+        for pool in pools:
+            summary = pool.summary()
+            if len(summary) < 2:
+                continue
+
+            print (f'\n> {pool.name} key usage:')
+            for item in summary:
+                remaining = item['remaining'] if item['remaining'] is not None else 'n/a'
+                print (
+                    f"  {item['key']}: {item['requests']} requests, "
+                    f"{item['errors']} errors, {remaining} left "
+                    f"({item['status']})"
+                )
 
-            # get next page
-            next_page = api_response.next_page_url
-            while next_page:
-                # get new API response
-                next_response = api_response.next_page()
+    async def _run_blocking(self, func, *args, **kwargs):
+        '''
+        Runs a blocking call (SQLite writes, raw data files) in the default
+        executor, so the event loop keeps serving the other stages.
 
+        :param func: The function to call.
+        :return: The value returned by the function.
+        '''
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(func, *args, **kwargs)
+        )
+
+    async def _paginate_search(self, parameters: Dict, result_type: str,
+                               max_pages: int = None, locale: Dict = None,
+                               seen_links: set = None) -> Tuple[int, bool, bool]:
+        '''
+        Makes an API call to SerpAPI and follows the pagination links,
+        processing and saving every page of results.
+
+        :param parameters: SerpAPI parameters for the first page.
+        :param result_type: Type of SerpAPI response: 'search_result' or
+            'image_result'.
+        :param max_pages: Optional maximum number of pages to request.
+        :param locale: Optional locale that the parameters target, recorded
+            for every post found.
+        :param seen_links: Optional set of the links already stored, e.g. by
+            the shard this search refines. Pages with only such links are
+            not saved or processed again. Updated with the links found.
+        :return: A tuple with the number of pages requested, whether the
+            page limit was reached while more pages were available, and
+            whether any results were found.
+        '''
+        field, process_results = self.result_handlers[result_type]
+
+        pages = 0
+        found_results = False
+        data = await self.serpapi_client.search(parameters)
+        while data:
+            pages += 1
+
+            # pages already stored by a broader search are reused as is
+            links = {i.get('link') for i in data.get(field, []) if i.get('link')}
+            stored = seen_links is not None and links and links <= seen_links
+            if seen_links is not None:
+                seen_links |= links
+
+            if not stored:
                 # save raw data
-                self._save_raw_data(
+                await self._run_blocking(
+                    self._save_raw_data,
                     self.output,
                     result_type=result_type,
-                    data=next_response.data
+                    data=data
                 )
 
-                # process search results
-                self._process_search_results(next_response.data)
+                # process results
+                await process_results(data, locale=locale)
+
+            if data.get(field, []):
+                found_results = True
+
+            # stop at the page limit if more pages are available
+            has_next_page = bool(data.get('serpapi_pagination', {}).get('next'))
+            if has_next_page and max_pages is not None and pages >= max_pages:
+                return pages, True, found_results
+
+            # get next page
+            data = await self.serpapi_client.next_page(data)
 
-                # get next page
-                next_page = next_response.next_page_url
+        return pages, False, found_results
 
-                # update api_response for the next iteration
-                api_response = next_response
+    async def collect_search_results(self) -> None:
+        '''
+        Makes an API call to SerpAPI and processes the response data.
 
-                # chill out
-                time.sleep(2)
+        Fetches data based on the initialized parameters and handles pagination
+        to retrieve data from all available pages.
+        '''
+        print (f'\nAPI call to Google search results\n')
+        print (f'> search query: {self.query}')
+        result_type = 'search_result'
+        try:
+            print ('\n> Searching...')
+            _, _, found_results = await self._paginate_search(
+                self.parameters,
+                result_type=result_type
+            )
             
             # api call status
-            print ('> Done')
+            print ('> Done searching')
 
             if not found_results:
                 print ('No organic results found.')
@@ -187,12 +358,228 @@ class TikTokDataCollector:
         except Exception as e:
             print (f'An error occurred during the API call: {e}')
     
-    def _process_search_results(self, data: Dict) -> None:
+    async def collect_sharded_results(self, result_type: str,
+                                      parameters: Dict = None,
+                                      locale: Dict = None) -> None:
+        '''
+        Splits the --after/--before window into date sub-ranges and searches
+        them concurrently under a shared rate limit.
+
+        Shards are closed day ranges that do not overlap. Shards that reach
+        the page limit while Google still offers more pages are split in two
+        and searched again, so coverage grows with the time window instead
+        of stopping at the per-query result cap. The results of a split
+        shard stay stored; its halves reuse them, skipping the pages whose
+        links were all stored already. Results from every shard are merged
+        into the same database, which deduplicates them by link and post ID.
+
+        :param result_type: Type of SerpAPI response: 'search_result' or
+            'image_result'.
+        :param parameters: Optional SerpAPI parameters to use instead of
+            the default ones.
+        :param locale: Optional locale that the parameters target.
+        '''
+        label = 'search results' if result_type == 'search_result' else 'images'
+        if locale is not None:
+            label = f'{label} ({locale["locale"]})'
+
+        print (f'\n\nSharded API call to Google {label}\n')
+
+        shards = split_date_range(self.after, self.before, self.shard_days)
+        print (f'> {len(shards)} initial shards between {self.after} and {self.before}')
+
+        def submit(first: str, last: str, seen_links: set) -> None:
+            task = asyncio.ensure_future(
+                self._collect_shard(
+                    first, last, result_type, parameters, locale, seen_links
+                )
+            )
+            pending[task] = (first, last, seen_links)
+
+        searched = 0
+        refined = 0
+        pending = {}
+        for first, last in shards:
+            submit(first, last, set())
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    first, last, seen_links = pending.pop(task)
+                    searched += 1
+                    try:
+                        saturated = task.result()
+                    except RuntimeError:
+                        # no usable keys left
+                        raise
+                    except Exception as e:
+                        print (f'An error occurred in shard {first} - {last}: {e}')
+                        continue
+
+                    if not saturated:
+                        continue
+
+                    # refine shards that hit the page limit
+                    halves = bisect_date_range(first, last)
+                    if halves:
+                        refined += 1
+                        for half_first, half_last in halves:
+                            submit(half_first, half_last, set(seen_links))
+                    else:
+                        print (
+                            f'> Shard {first} - {last} reached the page '
+                            'limit and cannot be split further'
+                        )
+        finally:
+            # cancel outstanding shards on errors or interruptions
+            for task in pending:
+                task.cancel()
+
+        print (f'> Done. {searched} shards searched, {refined} refined')
+
+    async def _collect_shard(self, first: str, last: str, result_type: str,
+                             parameters: Dict = None, locale: Dict = None,
+                             seen_links: set = None) -> bool:
+        '''
+        Searches a single date shard.
+
+        :param first: First day of the shard. Format: YYYY-MM-DD.
+        :param last: Last day of the shard. Format: YYYY-MM-DD.
+        :param result_type: Type of SerpAPI response: 'search_result' or
+            'image_result'.
+        :param parameters: Optional SerpAPI parameters to use instead of
+            the default ones.
+        :param locale: Optional locale that the parameters target.
+        :param seen_links: Optional set of the links stored by the shard
+            this one refines, updated with the links found.
+        :return: True if the shard reached the page limit and should be
+            refined.
+        '''
+        date_filter = date_range_filter(first, last)
+        q = f'{self.base_query} {date_filter}'.strip()
+
+        parameters = {
+            **(parameters or self.parameters),
+            'q': build_site_query(
+                site=self.site, user=self.user, tag=self.tag, q=q
+            )
+        }
+        if result_type == 'image_result':
+            parameters['tbm'] = 'isch'
+
+        _, saturated, _ = await self._paginate_search(
+            parameters,
+            result_type=result_type,
+            max_pages=self.shard_max_pages,
+            locale=locale,
+            seen_links=seen_links
+        )
+
+        return saturated
+
+    async def collect_locale_results(self) -> None:
+        '''
+        Runs the search and image queries concurrently across every locale
+        given with --locales, writing to the same database.
+
+        Posts are deduplicated by the database, while the post_locales
+        table records which locales surfaced each post.
+        '''
+        print (f'\n\nLocale fan-out across {len(self.locales)} locales\n')
+        print (f'> search query: {self.query}')
+
+        tasks = [
+            (locale, result_type) for locale in self.locales
+            for result_type in ['search_result', 'image_result']
+        ]
+        results = await asyncio.gather(
+            *[
+                self._collect_locale(locale, result_type)
+                for locale, result_type in tasks
+            ],
+            return_exceptions=True
+        )
+        for (locale, result_type), result in zip(tasks, results):
+            if isinstance(result, Exception):
+                print (
+                    f'An error occurred during the API call for '
+                    f'{locale["locale"]} ({result_type}): {result}'
+                )
+
+        print ('> Done')
+
+        # per-locale marginal yield
+        self.report_locale_yield()
+
+    async def _collect_locale(self, locale: Dict, result_type: str) -> None:
+        '''
+        Collects the results of a single locale.
+
+        :param locale: A dictionary with 'gl', 'hl', 'google_domain' and
+            'locale' keys.
+        :param result_type: Type of SerpAPI response: 'search_result' or
+            'image_result'.
+        '''
+        parameters = {
+            **self.parameters,
+            'gl': locale['gl'],
+            'hl': locale['hl'],
+            'google_domain': locale['google_domain']
+        }
+
+        if self.shard_days:
+            await self.collect_sharded_results(
+                result_type=result_type,
+                parameters=parameters,
+                locale=locale
+            )
+            return
+
+        if result_type == 'image_result':
+            parameters['tbm'] = 'isch'
+
+        await self._paginate_search(
+            parameters,
+            result_type=result_type,
+            locale=locale
+        )
+
+    def report_locale_yield(self) -> None:
+        '''
+        Prints the number of posts surfaced by each locale and its marginal
+        yield (posts that no other locale found), and saves the report as
+        locale_yield.csv.
+        '''
+        df = self.sql_database.get_locale_yield()
+        if df.empty:
+            print ('No posts found in any locale.')
+            return
+
+        print ('\n> Locale yield (posts / only found by this locale):')
+        for row in df.itertuples(index=False):
+            print (f'  {row.locale}: {row.posts} / {row.marginal_posts}')
+
+        unproductive = df[df['marginal_posts'] == 0]['locale'].tolist()
+        if unproductive:
+            print (f'> Locales with no marginal yield: {", ".join(unproductive)}')
+
+        df.to_csv(
+            f'{self.output}/locale_yield.csv',
+            index=False,
+            encoding='utf-8'
+        )
+
+    async def _process_search_results(self, data: Dict,
+                                      locale: Dict = None) -> None:
         '''
         Processes the response data from SerpAPI, extracting organic results
         and inserting them into the SQL database.
 
         :param data: SerpAPI raw data response
+        :param locale: Optional locale that surfaced the results
         '''
         # get organic search results
         field = 'organic_results'
@@ -203,90 +590,65 @@ class TikTokDataCollector:
             
             # write results in SQL database
             if d:
-                self.sql_database.insert_search_results(d)
+                await self._run_blocking(self.sql_database.insert_search_results, d)
+                if locale is not None:
+                    await self._run_blocking(
+                        self.sql_database.insert_post_locales,
+                        d, locale=locale, result_type=result_type
+                    )
 
-    def collect_image_results(self) -> None:
+    async def collect_image_results(self) -> None:
         '''
         Makes an API call to SerpAPI to collect image thumbnails from Google
         Images.
         '''
-        # Google Images API
-        self.parameters['tbm'] = 'isch'
-
         # collect images
         print (f'\n\nAPI call to Google images')
         result_type = 'image_result'
         try:
-            api_response = self.client.search(self.parameters)
             print ('\n> Searching images...')
-
-            # save raw data
-            self._save_raw_data(
-                self.output,
-                result_type=result_type,
-                data=api_response.data
+            _, _, found_results = await self._paginate_search(
+                {**self.parameters, 'tbm': 'isch'},
+                result_type=result_type
             )
 
-            # found results
-            found_results = False
-
-            # process images results
-            self._process_images_results(api_response.data)
-            if api_response.data.get('images_results', []):
-                found_results = True
-                print (f'> Downloading images results...')
-
-            # get next page
-            next_page = api_response.next_page_url
-            while next_page:
-                next_response = api_response.next_page()
-
-                # save raw data
-                self._save_raw_data(
-                    self.output,
-                    result_type=result_type,
-                    data=next_response.data
-                )
-
-                # process image results
-                self._process_images_results(next_response.data)
-
-                # get next page
-                next_page = next_response.next_page_url
-
-                # update api_response for the next iteration
-                api_response = next_response
-
-                # chill out
-                time.sleep(2)
-
             # api call status
-            print ('> Done')
+            print ('> Done searching images')
 
             if not found_results:
                 print ('No image results found in the response.')
 
         except Exception as e:
             print (f'An error occurred during the API call: {e}')
-        
-        # collect related content
+    
+    async def collect_related_content(self) -> None:
+        '''
+        Collects related content from the links gathered in the image
+        results.
+        '''
         print (f'\n\nCollecting related content')
         if self.related_content_urls:
             self.related_content_urls = self.related_content_urls[
                 :self.related_content_depth
             ]
-            for url in self.related_content_urls:
-                self._collect_related_content(url=url)
+            await asyncio.gather(
+                *[
+                    self._collect_related_content(url=url)
+                    for url in self.related_content_urls
+                ]
+            )
             print ('> Done')
         else:
             print ('No related content found.')
     
-    def _process_images_results(self, data: Dict) -> None:
+    async def _process_images_results(self, data: Dict,
+                                      locale: Dict = None) -> None:
         '''
         Processes the response data from SerpAPI, extracting thumbnails
         and inserting related data into the SQL database.
 
         :param data: SerpAPI raw data response
+        :param locale: Optional locale that surfaced the results
         '''
         # get image results
         field = 'images_results'
@@ -297,17 +659,25 @@ class TikTokDataCollector:
 
             # write results in SQL database
             if d:
-                self.sql_database.insert_images_results(d)
-
-                # download images
+                await self._run_blocking(self.sql_database.insert_images_results, d)
+                if locale is not None:
+                    await self._run_blocking(
+                        self.sql_database.insert_post_locales,
+                        d, locale=locale, result_type=result_type
+                    )
+
+                # download images in the background; the next page is
+                # requested without waiting for them
                 thumbnails = [i['thumbnail'] for i in d]
                 links = [i['link'] for i in d]
-                self.http_session.start_media_download(
-                    urls=thumbnails,
-                    links=links,
-                    output=self.output,
-                    media_type='image'
-                )
+                self._media_tasks.append(asyncio.ensure_future(
+                    self.http_session.download_media(
+                        urls=thumbnails,
+                        links=links,
+                        output=self.output,
+                        media_type='image'
+                    )
+                ))
 
                 # save related content urls
                 key = 'serpapi_related_content_link'
@@ -315,27 +685,29 @@ class TikTokDataCollector:
                     i[key] for i in d if key in i
                 ]
     
-    def _collect_related_content(self, url: str) -> None:
+    async def _collect_related_content(self, url: str) -> None:
         '''
         Collects related content from the given URL.
 
         :param url: The URL to load related content from.
         '''
         result_type = 'related_content'
-        content = self.http_session.load_related_content(
-            url=url,
-            api_key=self.api_key
-        )
+        try:
+            content = await self.serpapi_client.related_content(url)
+        except (httpx.HTTPError, RuntimeError) as e:
+            print (f'An error occurred: {e}')
+            content = {}
 
         # save raw data
-        self._save_raw_data(
+        await self._run_blocking(
+            self._save_raw_data,
             self.output,
             result_type=result_type,
             data=content
         )
 
         # process related content
-        self._process_related_content(content)
+        await self._run_blocking(self._process_related_content, content)
     
     def _process_related_content(self, content: Dict) -> None:
         '''
@@ -389,14 +761,7 @@ class TikTokDataCollector:
         # run the Apify actor
         apify_actor_key = '0FXVyOXXEmdGcV88a'
         try:
-            run = self.apify_client.actor(apify_actor_key).call(
-                run_input=run_input
-            )
-
-            # store data
-            store_data = []
-            for item in self.apify_client.dataset(run['defaultDatasetId']).iterate_items():
-                store_data.append(item)
+            store_data = self._run_apify_actor(apify_actor_key, run_input)
 
             # write raw data
             if store_data:
@@ -410,8 +775,10 @@ class TikTokDataCollector:
                 self._process_apify_profile_data(store_data)
             else:
                 print ('No data found in the Apify run.')
-        except httpx.LocalProtocolError as e:
-            print ('Warning: Apify API token is either missing or invalid. Skipping Apify integration.')
+        except RuntimeError as e:
+            print ('Warning: Apify API tokens are either missing, invalid or exhausted. Skipping Apify integration.')
+        except Exception as e:
+            print (f'An error occurred while running the Apify actor: {e}')
         
     def _process_apify_profile_data(self, data: Dict) -> None:
         '''
@@ -439,31 +806,9 @@ class TikTokDataCollector:
             media_type='image'
         )
         print ('> Thumbnails downloaded')
-        
-        # get videos from Apify collected data
-        if self.should_download_videos:
-            videos = []
-            tiktok_links = []
-            for item in data:
-                try:
-                    videos.append(item['videoMeta']['downloadAddr'])
-                    tiktok_links.append(item['webVideoUrl'])
-                except KeyError:
-                    pass
-
-            # download videos
-            self.http_session.start_media_download(
-                urls=videos,
-                links=tiktok_links,
-                output=self.output,
-                media_type='video'
-            )
-            print ('> Videos downloaded')
 
-            # extract audio from videos
-            print ('> Extracting audio from videos...')
-            self.http_session.extract_audio_from_videos(self.output)
-            print ('> Done')
+        # videos are downloaded afterwards by the DownloadPlanner, from the
+        # direct URLs stored in the database
 
         return
     
@@ -490,14 +835,7 @@ class TikTokDataCollector:
         # run the Apify actor
         apify_actor_key = 'OtzYfK1ndEGdwWFKQ'
         try:
-            run = self.apify_client.actor(apify_actor_key).call(
-                run_input=run_input
-            )
-
-            # store data
-            store_data = []
-            for item in self.apify_client.dataset(run['defaultDatasetId']).iterate_items():
-                store_data.append(item)
+            store_data = self._run_apify_actor(apify_actor_key, run_input)
 
             # write raw data
             if store_data:
@@ -511,8 +849,10 @@ class TikTokDataCollector:
                 self._process_apify_hashtag_data(store_data)
             else:
                 print ('No data found in the Apify run.')
-        except httpx.LocalProtocolError as e:
-            print ('Warning: Apify API token is either missing or invalid. Skipping Apify integration.')
+        except RuntimeError as e:
+            print ('Warning: Apify API tokens are either missing, invalid or exhausted. Skipping Apify integration.')
+        except Exception as e:
+            print (f'An error occurred while running the Apify actor: {e}')
         
     def _process_apify_hashtag_data(self, data: Dict) -> None:
         '''
@@ -540,31 +880,9 @@ class TikTokDataCollector:
             media_type='image'
         )
         print ('> Thumbnails downloaded')
-        
-        # get videos from Apify collected data
-        if self.should_download_videos:
-            videos = []
-            tiktok_links = []
-            for item in data:
-                try:
-                    videos.append(item['videoMeta']['downloadAddr'])
-                    tiktok_links.append(item['webVideoUrl'])
-                except KeyError:
-                    pass
-
-            # download videos
-            self.http_session.start_media_download(
-                urls=videos,
-                links=tiktok_links,
-                output=self.output,
-                media_type='video'
-            )
-            print ('> Videos downloaded')
 
-            # extract audio from videos
-            print ('> Extracting audio from videos...')
-            self.http_session.extract_audio_from_videos(self.output)
-            print ('> Done')
+        # videos are downloaded afterwards by the DownloadPlanner, from the
+        # direct URLs stored in the database
 
         return
     
@@ -594,6 +912,45 @@ class TikTokDataCollector:
         with open(file_path, encoding='utf-8', mode='w') as writer:
             writer.write(obj)
     
+    async def _collect_serpapi_data(self) -> None:
+        '''
+        Runs the SerpAPI stages concurrently over the shared client: search
+        and image results, then related content, while thumbnails download
+        in the background. The client connection is closed when the stages
+        finish or are cancelled.
+        '''
+        try:
+            await self.serpapi_client.refresh_quota()
+
+            if self.locales:
+                await self.collect_locale_results()
+            elif self.shard_days:
+                await asyncio.gather(
+                    self.collect_sharded_results(result_type='search_result'),
+                    self.collect_sharded_results(result_type='image_result')
+                )
+            else:
+                await asyncio.gather(
+                    self.collect_search_results(),
+                    self.collect_image_results()
+                )
+
+            await self.collect_related_content()
+        except RuntimeError as e:
+            # no usable keys left
+            print (f'An error occurred during the API call: {e}')
+        finally:
+            await self.serpapi_client.aclose()
+
+            # thumbnails of the pages found; cancelled on interruptions
+            try:
+                await asyncio.gather(*self._media_tasks)
+            finally:
+                for task in self._media_tasks:
+                    task.cancel()
+
+                self._media_tasks = []
+
     def collect_search_data(self) -> None:
         '''
         Collects both search results and corresponding image thumbnails.
@@ -602,8 +959,7 @@ class TikTokDataCollector:
         print ('-' * 30)
         print ('Starting data collection process...\n')
 
-        self.collect_search_results()
-        self.collect_image_results()
+        self.http_session.run(self._collect_serpapi_data())
 
         if self.run_apify:
             if self.user is not None:
@@ -611,6 +967,24 @@ class TikTokDataCollector:
             elif self.tag is not None:
                 self._apify_tiktok_hashtag_scraper()
 
+        # retry media downloads that failed during the collection
+        self.http_session.run(self.http_session.retry_failed_downloads())
+
+        # optional thumbnail normalization
+        if self.thumbnail_format:
+            self.http_session.normalize_thumbnails(
+                output=self.output,
+                image_format=self.thumbnail_format,
+                max_size=self.thumbnail_max_size,
+                keep_originals=self.keep_original_thumbnails
+            )
+
+        self.report_key_usage()
+        self.http_session.report_media_stats()
+        self.http_session.media_store.report()
+        if self.http_session.concurrency is not None:
+            self.http_session.concurrency.export_timeline(self.output)
+
         print ('\n\nData collection complete.')
         print ('-' * 30)
 
@@ -638,3 +1012,9 @@ class TikTokDataCollector:
         images_results, and Apify tables.
         '''
         return self.sql_database.get_all_collected_videos()
+
+    def close(self) -> None:
+        '''
+        Closes the shared media download session and its event loop.
+        '''
+        self.http_session.close()
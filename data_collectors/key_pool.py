@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import threading
+
+# typing
+from typing import Dict, List
+
+# Key pool class
+class KeyPool:
+    '''
+    KeyPool
+
+    This class spreads requests across several API keys (SerpAPI keys or
+    Apify tokens), tracking requests, errors and remaining quota per key.
+    Keys that run out of quota or keep failing are dropped from the pool.
+    '''
+    def __init__(self, keys: List[str], name: str, max_failures: int = 3) -> None:
+        '''
+        Initializes the KeyPool.
+
+        :param keys: The API keys in the pool. Empty values and duplicates
+            are ignored.
+        :param name: Name of the service, used in messages.
+        :param max_failures: Number of consecutive errors after which a key
+            is dropped.
+        '''
+        self.name = name
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+        self._position = 0
+
+        self._keys = {}
+        for key in keys:
+            if key and key not in self._keys:
+                self._keys[key] = {
+                    'requests': 0,
+                    'errors': 0,
+                    'consecutive_errors': 0,
+                    'remaining': None,
+                    'active': True,
+                    'reason': None
+                }
+
+    def __len__(self) -> int:
+        '''
+        :return: The number of keys still active in the pool.
+        '''
+        return len(self.active_keys)
+
+    @property
+    def active_keys(self) -> List[str]:
+        '''
+        :return: The keys that have not been dropped.
+        '''
+        return [k for k, v in self._keys.items() if v['active']]
+
+    def acquire(self) -> str:
+        '''
+        Selects the next active key in round-robin order.
+
+        :return: An API key.
+        :raises RuntimeError: If every key has been dropped.
+        '''
+        with self._lock:
+            keys = self.active_keys
+            if not keys:
+                raise RuntimeError(f'No usable {self.name} keys left.')
+
+            key = keys[self._position % len(keys)]
+            self._position += 1
+            self._keys[key]['requests'] += 1
+
+            return key
+
+    def report_success(self, key: str) -> None:
+        '''
+        Records a successful request and consumes one unit of the key's
+        known quota.
+
+        :param key: The API key used.
+        '''
+        with self._lock:
+            state = self._keys[key]
+            state['consecutive_errors'] = 0
+            if state['remaining'] is not None:
+                state['remaining'] -= 1
+                if state['remaining'] <= 0:
+                    self._drop(key, 'quota exhausted')
+
+    def report_failure(self, key: str, error: str, drop: bool = False) -> None:
+        '''
+        Records a failed request. The key is dropped when `drop` is True or
+        after `max_failures` consecutive errors.
+
+        :param key: The API key used.
+        :param error: The error message.
+        :param drop: Whether the error makes the key unusable, e.g. an
+            invalid key or an exhausted account.
+        '''
+        with self._lock:
+            state = self._keys[key]
+            state['errors'] += 1
+            state['consecutive_errors'] += 1
+            if drop:
+                self._drop(key, error)
+            elif state['consecutive_errors'] >= self.max_failures:
+                self._drop(key, f'{self.max_failures} consecutive errors: {error}')
+
+    def set_remaining(self, key: str, remaining: float) -> None:
+        '''
+        Updates the remaining quota of a key.
+
+        :param key: The API key.
+        :param remaining: Remaining quota, e.g. searches left.
+        '''
+        with self._lock:
+            self._keys[key]['remaining'] = remaining
+            if remaining <= 0:
+                self._drop(key, 'quota exhausted')
+
+    def _drop(self, key: str, reason: str) -> None:
+        '''
+        Removes a key from the rotation. Must be called holding the lock.
+
+        :param key: The API key.
+        :param reason: Why the key was dropped.
+        '''
+        state = self._keys[key]
+        if state['active']:
+            state['active'] = False
+            state['reason'] = reason
+            print (f'> {self.name} key ...{key[-4:]} dropped: {reason}')
+
+    def summary(self) -> List[Dict]:
+        '''
+        :return: A list with the usage of every key, identified by its last
+            four characters.
+        '''
+        with self._lock:
+            return [
+                {
+                    'key': f'...{key[-4:]}',
+                    'requests': state['requests'],
+                    'errors': state['errors'],
+                    'remaining': state['remaining'],
+                    'status': 'active' if state['active'] else state['reason']
+                } for key, state in self._keys.items()
+            ]
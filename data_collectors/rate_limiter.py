@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import time
+import asyncio
+
+# Rate limiter class
+class RateLimiter:
+    '''
+    RateLimiter
+
+    This class spaces out API calls shared by several concurrent tasks so
+    that, together, they never exceed the given number of requests per
+    second.
+    '''
+    def __init__(self, rate: float) -> None:
+        '''
+        Initializes the RateLimiter.
+
+        :param rate: Maximum number of requests per second. A value of 0 or
+            less disables the limit.
+        '''
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def wait(self) -> None:
+        '''
+        Waits until the next request slot is available. Slots are reserved
+        before sleeping, so concurrent callers are spaced out in order.
+        '''
+        now = time.monotonic()
+        delay = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import httpx
+import asyncio
+import importlib.util
+
+# typing
+from typing import Dict
+
+# local dependencies
+from .key_pool import KeyPool
+from .rate_limiter import RateLimiter
+from .utilities import build_next_page_parameters
+
+# HTTP/2 requires the optional h2 package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Async SerpAPI client class
+class SerpAPIClient:
+    '''
+    SerpAPIClient
+
+    This class makes asynchronous SerpAPI calls (searches, pagination and
+    related content links) over a single pooled HTTP connection shared by
+    every collector stage. Requests rotate across the keys of a KeyPool and
+    go through a shared RateLimiter.
+    '''
+    def __init__(self, key_pool: KeyPool, rate_limiter: RateLimiter,
+                 max_concurrency: int = 4, timeout: float = 60.0) -> None:
+        '''
+        Initializes the SerpAPIClient.
+
+        :param key_pool: KeyPool with the SerpAPI keys.
+        :param rate_limiter: RateLimiter shared by all requests.
+        :param max_concurrency: Maximum number of requests in flight.
+        :param timeout: Default timeout in seconds for each request.
+        '''
+        self.key_pool = key_pool
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        # endpoints
+        self.endpoint = 'https://serpapi.com/search'
+        self.account_endpoint = 'https://serpapi.com/account.json'
+
+        # created on first use, inside the running event loop
+        self._client = None
+        self._slots = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        '''
+        :return: The pooled httpx.AsyncClient, created on first use.
+        '''
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                headers={'accept': 'application/json'},
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60.0
+                )
+            )
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        return self._client
+
+    async def _request(self, url: str, params: Dict = None,
+                       timeout: float = None) -> Dict:
+        '''
+        Makes a GET request with the next key in the pool. Failing keys are
+        reported to the pool and the request is retried with another key.
+
+        :param url: The URL to request.
+        :param params: Optional query parameters.
+        :param timeout: Optional timeout in seconds for this request.
+        :return: The JSON response.
+        :raises RuntimeError: If the pool has no usable keys left.
+        :raises httpx.HTTPStatusError: If the request is invalid.
+        '''
+        client = self.client
+        attempts = max(1, len(self.key_pool))
+        for attempt in range(attempts):
+            key = self.key_pool.acquire()
+            try:
+                await self.rate_limiter.wait()
+                async with self._slots:
+                    response = await client.get(
+                        url,
+                        params={**(params or {}), 'api_key': key},
+                        timeout=timeout or self.timeout
+                    )
+
+                response.raise_for_status()
+                self.key_pool.report_success(key)
+                return response.json()
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                message = e.response.text
+
+                # invalid requests are not the key's fault
+                if status == 400:
+                    raise
+
+                # invalid keys and accounts without searches left
+                drop = status in (401, 403) or \
+                    'run out of searches' in message.lower()
+                self.key_pool.report_failure(key, message, drop=drop)
+
+                if attempt == attempts - 1:
+                    raise
+            except httpx.TransportError as e:
+                self.key_pool.report_failure(key, repr(e))
+
+                if attempt == attempts - 1:
+                    raise
+
+    async def search(self, parameters: Dict, timeout: float = None) -> Dict:
+        '''
+        Makes a SerpAPI search.
+
+        :param parameters: SerpAPI parameters.
+        :param timeout: Optional timeout in seconds for this request.
+        :return: SerpAPI raw data response.
+        '''
+        return await self._request(self.endpoint, parameters, timeout)
+
+    async def next_page(self, data: Dict, timeout: float = None) -> Dict:
+        '''
+        Requests the next page of a SerpAPI response.
+
+        :param data: SerpAPI raw data response of the current page.
+        :param timeout: Optional timeout in seconds for this request.
+        :return: The next page, or an empty dictionary on the last page.
+        '''
+        next_page_url = data.get('serpapi_pagination', {}).get('next')
+        if not next_page_url:
+            return {}
+
+        return await self.search(
+            build_next_page_parameters(next_page_url),
+            timeout=timeout
+        )
+
+    async def related_content(self, url: str, timeout: float = None) -> Dict:
+        '''
+        Loads related content from the given SerpAPI link, following the
+        'see more' link when available.
+
+        :param url: The URL to load related content from.
+        :param timeout: Optional timeout in seconds for this request.
+        :return: A dictionary containing the related content data.
+        '''
+        content = await self._request(url, timeout=timeout)
+        see_more_link = content.get('serpapi_see_more_link')
+        if see_more_link:
+            content = await self._request(see_more_link, timeout=timeout)
+
+        return content
+
+    async def refresh_quota(self) -> None:
+        '''
+        Reads the searches left on every key from the account API and drops
+        keys that are invalid or have no searches left.
+        '''
+        async def refresh(key: str) -> None:
+            try:
+                response = await self.client.get(
+                    self.account_endpoint,
+                    params={'api_key': key},
+                    timeout=10.0
+                )
+                if response.status_code in (401, 403):
+                    self.key_pool.report_failure(
+                        key, 'invalid API key', drop=True
+                    )
+                    return
+
+                response.raise_for_status()
+                remaining = response.json().get('total_searches_left')
+                if remaining is not None:
+                    self.key_pool.set_remaining(key, remaining)
+            except httpx.HTTPError as e:
+                print (f'Could not read the SerpAPI quota for key ...{key[-4:]}: {e}')
+
+        await asyncio.gather(
+            *[refresh(key) for key in self.key_pool.active_keys]
+        )
+
+    async def aclose(self) -> None:
+        '''
+        Closes the pooled connection.
+        '''
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 
+# import submodules
+from datetime import datetime, timedelta
+
+from urllib.parse import urlparse, parse_qsl
+
 # typing
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 '''
 Build search query
@@ -62,6 +67,86 @@ def search_query(args: Dict) -> str:
 
     return f'{q} {advanced_search}'.strip()
 
+'''
+Split date ranges for sharded searches
+
+'''
+def split_date_range(after: str, before: str, days: int) -> List[Tuple[str, str]]:
+    '''
+    Splits the window between `after` and `before` into consecutive
+    sub-ranges of at most `days` days each.
+
+    Google's after: and before: operators exclude the dates they are given,
+    so the window covers the days strictly between `after` and `before`.
+    Sub-ranges are closed day ranges: each covers its first through its
+    last day and the next one starts the following day, so no day is
+    searched twice or skipped. Use date_range_filter to query them.
+
+    :param after: Start date of the window, excluded. Format: YYYY-MM-DD.
+    :param before: End date of the window, excluded. Format: YYYY-MM-DD.
+    :param days: Maximum number of days covered by each sub-range.
+    :return: A list of (first day, last day) tuples with dates as
+        YYYY-MM-DD.
+    :raises ValueError: If the window is empty or `days` is not positive.
+    '''
+    start = datetime.strptime(after, '%Y-%m-%d').date() + timedelta(days=1)
+    end = datetime.strptime(before, '%Y-%m-%d').date() - timedelta(days=1)
+    if end < start:
+        raise ValueError(
+            'The --before date must be at least two days after the --after date.'
+        )
+    
+    if days < 1:
+        raise ValueError('The shard size must be at least one day.')
+
+    ranges = []
+    current = start
+    while current <= end:
+        last = min(current + timedelta(days=days - 1), end)
+        ranges.append((current.isoformat(), last.isoformat()))
+        current = last + timedelta(days=1)
+
+    return ranges
+
+def bisect_date_range(first: str, last: str) -> List[Tuple[str, str]]:
+    '''
+    Splits a closed day range in two halves that do not share a day.
+    Ranges of a single day cannot be refined further.
+
+    :param first: First day of the range. Format: YYYY-MM-DD.
+    :param last: Last day of the range. Format: YYYY-MM-DD.
+    :return: A list with the two halves as (first day, last day) tuples, or
+        an empty list if the range cannot be split.
+    '''
+    start = datetime.strptime(first, '%Y-%m-%d').date()
+    end = datetime.strptime(last, '%Y-%m-%d').date()
+    span = (end - start).days
+    if span < 1:
+        return []
+
+    middle = start + timedelta(days=span // 2)
+    return [
+        (start.isoformat(), middle.isoformat()),
+        ((middle + timedelta(days=1)).isoformat(), end.isoformat())
+    ]
+
+def date_range_filter(first: str, last: str) -> str:
+    '''
+    Builds the after:/before: filter that matches a closed day range. The
+    operators exclude their dates, so the filter uses the day before the
+    first day and the day after the last day.
+
+    :param first: First day of the range. Format: YYYY-MM-DD.
+    :param last: Last day of the range. Format: YYYY-MM-DD.
+    :return: The filter, e.g. 'before:2024-02-01 after:2023-12-31'.
+    '''
+    start = datetime.strptime(first, '%Y-%m-%d').date()
+    end = datetime.strptime(last, '%Y-%m-%d').date()
+    return advanced_search_options({
+        'after': (start - timedelta(days=1)).isoformat(),
+        'before': (end + timedelta(days=1)).isoformat()
+    })
+
 '''
 Select SerpAPI parameters
 
@@ -97,6 +182,66 @@ def select_serpapi_parameters(args: Dict) -> Dict:
 
     return params
 
+'''
+Build SerpAPI pagination parameters
+
+'''
+def build_next_page_parameters(next_page_url: str) -> Dict:
+    '''
+    Extracts the SerpAPI parameters from a pagination link, so the next page
+    can be requested with any key of the pool.
+
+    :param next_page_url: The 'serpapi_pagination.next' link of a response.
+    :return: A dictionary with the parameters of the next page.
+    '''
+    params = dict(parse_qsl(urlparse(next_page_url).query))
+    params.pop('api_key', None)
+
+    return params
+
+'''
+Parse locale fan-out parameters
+
+'''
+def parse_locales(value: str, default_domain: str = 'google.com') -> List[Dict]:
+    '''
+    Parses a comma-separated list of locales in the form
+    gl:hl[:google_domain] into SerpAPI locale parameters.
+
+    :param value: The locales string, e.g. 'us:en,de:de:google.de'.
+    :param default_domain: Google domain used when a locale does not
+        specify one.
+    :return: A list of dictionaries with 'gl', 'hl', 'google_domain' and a
+        'locale' label.
+    :raises ValueError: If a locale is not in the expected format.
+    '''
+    locales = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        parts = [i.strip() for i in item.split(':')]
+        if len(parts) not in (2, 3) or not all(parts):
+            raise ValueError(
+                f"Invalid locale '{item}'. Use this format: "
+                "gl:hl[:google_domain]."
+            )
+
+        gl, hl = parts[0], parts[1]
+        google_domain = parts[2] if len(parts) == 3 else default_domain
+        locale = {
+            'gl': gl,
+            'hl': hl,
+            'google_domain': google_domain,
+            'locale': f'{gl}:{hl}:{google_domain}'
+        }
+
+        if locale not in locales:
+            locales.append(locale)
+
+    return locales
+
 '''
 Extract relevant keys from SerpAPI response
 
@@ -2,6 +2,7 @@
 
 # import modules
 import os
+import time
 import sqlite3
 import pandas as pd
 
@@ -9,7 +10,7 @@ import pandas as pd
 from sqlite3 import Error
 
 # typing
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # Database Manager utilities
 from .utilities import get_items_from_search_results, \
@@ -44,6 +45,24 @@ class SQLDatabaseManager:
         # create required SQL tables for data processing - Apify
         self.create_apify_profile_scraper_table()
         self.create_apify_hashtag_scraper_table()
+
+        # create required SQL tables for locale fan-out
+        self.create_post_locales_table()
+
+        # create required SQL tables for media downloads
+        self.create_media_retry_queue_table()
+        self.create_media_index_table()
+        self.create_media_blobs_table()
+
+        # create required SQL tables for near-duplicate detection
+        self.create_perceptual_hashes_table()
+
+        # create required SQL tables for video downloads
+        self.create_download_jobs_table()
+
+        # create required SQL tables for audio extraction
+        self.create_audio_extractions_table()
+        self.create_media_probes_table()
     
     def create_sql_connection(self) -> Optional[sqlite3.Connection]:
         '''
@@ -52,7 +71,7 @@ class SQLDatabaseManager:
         :return: A SQLite connection object or None if an error occurred
         '''
         try:
-            conn = sqlite3.connect(self.sql_database_file)
+            conn = sqlite3.connect(self.sql_database_file, timeout=30)
             return conn
         except Error as e:
             print (f'An error occurred: {e}')
@@ -499,49 +518,202 @@ class SQLDatabaseManager:
         else:
             print ('Failed to create the database connection.')
     
-    def fetch_all_data(self) -> None:
+    def create_post_locales_table(self) -> None:
         '''
-        Fetches all data from the SQL tables
+        Creates the post_locales table if it does not already exist. Each row
+        records a locale (gl, hl, google_domain) that surfaced a post.
         '''
-        tables = [
-            'query_search_results',
-            'images_results',
-            'related_content',
-            'apify_profile_scraper',
-            'apify_hashtag_scraper'
-        ]
         conn = self.create_sql_connection()
         if conn is not None:
+            cursor = conn.cursor()
+
             try:
-                for t in tables:
-                    q = f'''
-                    SELECT *
-                    FROM {t}
+                cursor.execute(
                     '''
-                    # fetch data
-                    df = pd.read_sql_query(q, conn)
+                    CREATE TABLE IF NOT EXISTS post_locales (
+                        record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        post_id TEXT,
+                        link TEXT,
+                        result_type TEXT,
+                        locale TEXT,
+                        gl TEXT,
+                        hl TEXT,
+                        google_domain TEXT,
+                        UNIQUE (post_id, locale, result_type)
+                    );
+                    '''
+                )
 
-                    # save data
-                    save_path = f'{self.output}/{t}.csv'
-                    df.to_csv(
-                        save_path,
-                        index=False,
-                        encoding='utf-8'
-                    )
-            
+                # commit changes
+                conn.commit()
             except Error as e:
-                print (f'An error occurred while fetching data from {t}: {e}')
+                print (f'An error occurred: {e}')
             finally:
                 conn.close()
-        
-    def get_collected_videos(self, include_user_related_content: bool) -> List:
+        else:
+            print ('Failed to create the database connection.')
+
+    def insert_post_locales(self, data: List, locale: Dict,
+                            result_type: str) -> None:
         '''
-        Retrieves all unique video links from the query_search_results and
-        images_results tables that have not been downloaded yet.
+        Records the locale that surfaced each post in the post_locales table.
 
-        :param include_user_related_content: Whether to include user related
-            content from Google search results in the returned list of links.
-        :return: A list of unique video links.
+        :param data: A list of dictionaries containing a 'link' key.
+        :param locale: A dictionary with 'locale', 'gl', 'hl' and
+            'google_domain' keys.
+        :param result_type: Type of SerpAPI response: 'search_result' or
+            'image_result'.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany(
+                    '''
+                    INSERT OR IGNORE INTO post_locales (
+                        post_id, link, result_type, locale, gl, hl,
+                        google_domain
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''',
+                    [
+                        (
+                            extract_author_post_id(entry['link'])[2],
+                            entry['link'], result_type, locale['locale'],
+                            locale['gl'], locale['hl'],
+                            locale['google_domain']
+                        ) for entry in data if 'link' in entry
+                    ]
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def get_locale_yield(self) -> pd.DataFrame:
+        '''
+        Computes the yield of each locale: the number of posts it surfaced
+        and its marginal yield, i.e. the posts that no other locale found.
+
+        :return: A DataFrame with one row per locale, sorted by marginal
+            yield.
+        '''
+        q = '''
+        SELECT
+            pl.locale,
+            COUNT(DISTINCT pl.post_id) AS posts,
+            COUNT(DISTINCT CASE WHEN c.locales = 1 THEN pl.post_id END)
+                AS marginal_posts
+        FROM post_locales AS pl
+        JOIN (
+            SELECT post_id, COUNT(DISTINCT locale) AS locales
+            FROM post_locales
+            GROUP BY post_id
+        ) AS c ON c.post_id = pl.post_id
+        GROUP BY pl.locale
+        ORDER BY marginal_posts DESC, posts DESC
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            try:
+                return pd.read_sql_query(q, conn)
+            except Error as e:
+                print (f'An error occurred while retrieving data: {e}')
+            finally:
+                conn.close()
+
+        return pd.DataFrame(columns=['locale', 'posts', 'marginal_posts'])
+
+    def create_media_retry_queue_table(self) -> None:
+        '''
+        Creates the media_retry_queue table if it does not already exist.
+        Media downloads that failed after every retry are kept here so they
+        can be retried later in the run or in a later run.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS media_retry_queue (
+                        record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        url TEXT,
+                        link TEXT,
+                        filename TEXT,
+                        media_type TEXT,
+                        attempts INTEGER DEFAULT 0,
+                        last_error TEXT,
+                        status TEXT DEFAULT 'pending',
+                        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (url, filename)
+                    );
+                    '''
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def enqueue_media_retry(self, url: str, link: str, filename: str,
+                            media_type: str, error: str) -> None:
+        '''
+        Adds a failed media download to the media_retry_queue table, or
+        updates its attempts and last error if it is already queued.
+
+        :param url: The URL of the file.
+        :param link: The TikTok link corresponding to the file.
+        :param filename: The path where the file should be saved.
+        :param media_type: The type of media: 'image' or 'video'.
+        :param error: The last error message.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    INSERT INTO media_retry_queue (
+                        url, link, filename, media_type, attempts, last_error
+                    ) VALUES (?, ?, ?, ?, 1, ?)
+                    ON CONFLICT (url, filename) DO UPDATE SET
+                        attempts = attempts + 1,
+                        last_error = excluded.last_error,
+                        status = 'pending',
+                        updated_at = CURRENT_TIMESTAMP
+                    ''',
+                    (url, link, filename, media_type, error)
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def get_media_retries(self, max_attempts: int) -> List[Dict]:
+        '''
+        Retrieves the pending media downloads that have been attempted fewer
+        than `max_attempts` times.
+
+        :param max_attempts: Maximum number of attempts per download.
+        :return: A list of dictionaries with 'url', 'link', 'filename' and
+            'media_type' keys.
         '''
         data = []
         conn = self.create_sql_connection()
@@ -549,58 +721,1019 @@ class SQLDatabaseManager:
             cursor = conn.cursor()
 
             try:
-                # get all video links from database
                 cursor.execute(
                     '''
-                    SELECT link
-                    FROM query_search_results
-                    UNION
-                    SELECT link
-                    FROM images_results
+                    SELECT url, link, filename, media_type
+                    FROM media_retry_queue
+                    WHERE status = 'pending' AND attempts < ?
+                    ''',
+                    (max_attempts,)
+                )
+                data = [
+                    {
+                        'url': url, 'link': link, 'filename': filename,
+                        'media_type': media_type
+                    } for url, link, filename, media_type in cursor.fetchall()
+                ]
+            except Error as e:
+                print (f'An error occurred while retrieving data: {e}')
+            finally:
+                conn.close()
+
+        return data
+
+    def complete_media_retry(self, url: str, filename: str) -> None:
+        '''
+        Marks a queued media download as done.
+
+        :param url: The URL of the file.
+        :param filename: The path where the file was saved.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
                     '''
+                    UPDATE media_retry_queue
+                    SET status = 'done', updated_at = CURRENT_TIMESTAMP
+                    WHERE url = ? AND filename = ?
+                    ''',
+                    (url, filename)
                 )
-            
-                # fetch all links
-                all_links = [i[0] for i in cursor.fetchall()]
 
-                if include_user_related_content:
-                    # get user from link
-                    user = extract_author_post_id(all_links[0])[0]
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while updating data: {e}')
+            finally:
+                conn.close()
 
-                    # get all user related content links from database that match the user's TikTok video pattern
+    def create_media_index_table(self) -> None:
+        '''
+        Creates the media_index table if it does not already exist. It keeps
+        one row per downloaded post and media type, with the validators
+        needed for conditional requests and the SHA-256 of the content.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS media_index (
+                        record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        post_id TEXT,
+                        media_type TEXT,
+                        path TEXT,
+                        url TEXT,
+                        etag TEXT,
+                        last_modified TEXT,
+                        size INTEGER,
+                        sha256 TEXT,
+                        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (post_id, media_type)
+                    );
+                    '''
+                )
+
+                # add the sha256 column to indexes of earlier runs
+                cursor.execute('PRAGMA table_info(media_index)')
+                columns = [i[1] for i in cursor.fetchall()]
+                if 'sha256' not in columns:
                     cursor.execute(
-                        '''
-                        SELECT link
-                        FROM related_content
-                        WHERE link LIKE ?
-                        ''',
-                        (f'https://www.tiktok.com/@{user}/video/%',)
+                        'ALTER TABLE media_index ADD COLUMN sha256 TEXT'
                     )
 
-                    # fetch all links
-                    all_links.extend([i[0] for i in cursor.fetchall()])
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
 
-                    # remove duplicates
-                    all_links = list(set(all_links))
+    def upsert_media_index(self, post_id: str, media_type: str, path: str,
+                           url: str = None, etag: str = None,
+                           last_modified: str = None, size: int = None,
+                           sha256: str = None) -> None:
+        '''
+        Inserts or updates the media_index entry of a post and media type.
+
+        :param post_id: The TikTok post ID.
+        :param media_type: The type of media: 'image' or 'video'.
+        :param path: The path where the file is saved.
+        :param url: The URL the file was downloaded from.
+        :param etag: The ETag response header.
+        :param last_modified: The Last-Modified response header.
+        :param size: The file size in bytes.
+        :param sha256: The SHA-256 of the file content.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
 
-                # get list of already downloaded videos
-                videos_dir = os.path.join(self.output, 'downloaded_videos')
+            try:
+                cursor.execute(
+                    '''
+                    INSERT INTO media_index (
+                        post_id, media_type, path, url, etag, last_modified,
+                        size, sha256
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (post_id, media_type) DO UPDATE SET
+                        path = excluded.path,
+                        url = excluded.url,
+                        etag = excluded.etag,
+                        last_modified = excluded.last_modified,
+                        size = excluded.size,
+                        sha256 = excluded.sha256,
+                        updated_at = CURRENT_TIMESTAMP
+                    ''',
+                    (
+                        post_id, media_type, path, url, etag, last_modified,
+                        size, sha256
+                    )
+                )
 
-                if os.path.exists(videos_dir):
-                    # get existing video ids
-                    existing_ids = {
-                        os.path.splitext(f)[0]
-                        for f in os.listdir(videos_dir)
-                        if os.path.isfile(os.path.join(videos_dir, f))
-                    }
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
 
-                    # filter out links whose IDs are already downloaded
-                    data = [
-                        link for link in all_links
-                        if extract_author_post_id(link)[2] not in existing_ids
-                    ]
-                else:
-                    data = all_links
+    def update_media_index_path(self, post_id: str, media_type: str,
+                                path: str, size: int = None,
+                                sha256: str = None) -> None:
+        '''
+        Updates the path and size of a media_index entry, e.g. after the
+        file was re-encoded, keeping its URL and validators.
+
+        :param post_id: The TikTok post ID.
+        :param media_type: The type of media: 'image' or 'video'.
+        :param path: The new path of the file.
+        :param size: The new file size in bytes.
+        :param sha256: The SHA-256 of the new file content.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    UPDATE media_index
+                    SET path = ?, size = ?, sha256 = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE post_id = ? AND media_type = ?
+                    ''',
+                    (path, size, sha256, post_id, media_type)
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while updating data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def get_media_index(self, media_type: str) -> Dict[str, Dict]:
+        '''
+        Retrieves the media_index entries of a media type.
+
+        :param media_type: The type of media: 'image' or 'video'.
+        :return: A dictionary mapping post IDs to dictionaries with 'path',
+            'url', 'etag', 'last_modified', 'size' and 'sha256' keys.
+        '''
+        data = {}
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    SELECT
+                        post_id, path, url, etag, last_modified, size, sha256
+                    FROM media_index
+                    WHERE media_type = ?
+                    ''',
+                    (media_type,)
+                )
+                data = {
+                    post_id: {
+                        'path': path, 'url': url, 'etag': etag,
+                        'last_modified': last_modified, 'size': size,
+                        'sha256': sha256
+                    } for post_id, path, url, etag, last_modified, size, sha256 in cursor.fetchall()
+                }
+            except Error as e:
+                print (f'An error occurred while retrieving data: {e}')
+            finally:
+                conn.close()
+
+        return data
+
+    def create_media_blobs_table(self) -> None:
+        '''
+        Creates the media_blobs table if it does not already exist. It is the
+        ledger of the content-addressed media store: one row per distinct
+        content, with the number of files that reference it.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS media_blobs (
+                        sha256 TEXT PRIMARY KEY,
+                        size INTEGER,
+                        path TEXT,
+                        refs INTEGER DEFAULT 1,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    );
+                    '''
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def upsert_media_blob(self, sha256: str, size: int, path: str) -> None:
+        '''
+        Records a file stored in the media store, counting one more reference
+        when the content is already known.
+
+        :param sha256: The SHA-256 of the content.
+        :param size: The content size in bytes.
+        :param path: The path of the blob.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    INSERT INTO media_blobs (sha256, size, path)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (sha256) DO UPDATE SET
+                        refs = refs + 1
+                    ''',
+                    (sha256, size, path)
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def delete_media_blobs(self, hashes: List[str]) -> None:
+        '''
+        Removes blobs deleted from the media store from the ledger.
+
+        :param hashes: The SHA-256 of the deleted blobs.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany(
+                    'DELETE FROM media_blobs WHERE sha256 = ?',
+                    [(i,) for i in hashes]
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while deleting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def create_perceptual_hashes_table(self) -> None:
+        '''
+        Creates the perceptual_hashes table if it does not already exist. It
+        keeps the 64-bit dHash and pHash, as hex strings, of every thumbnail
+        and keyframe.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS perceptual_hashes (
+                        path TEXT PRIMARY KEY,
+                        source TEXT,
+                        post_id TEXT,
+                        dhash TEXT,
+                        phash TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    );
+                    '''
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def insert_perceptual_hashes(self, data: List) -> None:
+        '''
+        Inserts perceptual hashes into the perceptual_hashes table.
+
+        :param data: A list of (path, source, post_id, dhash, phash) tuples.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany(
+                    '''
+                    INSERT OR REPLACE INTO perceptual_hashes (
+                        path, source, post_id, dhash, phash
+                    ) VALUES (?, ?, ?, ?, ?)
+                    ''',
+                    data
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def get_perceptual_hashes(self) -> pd.DataFrame:
+        '''
+        Retrieves the perceptual hashes of the images that still exist.
+
+        :return: A DataFrame with the 'path', 'source', 'post_id', 'dhash' and
+            'phash' of every image.
+        '''
+        columns = ['path', 'source', 'post_id', 'dhash', 'phash']
+        q = f'SELECT {", ".join(columns)} FROM perceptual_hashes'
+        conn = self.create_sql_connection()
+        if conn is not None:
+            try:
+                data = pd.read_sql_query(q, conn)
+                return data[data['path'].map(os.path.exists).astype(bool)]
+            except Error as e:
+                print (f'An error occurred while retrieving data: {e}')
+            finally:
+                conn.close()
+
+        return pd.DataFrame(columns=columns)
+
+    def create_download_jobs_table(self) -> None:
+        '''
+        Creates the download_jobs table if it does not already exist. Every
+        video URL to download ('download' jobs) and every downloaded video
+        to extract keyframes from ('keyframes' jobs, keyed by the video path
+        relative to the collection) is a job: 'queued', 'running' (claimed
+        by a worker until its lease expires), 'done' or 'failed'. Workers on
+        several hosts can share the queue through the database file.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS download_jobs (
+                        url TEXT PRIMARY KEY,
+                        job_type TEXT DEFAULT 'download',
+                        status TEXT DEFAULT 'queued',
+                        attempts INTEGER DEFAULT 0,
+                        last_error TEXT,
+                        worker TEXT,
+                        lease_expires_at REAL,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                        started_at TEXT,
+                        finished_at TEXT
+                    );
+                    '''
+                )
+
+                # add the job_type column to queues of earlier runs
+                cursor.execute('PRAGMA table_info(download_jobs)')
+                columns = [i[1] for i in cursor.fetchall()]
+                if 'job_type' not in columns:
+                    cursor.execute(
+                        '''
+                        ALTER TABLE download_jobs
+                        ADD COLUMN job_type TEXT DEFAULT 'download'
+                        '''
+                    )
+
+                cursor.execute(
+                    '''
+                    CREATE INDEX IF NOT EXISTS download_jobs_type_status
+                    ON download_jobs (job_type, status, lease_expires_at);
+                    '''
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def enqueue_download_jobs(self, urls: List[str],
+                              job_type: str = 'download') -> None:
+        '''
+        Adds jobs to the download_jobs table. Jobs already queued keep their
+        status, so finished jobs are not run again.
+
+        :param urls: A list of TikTok video URLs, or of video paths relative
+            to the collection for 'keyframes' jobs.
+        :param job_type: The type of the jobs: 'download' or 'keyframes'.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany(
+                    '''
+                    INSERT OR IGNORE INTO download_jobs (url, job_type)
+                    VALUES (?, ?)
+                    ''',
+                    [(url, job_type) for url in urls]
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def claim_download_jobs(self, worker: str, limit: int,
+                            lease_seconds: float,
+                            job_type: str = 'download') -> List[str]:
+        '''
+        Claims queued jobs, and running jobs whose lease expired, for a
+        worker. The write lock is taken before reading, so concurrent workers
+        never claim the same job.
+
+        :param worker: The identifier of the worker.
+        :param limit: Maximum number of jobs to claim.
+        :param lease_seconds: Time after which jobs not finished by the
+            worker may be claimed by others.
+        :param job_type: The type of the jobs: 'download' or 'keyframes'.
+        :return: The URLs, or video paths, of the claimed jobs.
+        '''
+        urls = []
+        conn = self.create_sql_connection()
+        if conn is not None:
+            conn.isolation_level = None
+            cursor = conn.cursor()
+
+            try:
+                now = time.time()
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute(
+                    '''
+                    SELECT url
+                    FROM download_jobs
+                    WHERE job_type = ? AND (
+                        status = 'queued'
+                        OR (status = 'running' AND lease_expires_at < ?)
+                    )
+                    ORDER BY created_at, rowid
+                    LIMIT ?
+                    ''',
+                    (job_type, now, limit)
+                )
+                urls = [i[0] for i in cursor.fetchall()]
+                cursor.executemany(
+                    '''
+                    UPDATE download_jobs
+                    SET status = 'running', worker = ?, lease_expires_at = ?,
+                        attempts = attempts + 1,
+                        started_at = CURRENT_TIMESTAMP
+                    WHERE url = ?
+                    ''',
+                    [(worker, now + lease_seconds, url) for url in urls]
+                )
+
+                # commit changes
+                cursor.execute('COMMIT')
+            except Error as e:
+                print (f'An error occurred while claiming jobs: {e}')
+                if conn.in_transaction:
+                    cursor.execute('ROLLBACK')
+                urls = []
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+        return urls
+
+    def finish_download_job(self, url: str, worker: str,
+                            error: str = None) -> None:
+        '''
+        Marks a job claimed by a worker as done, or as failed with its
+        error.
+
+        :param url: The URL of the job.
+        :param worker: The identifier of the worker that claimed the job.
+        :param error: The error message if the download failed.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    UPDATE download_jobs
+                    SET status = ?, last_error = ?, lease_expires_at = NULL,
+                        finished_at = CURRENT_TIMESTAMP
+                    WHERE url = ? AND worker = ? AND status = 'running'
+                    ''',
+                    ('failed' if error else 'done', error, url, worker)
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while updating data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def release_download_jobs(self, worker: str) -> None:
+        '''
+        Returns the running jobs of a worker to the queue, e.g. when it is
+        interrupted.
+
+        :param worker: The identifier of the worker.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    UPDATE download_jobs
+                    SET status = 'queued', worker = NULL,
+                        lease_expires_at = NULL
+                    WHERE worker = ? AND status = 'running'
+                    ''',
+                    (worker,)
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while updating data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def requeue_failed_download_jobs(self, job_type: str = 'download') -> int:
+        '''
+        Returns the failed jobs to the queue.
+
+        :param job_type: The type of the jobs: 'download' or 'keyframes'.
+        :return: The number of jobs queued again.
+        '''
+        count = 0
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    UPDATE download_jobs
+                    SET status = 'queued', worker = NULL
+                    WHERE job_type = ? AND status = 'failed'
+                    ''',
+                    (job_type,)
+                )
+                count = cursor.rowcount
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while updating data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+        return count
+
+    def requeue_done_download_jobs(self, urls: List[str],
+                                   job_type: str = 'download') -> int:
+        '''
+        Returns finished jobs to the queue, e.g. to post-process videos
+        again with other settings.
+
+        :param urls: The URLs or video paths of the jobs.
+        :param job_type: The type of the jobs: 'download' or 'keyframes'.
+        :return: The number of jobs queued again.
+        '''
+        count = 0
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany(
+                    '''
+                    UPDATE download_jobs
+                    SET status = 'queued', worker = NULL
+                    WHERE url = ? AND job_type = ? AND status = 'done'
+                    ''',
+                    [(i, job_type) for i in urls]
+                )
+                count = cursor.rowcount
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while updating data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+        return count
+
+    def get_download_job_counts(self, job_type: str = 'download') -> Dict[str, int]:
+        '''
+        Counts the jobs of the download_jobs table by status.
+
+        :param job_type: The type of the jobs: 'download' or 'keyframes'.
+        :return: A dictionary mapping every status to its number of jobs.
+        '''
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    SELECT status, COUNT(*)
+                    FROM download_jobs
+                    WHERE job_type = ?
+                    GROUP BY status
+                    ''',
+                    (job_type,)
+                )
+                counts.update(dict(cursor.fetchall()))
+            except Error as e:
+                print (f'An error occurred while retrieving data: {e}')
+            finally:
+                conn.close()
+
+        return counts
+
+    def create_audio_extractions_table(self) -> None:
+        '''
+        Creates the audio_extractions table if it does not already exist. It
+        records the ffmpeg time, size and error of every audio extracted from
+        a downloaded video.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS audio_extractions (
+                        audio TEXT PRIMARY KEY,
+                        video TEXT,
+                        post_id TEXT,
+                        mode TEXT,
+                        seconds REAL,
+                        size INTEGER,
+                        error TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    );
+                    '''
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def insert_audio_extractions(self, data: List) -> None:
+        '''
+        Inserts audio extraction timings into the audio_extractions table.
+
+        :param data: A list of (audio, video, post_id, mode, seconds, size,
+            error) tuples.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany(
+                    '''
+                    INSERT OR REPLACE INTO audio_extractions (
+                        audio, video, post_id, mode, seconds, size, error
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''',
+                    data
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def create_media_probes_table(self) -> None:
+        '''
+        Creates the media_probes table if it does not already exist. It keeps
+        the stream details of every post-processed video, read from the same
+        ffmpeg run that writes its audio and keyframes.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS media_probes (
+                        video TEXT PRIMARY KEY,
+                        post_id TEXT,
+                        duration REAL,
+                        bitrate INTEGER,
+                        video_codec TEXT,
+                        width INTEGER,
+                        height INTEGER,
+                        fps REAL,
+                        audio_codec TEXT,
+                        sample_rate INTEGER,
+                        channels TEXT,
+                        keyframes INTEGER,
+                        seconds REAL,
+                        frame_settings TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    );
+                    '''
+                )
+
+                # add the frame_settings column to probes of earlier runs
+                cursor.execute('PRAGMA table_info(media_probes)')
+                columns = [i[1] for i in cursor.fetchall()]
+                if 'frame_settings' not in columns:
+                    cursor.execute(
+                        'ALTER TABLE media_probes ADD COLUMN frame_settings TEXT'
+                    )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def insert_media_probes(self, data: List) -> None:
+        '''
+        Inserts video stream details into the media_probes table. The frame
+        count and settings of a video are kept when no frames were written.
+
+        :param data: A list of (video, post_id, duration, bitrate,
+            video_codec, width, height, fps, audio_codec, sample_rate,
+            channels, keyframes, seconds, frame_settings) tuples;
+            frame_settings is None when no frames were written.
+        '''
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany(
+                    '''
+                    INSERT INTO media_probes (
+                        video, post_id, duration, bitrate, video_codec, width,
+                        height, fps, audio_codec, sample_rate, channels,
+                        keyframes, seconds, frame_settings
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (video) DO UPDATE SET
+                        post_id = excluded.post_id,
+                        duration = excluded.duration,
+                        bitrate = excluded.bitrate,
+                        video_codec = excluded.video_codec,
+                        width = excluded.width,
+                        height = excluded.height,
+                        fps = excluded.fps,
+                        audio_codec = excluded.audio_codec,
+                        sample_rate = excluded.sample_rate,
+                        channels = excluded.channels,
+                        keyframes = CASE
+                            WHEN excluded.frame_settings IS NULL
+                            THEN media_probes.keyframes
+                            ELSE excluded.keyframes
+                        END,
+                        seconds = excluded.seconds,
+                        frame_settings = COALESCE(
+                            excluded.frame_settings, media_probes.frame_settings
+                        )
+                    ''',
+                    data
+                )
+
+                # commit changes
+                conn.commit()
+            except Error as e:
+                print (f'An error occurred while inserting data: {e}')
+            finally:
+                conn.close()
+        else:
+            print ('Failed to create the database connection.')
+
+    def get_frame_settings(self) -> Dict[str, Optional[str]]:
+        '''
+        Retrieves the frame settings each post-processed video was sampled
+        with.
+
+        :return: A dictionary mapping post IDs to their frame settings, or
+            None for videos of runs that did not record them.
+        '''
+        data = {}
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(
+                    '''
+                    SELECT post_id, frame_settings
+                    FROM media_probes
+                    '''
+                )
+                data = dict(cursor.fetchall())
+            except Error as e:
+                print (f'An error occurred while retrieving data: {e}')
+            finally:
+                conn.close()
+
+        return data
+
+    def fetch_all_data(self) -> None:
+        '''
+        Fetches all data from the SQL tables
+        '''
+        tables = [
+            'query_search_results',
+            'images_results',
+            'related_content',
+            'apify_profile_scraper',
+            'apify_hashtag_scraper',
+            'post_locales'
+        ]
+        conn = self.create_sql_connection()
+        if conn is not None:
+            try:
+                for t in tables:
+                    q = f'''
+                    SELECT *
+                    FROM {t}
+                    '''
+                    # fetch data
+                    df = pd.read_sql_query(q, conn)
+
+                    # save data
+                    save_path = f'{self.output}/{t}.csv'
+                    df.to_csv(
+                        save_path,
+                        index=False,
+                        encoding='utf-8'
+                    )
+            
+            except Error as e:
+                print (f'An error occurred while fetching data from {t}: {e}')
+            finally:
+                conn.close()
+        
+    def get_collected_videos(self, include_user_related_content: bool) -> List:
+        '''
+        Retrieves all unique video links from the query_search_results and
+        images_results tables that have not been downloaded yet.
+
+        :param include_user_related_content: Whether to include user related
+            content from Google search results in the returned list of links.
+        :return: A list of unique video links.
+        '''
+        data = []
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                # get all video links from database
+                cursor.execute(
+                    '''
+                    SELECT link
+                    FROM query_search_results
+                    UNION
+                    SELECT link
+                    FROM images_results
+                    '''
+                )
+            
+                # fetch all links
+                all_links = [i[0] for i in cursor.fetchall()]
+
+                if include_user_related_content:
+                    # get user from link
+                    user = extract_author_post_id(all_links[0])[0]
+
+                    # get all user related content links from database that match the user's TikTok video pattern
+                    cursor.execute(
+                        '''
+                        SELECT link
+                        FROM related_content
+                        WHERE link LIKE ?
+                        ''',
+                        (f'https://www.tiktok.com/@{user}/video/%',)
+                    )
+
+                    # fetch all links
+                    all_links.extend([i[0] for i in cursor.fetchall()])
+
+                    # remove duplicates
+                    all_links = list(set(all_links))
+
+                # get list of already downloaded videos
+                videos_dir = os.path.join(self.output, 'downloaded_videos')
+
+                if os.path.exists(videos_dir):
+                    # get existing video ids
+                    existing_ids = {
+                        os.path.splitext(f)[0]
+                        for f in os.listdir(videos_dir)
+                        if os.path.isfile(os.path.join(videos_dir, f))
+                    }
+
+                    # filter out links whose IDs are already downloaded
+                    data = [
+                        link for link in all_links
+                        if extract_author_post_id(link)[2] not in existing_ids
+                    ]
+                else:
+                    data = all_links
             except Error as e:
                 print (f'An error occurred while retrieving data: {e}')
             finally:
@@ -608,6 +1741,74 @@ class SQLDatabaseManager:
         
         return data
 
+    def get_video_sources(self, user: str = None) -> List[Dict]:
+        '''
+        Retrieves the download sources of every collected video: the TikTok
+        page URL, and the direct video URL of posts collected with Apify.
+
+        :param user: Optional username whose videos found in related content
+            are included.
+        :return: A list of dictionaries with 'post_id', 'link' and
+            'direct_url' keys. A post may appear in several entries.
+        '''
+        data = []
+        conn = self.create_sql_connection()
+        if conn is not None:
+            cursor = conn.cursor()
+
+            try:
+                # Apify posts: page and direct video URLs
+                cursor.execute(
+                    '''
+                    SELECT id, web_video_url, video_download_url
+                    FROM apify_profile_scraper
+                    UNION
+                    SELECT id, web_video_url, video_download_url
+                    FROM apify_hashtag_scraper
+                    '''
+                )
+                data = [
+                    {'post_id': post_id, 'link': link, 'direct_url': direct_url}
+                    for post_id, link, direct_url in cursor.fetchall()
+                ]
+
+                # SerpAPI posts: page URLs
+                cursor.execute(
+                    '''
+                    SELECT link
+                    FROM query_search_results
+                    UNION
+                    SELECT link
+                    FROM images_results
+                    '''
+                )
+                links = [i[0] for i in cursor.fetchall()]
+
+                if user is not None:
+                    cursor.execute(
+                        '''
+                        SELECT link
+                        FROM related_content
+                        WHERE link LIKE ?
+                        ''',
+                        (f'https://www.tiktok.com/@{user}/video/%',)
+                    )
+                    links.extend([i[0] for i in cursor.fetchall()])
+
+                data.extend([
+                    {
+                        'post_id': extract_author_post_id(link)[2],
+                        'link': link,
+                        'direct_url': None
+                    } for link in links if link
+                ])
+            except Error as e:
+                print (f'An error occurred while retrieving data: {e}')
+            finally:
+                conn.close()
+
+        return data
+
     def get_all_collected_videos(self) -> List:
         '''
         Retrieves all unique video links from the query_search_results,
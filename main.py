@@ -3,6 +3,8 @@
 # import modules
 import time
 import os
+import sys
+import socket
 
 # import argparse
 from argparse import (
@@ -15,9 +17,16 @@ from utils import get_config_attrs, verify_date_argument, \
 
 # TikTok data collector
 from data_collectors import TikTokDataCollector
+from data_collectors.utilities import split_date_range
+
+# SQLManager
+from databases import SQLDatabaseManager
 
 # video downloader
-from media_handlers import VideoDownloader, RequestSession
+from media_handlers import VideoDownloader, RequestSession, \
+    PerceptualHashIndex, AIMDController, DownloadPlanner
+from media_handlers.utilities import DOWNLOAD_PROFILES, KEYFRAME_ENGINES, \
+    build_frame_options
 
 def launch_streamlit_app():
     '''Launch the Streamlit web interface'''
@@ -59,7 +68,224 @@ def launch_streamlit_app():
         print ('\n\n' + ' '.join(log_text.split()).strip())
         sys.exit(0)
 
+def _bandwidth_limit(limit: float) -> float:
+    '''
+    Converts a bandwidth limit from MB/s to bytes per second.
+
+    :param limit: The limit in MB/s, or None.
+    :return: The limit in bytes per second, or None.
+    '''
+    return limit * 1024 ** 2 if limit else None
+
+def _frame_options(args: dict) -> dict:
+    '''
+    Builds the frame sampling settings of the keyframe stage from the
+    command line arguments.
+
+    :param args: The parsed command line arguments.
+    :return: The settings built by build_frame_options.
+    '''
+    return build_frame_options(
+        sampling=args['frame_sampling'],
+        engine=args['keyframe_engine'],
+        scene_threshold=args['scene_threshold'],
+        interval=args['frame_interval'],
+        frames=args['frames_per_video'],
+        max_frames=args['max_frames'],
+        image_format=args['frame_format'],
+        quality=args['frame_quality'],
+        max_width=args['frame_max_width']
+    )
+
+def run_worker(argv: list) -> None:
+    '''
+    Runs a download worker: claims the download and keyframe jobs queued in
+    the run database of a collection and runs them until the queue is
+    empty. Workers on several hosts or containers can share one collection
+    when its output directory, and so its database, is on shared storage.
+
+    :param argv: The command line arguments after 'worker'.
+    '''
+    parser = ArgumentParser(
+        prog='tikspyder worker',
+        description=(
+            'Run the queued video downloads and keyframe extractions of a '
+            'collection.'
+        )
+    )
+    parser.add_argument(
+        '-o', '--output', type=str, required=True,
+        help='Output directory of the collection, shared with other workers.'
+    )
+    parser.add_argument(
+        '-w', '--max-workers', type=int, default=5,
+        help=(
+            'Maximum number of simultaneous downloads, on threads or '
+            'processes, and of ffmpeg processes of the keyframe stage. '
+            'Default: 5'
+        )
+    )
+    parser.add_argument(
+        '--download-backend', type=str, default='thread',
+        choices=['thread', 'process'],
+        help='Run yt-dlp downloads on a pool of threads or processes.'
+    )
+    parser.add_argument(
+        '--use-tor', action='store_true',
+        help='Use Tor for downloading TikTok videos.'
+    )
+    parser.add_argument(
+        '--tor-socks-ports', type=str, default='9050',
+        help='Comma-separated Tor SocksPorts. Default: 9050'
+    )
+    parser.add_argument(
+        '--derive-audio', action='store_true',
+        help='Extract the audio locally from the downloaded video.'
+    )
+    parser.add_argument(
+        '--audio-format', type=str, default='m4a', choices=['m4a', 'mp3'],
+        help='Format of derived audio. Default: m4a'
+    )
+    parser.add_argument(
+        '--download-profile', type=str, default='archival',
+        choices=list(DOWNLOAD_PROFILES),
+        help='Formats downloaded by yt-dlp. Default: archival'
+    )
+    parser.add_argument(
+        '--max-height', type=int, default=480,
+        help='Maximum video height of the lightweight profile. Default: 480'
+    )
+    parser.add_argument(
+        '--bandwidth-limit', type=float, default=None,
+        help='Cap on the combined download rate of yt-dlp, in MB/s.'
+    )
+    parser.add_argument(
+        '--keyframe-engine', type=str, default='skip',
+        choices=list(KEYFRAME_ENGINES),
+        help='Keyframe extraction engine. Default: skip'
+    )
+    parser.add_argument(
+        '--frame-sampling', type=str, default='keyframes',
+        choices=['keyframes', 'scene', 'interval', 'uniform'],
+        help=(
+            'Frames saved per video. Frames of other settings are replaced. '
+            'Default: keyframes'
+        )
+    )
+    parser.add_argument(
+        '--scene-threshold', type=float, default=0.3,
+        help='Scene-change score of --frame-sampling scene. Default: 0.3'
+    )
+    parser.add_argument(
+        '--frame-interval', type=float, default=2.0,
+        help='Seconds between frames of --frame-sampling interval. Default: 2'
+    )
+    parser.add_argument(
+        '--frames-per-video', type=int, default=10,
+        help='Frames per video of --frame-sampling uniform. Default: 10'
+    )
+    parser.add_argument(
+        '--max-frames', type=int, default=None,
+        help='Maximum number of frames saved per video, spread over it.'
+    )
+    parser.add_argument(
+        '--frame-format', type=str, default='jpg', choices=['jpg', 'webp'],
+        help='Image format of saved frames. Default: jpg'
+    )
+    parser.add_argument(
+        '--frame-quality', type=int, default=None,
+        help='Image quality of saved frames, from 1 to 100.'
+    )
+    parser.add_argument(
+        '--frame-max-width', type=int, default=None,
+        help='Maximum width in pixels of saved frames.'
+    )
+    parser.add_argument(
+        '--extract-audio', type=str, default=None,
+        choices=['mp3', 'copy', 'wav'],
+        help='Also write the audio of post-processed videos in this mode.'
+    )
+    parser.add_argument(
+        '--wav-sample-rate', type=int, default=16000,
+        help='Sample rate in Hz of --extract-audio wav. Default: 16000'
+    )
+    parser.add_argument(
+        '--idle-timeout', type=float, default=0,
+        help=(
+            'Seconds to keep polling an empty queue for new jobs before '
+            'exiting. Default: 0'
+        )
+    )
+    parser.add_argument(
+        '--poll-interval', type=float, default=10,
+        help='Seconds between polls of an empty queue. Default: 10'
+    )
+    args = vars(parser.parse_args(argv))
+
+    output = args['output'].rstrip('/')
+    if not os.path.exists(f'{output}/database.sql'):
+        raise ValueError(f'No collection database found in {output}.')
+
+    log_text = f'''
+    > Starting worker at: {time.ctime()}
+
+    '''
+    print ('\n\n' + ' '.join(log_text.split()).strip())
+
+    sql_database = SQLDatabaseManager(output, False)
+    downloader = VideoDownloader(
+        output=output,
+        use_tor=args['use_tor'],
+        sql_database=sql_database,
+        derive_audio=args['derive_audio'],
+        audio_format=args['audio_format'],
+        tor_socks_ports=[int(i) for i in args['tor_socks_ports'].split(',')],
+        download_profile=args['download_profile'],
+        max_height=args['max_height'],
+        bandwidth_limit=_bandwidth_limit(args['bandwidth_limit'])
+    )
+    downloader.check_tor()
+
+    request_session = RequestSession(sql_database=sql_database)
+    idle_since = time.monotonic()
+    try:
+        while True:
+            count = downloader.download_jobs(
+                max_workers=args['max_workers'],
+                backend=args['download_backend']
+            )
+            count += request_session.run_keyframe_jobs(
+                output=output,
+                max_concurrent=args['max_workers'],
+                worker=downloader.job_worker,
+                audio_mode=args['extract_audio'],
+                sample_rate=args['wav_sample_rate'],
+                frame_options=_frame_options(args)
+            )
+            if count:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= args['idle_timeout']:
+                break
+            else:
+                time.sleep(args['poll_interval'])
+    finally:
+        request_session.close()
+
+    downloader.report_download_stats()
+    downloader.report_download_jobs()
+
+    log_text = f'''
+    > Ending worker at: {time.ctime()}
+
+    '''
+    print ('\n\n' + ' '.join(log_text.split()).strip())
+
 def main():
+    # distributed download worker
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        run_worker(sys.argv[2:])
+        return
+
     # Get current working directory (where command was executed)
     execution_dir = os.getcwd()
     
@@ -141,6 +367,18 @@ def main():
         help='Defines the Google domain to use. It defaults to google.com.'
     )
 
+    ''' locales > fan-out across gl/hl/google_domain combinations '''
+    serpapi_arguments.add_argument(
+        '--locales',
+        type=str,
+        required=False,
+        metavar='',
+        help=(
+            "Comma-separated list of locales to search concurrently, in the "
+            "form gl:hl[:google_domain]. Example: us:en,de:de:google.de"
+        )
+    )
+
     ''' gl > country '''
     serpapi_arguments.add_argument(
         '--gl',
@@ -204,6 +442,39 @@ def main():
         help='Depth of iterations to follow related content links.'
     )
 
+    ''' search workers > concurrent SerpAPI searches '''
+    serpapi_arguments.add_argument(
+        '--search-workers',
+        type=int,
+        required=False,
+        default=4,
+        metavar='',
+        help='Maximum number of concurrent SerpAPI searches. Default: 4'
+    )
+
+    ''' rate limit > SerpAPI requests per second '''
+    serpapi_arguments.add_argument(
+        '--rate-limit',
+        type=float,
+        required=False,
+        default=1.0,
+        metavar='',
+        help=(
+            "Maximum number of SerpAPI requests per second shared by all "
+            "concurrent searches. Default: 1.0"
+        )
+    )
+
+    ''' request timeout > SerpAPI request timeout '''
+    serpapi_arguments.add_argument(
+        '--request-timeout',
+        type=float,
+        required=False,
+        default=60.0,
+        metavar='',
+        help='Timeout in seconds for each SerpAPI request. Default: 60'
+    )
+
     # Google advanced search arguments
     google_advanced_search_arguments = parser.add_argument_group(
         'Google advanced search options'
@@ -233,6 +504,32 @@ def main():
         )
     )
 
+    ''' split the date window into shards '''
+    google_advanced_search_arguments.add_argument(
+        '--shard-days',
+        type=int,
+        required=False,
+        metavar='',
+        help=(
+            "Split the --after/--before window into sub-ranges of the given "
+            "number of days and search them concurrently. Requires --after "
+            "and --before."
+        )
+    )
+
+    ''' page limit per shard '''
+    google_advanced_search_arguments.add_argument(
+        '--shard-max-pages',
+        type=int,
+        required=False,
+        default=3,
+        metavar='',
+        help=(
+            "Number of result pages after which a shard is considered "
+            "saturated and split in two. Default: 3"
+        )
+    )
+
     # Apify optional arguments
     apify_arguments = parser.add_argument_group(
         'Optional Apify arguments'
@@ -292,6 +589,19 @@ def main():
         help='Specify whether to use Tor for downloading TikTok videos.'
     )
 
+    ''' Tor SOCKS ports '''
+    optional_arguments.add_argument(
+        '--tor-socks-ports',
+        type=str,
+        required=False,
+        default='9050',
+        metavar='',
+        help=(
+            "Comma-separated Tor SocksPorts download workers are spread over, "
+            "each worker on its own circuit. Default: 9050"
+        )
+    )
+
     ''' download TikTok results '''
     optional_arguments.add_argument(
         '-d',
@@ -301,7 +611,56 @@ def main():
         help='Specify whether to download TikTok videos from SerpAPI and Apify.'
     )
 
-    ''' max workers > maximum number of threads '''
+    ''' derive audio from downloaded videos '''
+    optional_arguments.add_argument(
+        '--derive-audio',
+        action='store_true',
+        required=False,
+        help=(
+            "Download each video once and extract its audio locally with "
+            "ffmpeg instead of downloading the audio separately."
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--audio-format',
+        type=str,
+        required=False,
+        default='m4a',
+        choices=['m4a', 'mp3'],
+        metavar='',
+        help=(
+            "Format of audio derived with --derive-audio: m4a (stream copy, "
+            "no re-encoding) or mp3. Default: m4a"
+        )
+    )
+
+    ''' audio extraction stage '''
+    optional_arguments.add_argument(
+        '--extract-audio',
+        type=str,
+        required=False,
+        choices=['mp3', 'copy', 'wav'],
+        metavar='',
+        help=(
+            "Extract the audio of every downloaded video on all CPU cores, "
+            "in the same ffmpeg pass as its keyframes: mp3 (re-encoded), "
+            "copy (stream copy to m4a, no re-encoding) or wav (mono PCM at "
+            "--wav-sample-rate, for analysis). Videos whose audio already "
+            "exists are skipped."
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--wav-sample-rate',
+        type=int,
+        required=False,
+        default=16000,
+        metavar='',
+        help="Sample rate in Hz of --extract-audio wav. Default: 16000"
+    )
+
+    ''' max workers > maximum number of download and ffmpeg workers '''
     optional_arguments.add_argument(
         '-w',
         '--max-workers',
@@ -309,8 +668,331 @@ def main():
         required=False,
         metavar='',
         help=(
-            "Specify the maximum number of threads to use for downloading "
-            "TikTok videos and extracting keyframes."
+            "Specify the maximum number of simultaneous video downloads, on "
+            "threads or processes (see --download-backend; default: 5), and "
+            "of ffmpeg processes of the keyframe stage, one per video "
+            "(default: the number of CPUs)."
+        )
+    )
+
+    ''' keyframe extraction engine '''
+    optional_arguments.add_argument(
+        '--keyframe-engine',
+        type=str,
+        required=False,
+        default='skip',
+        choices=list(KEYFRAME_ENGINES),
+        metavar='',
+        help=(
+            "Keyframe extraction: skip (the decoder skips non-key frames, "
+            "only keyframes are decoded) or select (every frame is decoded "
+            "and I-frames are filtered). Default: skip"
+        )
+    )
+
+    ''' frame sampling of the keyframe stage '''
+    optional_arguments.add_argument(
+        '--frame-sampling',
+        type=str,
+        required=False,
+        default='keyframes',
+        choices=['keyframes', 'scene', 'interval', 'uniform'],
+        metavar='',
+        help=(
+            "Frames saved per video: keyframes (every keyframe), scene "
+            "(the first frame and every scene change), interval (one frame "
+            "every --frame-interval seconds) or uniform (--frames-per-video "
+            "frames spread over the video). Frames saved by earlier runs "
+            "with other frame settings are replaced. Default: keyframes"
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--scene-threshold',
+        type=float,
+        required=False,
+        default=0.3,
+        metavar='',
+        help=(
+            "Scene-change score, from 0 to 1, of --frame-sampling scene. "
+            "Default: 0.3"
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--frame-interval',
+        type=float,
+        required=False,
+        default=2.0,
+        metavar='',
+        help="Seconds between frames of --frame-sampling interval. Default: 2"
+    )
+
+    optional_arguments.add_argument(
+        '--frames-per-video',
+        type=int,
+        required=False,
+        default=10,
+        metavar='',
+        help="Frames per video of --frame-sampling uniform. Default: 10"
+    )
+
+    optional_arguments.add_argument(
+        '--max-frames',
+        type=int,
+        required=False,
+        metavar='',
+        help=(
+            "Maximum number of frames saved per video, in any mode, spread "
+            "over the whole video."
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--frame-format',
+        type=str,
+        required=False,
+        default='jpg',
+        choices=['jpg', 'webp'],
+        metavar='',
+        help="Image format of saved frames: jpg or webp. Default: jpg"
+    )
+
+    optional_arguments.add_argument(
+        '--frame-quality',
+        type=int,
+        required=False,
+        metavar='',
+        help=(
+            "Image quality of saved frames, from 1 to 100. Default: highest "
+            "for jpg, 80 for webp"
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--frame-max-width',
+        type=int,
+        required=False,
+        metavar='',
+        help="Maximum width in pixels of saved frames; larger are downscaled."
+    )
+
+    ''' yt-dlp execution backend '''
+    optional_arguments.add_argument(
+        '--download-backend',
+        type=str,
+        required=False,
+        default='thread',
+        choices=['thread', 'process'],
+        metavar='',
+        help=(
+            "Run yt-dlp downloads on a pool of threads or processes. "
+            "Processes scale better for large batches. Default: thread"
+        )
+    )
+
+    ''' download profile '''
+    optional_arguments.add_argument(
+        '--download-profile',
+        type=str,
+        required=False,
+        default='archival',
+        choices=list(DOWNLOAD_PROFILES),
+        metavar='',
+        help=(
+            "Formats downloaded by yt-dlp: archival (best quality) or "
+            "lightweight (up to --max-height, single-file formats preferred "
+            "so no merge is needed). Default: archival"
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--max-height',
+        type=int,
+        required=False,
+        default=480,
+        metavar='',
+        help=(
+            "Maximum video height of the lightweight download profile. "
+            "Default: 480"
+        )
+    )
+
+    ''' bandwidth cap '''
+    optional_arguments.add_argument(
+        '--bandwidth-limit',
+        type=float,
+        required=False,
+        metavar='',
+        help=(
+            "Cap on the combined download rate of yt-dlp, in MB/s, shared "
+            "by all download workers."
+        )
+    )
+
+    ''' retry failed download jobs '''
+    optional_arguments.add_argument(
+        '--retry-failed',
+        action='store_true',
+        required=False,
+        help=(
+            "Retry the video downloads that failed in previous runs with the "
+            "same output directory."
+        )
+    )
+
+    ''' adaptive concurrency '''
+    optional_arguments.add_argument(
+        '--adaptive-concurrency',
+        action='store_true',
+        required=False,
+        help=(
+            "Adapt the number of simultaneous downloads to errors and "
+            "latency, between --min-workers and --max-workers for videos and "
+            "up to --media-concurrency for thumbnails. The limits over time "
+            "are saved to concurrency_timeline.csv."
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--min-workers',
+        type=int,
+        required=False,
+        default=1,
+        metavar='',
+        help=(
+            "Minimum number of simultaneous downloads with "
+            "--adaptive-concurrency. Default: 1"
+        )
+    )
+
+    ''' media download concurrency '''
+    optional_arguments.add_argument(
+        '--media-concurrency',
+        type=int,
+        required=False,
+        default=32,
+        metavar='',
+        help=(
+            "Maximum number of simultaneous thumbnail and cover downloads. "
+            "Default: 32"
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--media-per-host',
+        type=int,
+        required=False,
+        default=8,
+        metavar='',
+        help=(
+            "Maximum number of simultaneous media downloads from the same "
+            "host. Default: 8"
+        )
+    )
+
+    ''' refresh media already downloaded '''
+    optional_arguments.add_argument(
+        '--refresh-media',
+        action='store_true',
+        required=False,
+        help=(
+            "Revalidate thumbnails and videos already downloaded with "
+            "conditional requests instead of skipping them."
+        )
+    )
+
+    ''' media download retries '''
+    optional_arguments.add_argument(
+        '--media-retries',
+        type=int,
+        required=False,
+        default=3,
+        metavar='',
+        help=(
+            "Number of times a failed media download is retried with "
+            "backoff before it is queued for a later retry. Default: 3"
+        )
+    )
+
+    ''' media download timeouts '''
+    optional_arguments.add_argument(
+        '--connect-timeout',
+        type=float,
+        required=False,
+        default=10.0,
+        metavar='',
+        help='Timeout in seconds to connect to a media host. Default: 10'
+    )
+
+    optional_arguments.add_argument(
+        '--read-timeout',
+        type=float,
+        required=False,
+        default=60.0,
+        metavar='',
+        help=(
+            "Timeout in seconds between two reads of a media download. "
+            "Default: 60"
+        )
+    )
+
+    ''' thumbnail normalization '''
+    optional_arguments.add_argument(
+        '--thumbnail-format',
+        type=str,
+        required=False,
+        choices=['webp', 'jpg', 'png'],
+        metavar='',
+        help=(
+            "Re-encode downloaded thumbnails to this format (webp, jpg or "
+            "png) after the collection. Requires Pillow."
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--thumbnail-max-size',
+        type=int,
+        required=False,
+        default=320,
+        metavar='',
+        help=(
+            "Maximum width and height in pixels of normalized thumbnails. "
+            "Default: 320"
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--keep-original-thumbnails',
+        action='store_true',
+        required=False,
+        help=(
+            "Keep the original thumbnails in thumbnails_originals when "
+            "normalizing them."
+        )
+    )
+
+    ''' near-duplicate detection '''
+    optional_arguments.add_argument(
+        '--near-duplicates',
+        action='store_true',
+        required=False,
+        help=(
+            "Hash thumbnails and keyframes with perceptual hashes and save "
+            "clusters of near-duplicate images to near_duplicates.csv. "
+            "Requires Pillow."
+        )
+    )
+
+    optional_arguments.add_argument(
+        '--hash-distance',
+        type=int,
+        required=False,
+        default=6,
+        metavar='',
+        help=(
+            "Maximum Hamming distance between the 64-bit perceptual hashes "
+            "of near-duplicate images. Default: 6"
         )
     )
 
@@ -353,6 +1035,11 @@ def main():
     if args['user'] and args['tag']:
         raise ValueError('Both --user and --tag were provided. Only one can be used.')
     
+    # sharded searches need a closed date window
+    if args['shard_days'] is not None:
+        if args['after'] is None or args['before'] is None:
+            raise ValueError('--shard-days requires both --after and --before.')
+    
     # merging SerpAPI configuration attrs with the existing arguments
     config_attrs = get_config_attrs(project_paths['config'])
     args = {**args, **config_attrs}
@@ -361,6 +1048,16 @@ def main():
     for date_key in ['before', 'after']:
         if args[date_key] is not None:
             verify_date_argument(args, date_key)
+
+    # each shard covers at least one day between the dates
+    if args['shard_days'] is not None:
+        if args['shard_days'] < 1:
+            parser.error('--shard-days must be at least 1.')
+
+        try:
+            split_date_range(args['after'], args['before'], args['shard_days'])
+        except ValueError as e:
+            parser.error(str(e))
     
     # start process
     log_text = f'''
@@ -376,11 +1073,14 @@ def main():
     # TikTokDataCollector instance
     collector = TikTokDataCollector(args=args)
 
-    # TikTok data collection call
-    collector.collect_search_data()
+    try:
+        # TikTok data collection call
+        collector.collect_search_data()
 
-    # read SQL database and generate csv file
-    collector.generate_data_files()
+        # read SQL database and generate csv file
+        collector.generate_data_files()
+    finally:
+        collector.close()
 
     # download videos
     if args['download']:
@@ -388,35 +1088,93 @@ def main():
         print ('-' * 30)
         print ('> Downloading videos...')
 
-        # get tiktok urls
-        collected_videos = collector.get_collected_videos()
+        # define max workers
+        max_workers = args['max_workers'] if args['max_workers'] else 5
+        concurrency = None
+        if args['adaptive_concurrency']:
+            concurrency = AIMDController(
+                min_limit=args['min_workers'],
+                max_limit=max_workers,
+                stage='videos'
+            )
+
+        downloader = VideoDownloader(
+            output=output,
+            use_tor=args['use_tor'],
+            sql_database=collector.sql_database,
+            derive_audio=args['derive_audio'],
+            audio_format=args['audio_format'],
+            tor_socks_ports=[
+                int(i) for i in args['tor_socks_ports'].split(',')
+            ],
+            concurrency=concurrency,
+            download_profile=args['download_profile'],
+            max_height=args['max_height'],
+            bandwidth_limit=_bandwidth_limit(args['bandwidth_limit'])
+        )
+        request_session = RequestSession(
+            sql_database=collector.sql_database,
+            media_store=downloader.media_store
+        )
+
+        try:
+            # one download per post: direct URL first, yt-dlp as fallback
+            planner = DownloadPlanner(
+                output=collector.output,
+                sql_database=collector.sql_database,
+                request_session=request_session,
+                downloader=downloader
+            )
+            planner.run(
+                max_workers=max_workers,
+                user=collector.user,
+                backend=args['download_backend'],
+                retry_failed=args['retry_failed']
+            )
+            planner.report()
 
-        if collected_videos:
-            print (f'\n> Found {len(collected_videos)} videos to download.')
+            # keyframes, probe metadata and audio: one ffmpeg pass per video
+            print ('\n')
+            print ('-' * 30)
+            print ('Post-processing videos...')
 
-            # define max workers
-            max_workers = args['max_workers'] if args['max_workers'] else 5
-            downloader = VideoDownloader(output=output, use_tor=args['use_tor'])
+            # define max workers: one ffmpeg process per CPU by default
+            max_workers = args['max_workers'] if args['max_workers'] else os.cpu_count()
+            request_session.run_keyframe_jobs(
+                output=output,
+                max_concurrent=max_workers,
+                worker=f'{socket.gethostname()}-{os.getpid()}',
+                queue_existing=True,
+                audio_mode=args['extract_audio'],
+                sample_rate=args['wav_sample_rate'],
+                frame_options=_frame_options(args)
+            )
 
-            # start download
-            downloader.start_download(urls=collected_videos, max_workers=max_workers)
-        else:
-            print ('\n> Search results did not return any videos to download.')
-        
-        # extract keyframes
+            # audio of videos post-processed by earlier runs without it
+            if args['extract_audio']:
+                request_session.extract_audio_from_videos(
+                    output=output,
+                    mode=args['extract_audio'],
+                    max_workers=max_workers,
+                    sample_rate=args['wav_sample_rate']
+                )
+        finally:
+            request_session.close()
         print ('\n')
         print ('-' * 30)
-        print ('Extracting keyframes...')
-        request_session = RequestSession()
 
-        # define max workers
-        max_workers = args['max_workers'] if args['max_workers'] else 3
-        request_session.extract_keyframes_from_videos(
-            output=output,
-            max_concurrent=max_workers
-        )
+    # near-duplicate thumbnails and keyframes
+    if args['near_duplicates']:
         print ('\n')
         print ('-' * 30)
+        print ('Detecting near-duplicate images...')
+        hash_index = PerceptualHashIndex(
+            output=collector.output,
+            sql_database=collector.sql_database
+        )
+        hash_index.build()
+        hash_index.export_near_duplicates(threshold=args['hash_distance'])
+        print ('-' * 30)
     
     # end process
     log_text = f'''
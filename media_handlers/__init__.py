@@ -1,2 +1,7 @@
+from .media_store import MediaStore
 from .session_manager import RequestSession
 from .video_downloader import VideoDownloader
+from .perceptual_hash import PerceptualHashIndex
+from .tor_pool import TorCircuitPool
+from .concurrency import AIMDController
+from .download_planner import DownloadPlanner
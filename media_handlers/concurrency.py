@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import os
+import time
+import asyncio
+import threading
+import pandas as pd
+
+# AIMD concurrency controller class
+class AIMDController:
+    '''
+    AIMDController
+
+    This class adapts the number of simultaneous downloads with additive
+    increase, multiplicative decrease (AIMD). Every window of successful
+    downloads with healthy latency raises the limit by one; an error or a
+    throttling response cuts it by a factor. Downloads started before the
+    last cut do not cut it again, so a burst of failures from the same
+    window counts once. Limits stay within the configured bounds and every
+    change is recorded in a timeline.
+    '''
+    def __init__(self, min_limit: int, max_limit: int, initial: int = None,
+                 decrease: float = 0.5, latency_tolerance: float = 2.0,
+                 stage: str = 'downloads') -> None:
+        '''
+        Initializes the AIMDController.
+
+        :param min_limit: Minimum number of simultaneous downloads.
+        :param max_limit: Maximum number of simultaneous downloads.
+        :param initial: Starting limit. Defaults to the minimum limit.
+        :param decrease: Factor applied to the limit on errors.
+        :param latency_tolerance: The limit is held instead of raised while
+            the average latency exceeds this multiple of the lowest average
+            latency seen.
+        :param stage: Name of the downloads in the timeline.
+        '''
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial or self.min_limit))
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.stage = stage
+
+        # downloads in flight, shared by worker threads
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+        # outcomes of the current window
+        self._successes = 0
+        self._failures = 0
+        self._latency = None
+        self._best_latency = None
+        self._last_decrease = 0.0
+
+        # limit changes
+        self._start = time.monotonic()
+        self.timeline = []
+        self._record('start')
+
+    @property
+    def adaptive(self) -> bool:
+        '''
+        Whether the limit can change.
+        '''
+        return self.min_limit < self.max_limit
+
+    def _record(self, event: str) -> None:
+        '''
+        Adds the current limit to the timeline. Called with the lock held.
+
+        :param event: The reason of the change.
+        '''
+        self.timeline.append({
+            'stage': self.stage,
+            'seconds': round(time.monotonic() - self._start, 3),
+            'event': event,
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'latency': round(self._latency, 3) if self._latency else None
+        })
+
+    def acquire(self) -> float:
+        '''
+        Waits until a download may start. Blocks the calling thread while
+        the limit is reached.
+
+        :return: The start time, passed back to release.
+        '''
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+
+            self.in_flight += 1
+
+        return time.monotonic()
+
+    def try_acquire(self) -> bool:
+        '''
+        Starts a download if the limit allows it, without waiting.
+
+        :return: True if the download may start.
+        '''
+        with self._condition:
+            if self.in_flight >= self.limit:
+                return False
+
+            self.in_flight += 1
+            return True
+
+    def release(self, started: float, success: bool,
+                throttled: bool = False) -> None:
+        '''
+        Records the outcome of a download and adjusts the limit.
+
+        :param started: The start time returned by acquire.
+        :param success: Whether the download succeeded.
+        :param throttled: Whether the server throttled the request.
+        '''
+        latency = time.monotonic() - started
+        with self._condition:
+            self.in_flight -= 1
+            if success and not throttled:
+                self._on_success(latency)
+            elif started >= self._last_decrease:
+                self._on_failure('throttled' if throttled else 'error')
+
+            self._condition.notify_all()
+
+    def _on_success(self, latency: float) -> None:
+        '''
+        Raises the limit by one after a window of successful downloads with
+        healthy latency. Called with the lock held.
+
+        :param latency: Duration of the download in seconds.
+        '''
+        self._latency = latency if self._latency is None else \
+            0.8 * self._latency + 0.2 * latency
+        self._successes += 1
+        if self._successes < self.limit:
+            return
+
+        # end of the window
+        healthy = self._best_latency is None or \
+            self._latency <= self.latency_tolerance * self._best_latency
+        if self._best_latency is None or self._latency < self._best_latency:
+            self._best_latency = self._latency
+
+        self._successes = 0
+        if healthy and self.limit < self.max_limit:
+            self.limit += 1
+            self._record('increase')
+        elif not healthy:
+            self._record('hold')
+
+    def _on_failure(self, event: str) -> None:
+        '''
+        Cuts the limit by the decrease factor. Called with the lock held.
+
+        :param event: The reason of the cut: 'error' or 'throttled'.
+        '''
+        self._failures += 1
+        self._successes = 0
+        self._last_decrease = time.monotonic()
+        limit = max(self.min_limit, int(self.limit * self.decrease))
+        if limit != self.limit:
+            self.limit = limit
+            self._record(event)
+
+    def export_timeline(self, output: str) -> None:
+        '''
+        Appends the timeline to concurrency_timeline.csv.
+
+        :param output: The directory path of the collection.
+        '''
+        with self._condition:
+            self._record('end')
+            timeline = list(self.timeline)
+
+        path = f'{output}/concurrency_timeline.csv'
+        pd.DataFrame(timeline).to_csv(
+            path,
+            mode='a',
+            header=not os.path.exists(path),
+            index=False,
+            encoding='utf-8'
+        )
+
+    def report(self) -> None:
+        '''
+        Prints the range of limits reached and the number of cuts.
+        '''
+        limits = [i['limit'] for i in self.timeline]
+        cuts = sum(1 for i in self.timeline if i['event'] in ('error', 'throttled'))
+        print (
+            f'> Concurrency ({self.stage}): {self.limit} at the end, '
+            f'{min(limits)}-{max(limits)} during the run, {cuts} cuts'
+        )
+
+# Asyncio gate class
+class AsyncConcurrencyGate:
+    '''
+    AsyncConcurrencyGate
+
+    This class waits for the limit of an AIMDController from coroutines,
+    without blocking the event loop. Create it in the loop that uses it.
+    '''
+    def __init__(self, controller: AIMDController) -> None:
+        '''
+        Initializes the AsyncConcurrencyGate.
+
+        :param controller: The AIMDController that sets the limit.
+        '''
+        self.controller = controller
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        '''
+        Waits until a download may start.
+
+        :return: The start time, passed back to release.
+        '''
+        async with self._condition:
+            await self._condition.wait_for(self.controller.try_acquire)
+
+        return time.monotonic()
+
+    async def release(self, started: float, success: bool,
+                      throttled: bool = False) -> None:
+        '''
+        Records the outcome of a download and wakes the waiting coroutines.
+
+        :param started: The start time returned by acquire.
+        :param success: Whether the download succeeded.
+        :param throttled: Whether the server throttled the request.
+        '''
+        self.controller.release(started, success, throttled)
+        async with self._condition:
+            self._condition.notify_all()
+
+# Token bucket class
+class TokenBucket:
+    '''
+    TokenBucket
+
+    This class caps the bandwidth shared by download threads. Threads take
+    tokens for the bytes they receive and sleep while the bucket is in
+    debt, so the combined rate stays at the cap however many threads
+    download.
+    '''
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        '''
+        Initializes the TokenBucket.
+
+        :param rate: Tokens (bytes) added per second.
+        :param capacity: Maximum tokens kept for bursts. Defaults to one
+            second of tokens.
+        '''
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float) -> float:
+        '''
+        Takes tokens from the bucket, sleeping until the bucket is out of
+        debt.
+
+        :param amount: The number of tokens (bytes) to take.
+        :return: The time slept in seconds.
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if delay:
+            time.sleep(delay)
+
+        return delay
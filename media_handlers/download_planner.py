@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import os
+import glob
+
+# typing
+from typing import Dict, List, Optional
+
+# SQLManager
+from databases import SQLDatabaseManager
+
+# local dependencies
+from .session_manager import RequestSession
+from .video_downloader import VideoDownloader
+
+# Download planner class
+class DownloadPlanner:
+    '''
+    DownloadPlanner
+
+    This class downloads each collected video once. The sources of every
+    post are gathered from the run database: the direct video URL collected
+    by Apify, fetched with a plain HTTP request, and the TikTok page URL,
+    downloaded with yt-dlp. The direct URL is cheaper and is tried first;
+    posts it fails for, and posts without one, go to yt-dlp.
+    '''
+    def __init__(self, output: str, sql_database: SQLDatabaseManager,
+                 request_session: RequestSession,
+                 downloader: VideoDownloader) -> None:
+        '''
+        Initializes the DownloadPlanner.
+
+        :param output: The directory path of the collection.
+        :param sql_database: SQLDatabaseManager of the collection.
+        :param request_session: RequestSession used for direct downloads.
+        :param downloader: VideoDownloader used for yt-dlp downloads.
+        '''
+        self.output = output
+        self.sql_database = sql_database
+        self.request_session = request_session
+        self.downloader = downloader
+        self.stats = {
+            'posts': 0,
+            'already_downloaded': 0,
+            'direct': 0,
+            'ytdlp': 0,
+            'missing': 0
+        }
+
+    def _find_video(self, post_id: str, index: Dict[str, Dict]) -> Optional[str]:
+        '''
+        Finds the downloaded video of a post.
+
+        :param post_id: The TikTok post ID.
+        :param index: The media_index entries of videos, by post ID.
+        :return: The path of the video, or None.
+        '''
+        entry = index.get(post_id)
+        if entry and os.path.exists(entry['path']):
+            return entry['path']
+
+        # completed downloads only, not '.part' or yt-dlp's intermediate
+        # '<post_id>.f<format>.mp4' files
+        for path in glob.glob(f'{self.output}/downloaded_videos/{glob.escape(post_id)}.*'):
+            if os.path.basename(path).count('.') == 1 and not path.endswith('.part'):
+                return path
+
+        return None
+
+    def _downloaded(self, plan: List[Dict]) -> List[Dict]:
+        '''
+        Selects the posts of a plan whose video is on disk.
+
+        :param plan: A list of posts built by plan().
+        :return: The posts with a downloaded video, with its 'path'.
+        '''
+        index = self.sql_database.get_media_index('video')
+        posts = []
+        for post in plan:
+            path = self._find_video(post['post_id'], index)
+            if path is not None:
+                posts.append({**post, 'path': path})
+
+        return posts
+
+    def plan(self, user: str = None) -> List[Dict]:
+        '''
+        Builds one download per collected post that has no video yet.
+
+        :param user: Optional username whose videos found in related content
+            are included, with or without the leading '@'.
+        :return: A list of dictionaries with the 'post_id', the page 'link'
+            and the 'direct_url' (or None) of every post to download.
+        '''
+        # usernames are matched in the post links, after the '@'
+        if user is not None:
+            user = user.lstrip('@')
+
+        posts = {}
+        for source in self.sql_database.get_video_sources(user):
+            post = posts.setdefault(
+                source['post_id'],
+                {'post_id': source['post_id'], 'link': None, 'direct_url': None}
+            )
+            post['link'] = post['link'] or source['link']
+            post['direct_url'] = post['direct_url'] or source['direct_url']
+
+        plan = [i for i in posts.values() if i['link']]
+        downloaded = {i['post_id'] for i in self._downloaded(plan)}
+
+        self.stats['posts'] = len(plan)
+        self.stats['already_downloaded'] = len(downloaded)
+
+        return [i for i in plan if i['post_id'] not in downloaded]
+
+    def run(self, max_workers: int, user: str = None, backend: str = 'thread',
+            retry_failed: bool = False) -> None:
+        '''
+        Downloads the planned videos: direct URLs first, then yt-dlp for the
+        posts still missing a video.
+
+        :param max_workers: The maximum number of yt-dlp threads or
+            processes.
+        :param user: Optional username whose videos found in related content
+            are included, with or without the leading '@'.
+        :param backend: The pool running yt-dlp: 'thread' or 'process'.
+        :param retry_failed: Whether to queue again the yt-dlp jobs that
+            failed in previous runs.
+        '''
+        plan = self.plan(user)
+        print (
+            f"\n> {self.stats['posts']} posts, "
+            f"{self.stats['already_downloaded']} already downloaded, "
+            f"{len(plan)} to download"
+        )
+        if not plan:
+            return
+
+        # direct URLs: a plain HTTP download, no page extraction; failures
+        # fall back to yt-dlp instead of the media retry queue
+        direct = [i for i in plan if i['direct_url']]
+        if direct:
+            print (f'> Downloading {len(direct)} videos from direct URLs...')
+            self.request_session.start_media_download(
+                urls=[i['direct_url'] for i in direct],
+                links=[i['link'] for i in direct],
+                output=self.output,
+                media_type='video',
+                queue_failures=False
+            )
+
+            downloaded = self._downloaded(direct)
+            self.stats['direct'] = len(downloaded)
+
+            # audio derived from the videos, in the same format as the
+            # videos downloaded with yt-dlp
+            if self.downloader.derive_audio:
+                self.downloader.extract_audio_files(
+                    [(i['direct_url'], i['path'], i['post_id']) for i in downloaded]
+                )
+
+        # yt-dlp for the rest
+        done = {i['post_id'] for i in self._downloaded(plan)}
+        fallback = [i for i in plan if i['post_id'] not in done]
+        if fallback:
+            print (f'> Downloading {len(fallback)} videos with yt-dlp...')
+            self.downloader.start_download(
+                urls=[i['link'] for i in fallback],
+                max_workers=max_workers,
+                backend=backend,
+                retry_failed=retry_failed
+            )
+
+        missing = [i for i in plan if not self._find_video(i['post_id'], {})]
+        self.stats['ytdlp'] = len(plan) - len(missing) - self.stats['direct']
+        self.stats['missing'] = len(missing)
+
+    def report(self) -> None:
+        '''
+        Prints the number of videos downloaded from each source.
+        '''
+        stats = self.stats
+        print (
+            f"> Video sources: {stats['direct']} direct, "
+            f"{stats['ytdlp']} yt-dlp, {stats['already_downloaded']} already "
+            f"downloaded, {stats['missing']} missing"
+        )
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import os
+import glob
+import shutil
+import hashlib
+import threading
+
+# SQLManager
+from databases import SQLDatabaseManager
+
+# Content-addressed media store class
+class MediaStore:
+    '''
+    MediaStore
+
+    This class stores downloaded media once per content. Files are keyed by
+    the SHA-256 of their bytes under 'media_store/', and every per-post file
+    (thumbnails, videos, audios) is a hardlink to its blob, so the same
+    cover or video collected from several sources takes disk space once.
+    '''
+    def __init__(self, output: str, sql_database: SQLDatabaseManager = None,
+                 chunk_size: int = 1024 * 1024) -> None:
+        '''
+        Initializes the MediaStore.
+
+        :param output: The directory path of the collection.
+        :param sql_database: Optional SQLDatabaseManager where blobs are
+            recorded in the media_blobs ledger.
+        :param chunk_size: Size in bytes of the chunks read when hashing.
+        '''
+        self.path = f'{output}/media_store'
+        self.sql_database = sql_database
+        self.chunk_size = chunk_size
+
+        # ingestion is called from download threads and the event loop
+        self._lock = threading.Lock()
+
+        # blobs can only be pruned by link count when hardlinks work
+        self.hardlinks = True
+        self.stats = {
+            'files': 0,
+            'duplicates': 0,
+            'bytes_deduplicated': 0
+        }
+
+    def _hash_file(self, path: str) -> str:
+        '''
+        Computes the SHA-256 of a file.
+
+        :param path: The path of the file.
+        :return: The hex digest.
+        '''
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _blob_path(self, sha256: str, extension: str) -> str:
+        '''
+        Builds the path of a blob, sharded by the first bytes of its hash.
+
+        :param sha256: The hex digest of the content.
+        :param extension: The file extension, including the dot.
+        :return: The blob path.
+        '''
+        return f'{self.path}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+    def ingest(self, path: str) -> str:
+        '''
+        Adds a downloaded file to the store. New content becomes a blob;
+        content already stored replaces the file with a hardlink to the
+        existing blob.
+
+        :param path: The path of the downloaded file.
+        :return: The SHA-256 hex digest of the file.
+        '''
+        sha256 = self._hash_file(path)
+        size = os.path.getsize(path)
+        blob = self._blob_path(sha256, os.path.splitext(path)[1])
+
+        with self._lock:
+            if os.path.exists(blob):
+                if os.path.samefile(path, blob):
+                    # already ingested
+                    return sha256
+
+                self._link(blob, path)
+                self.stats['duplicates'] += 1
+                self.stats['bytes_deduplicated'] += size
+            else:
+                folder = os.path.dirname(blob)
+                if not os.path.exists(folder):
+                    os.makedirs(folder)
+                self._link(path, blob)
+
+            self.stats['files'] += 1
+            if self.sql_database is not None:
+                self.sql_database.upsert_media_blob(
+                    sha256=sha256, size=size, path=blob
+                )
+
+        return sha256
+
+    def _link(self, source: str, target: str) -> None:
+        '''
+        Points `target` at the bytes of `source` with a hardlink, falling back
+        to a copy on file systems without hardlinks.
+
+        :param source: The existing file.
+        :param target: The path to create or replace.
+        '''
+        temp = f'{target}.link'
+        try:
+            os.link(source, temp)
+        except OSError:
+            self.hardlinks = False
+            shutil.copyfile(source, temp)
+
+        os.replace(temp, target)
+
+    def prune(self) -> int:
+        '''
+        Deletes blobs no longer referenced by any per-post file, e.g. after
+        the originals of normalized thumbnails were removed.
+
+        :return: The number of blobs deleted.
+        '''
+        if not self.hardlinks:
+            return 0
+
+        removed = []
+        with self._lock:
+            for blob in glob.glob(f'{self.path}/*/*/*'):
+                if os.stat(blob).st_nlink == 1:
+                    os.remove(blob)
+                    removed.append(os.path.basename(blob).split('.')[0])
+
+        if removed and self.sql_database is not None:
+            self.sql_database.delete_media_blobs(removed)
+
+        return len(removed)
+
+    def report(self) -> None:
+        '''
+        Prints the deduplication savings of the run.
+        '''
+        stats = self.stats
+        print (
+            f"> Media store: {stats['files']} files, "
+            f"{stats['duplicates']} duplicates, "
+            f"{stats['bytes_deduplicated'] / 1024 ** 2:.1f} MB deduplicated"
+        )
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import os
+import glob
+import itertools
+import numpy as np
+import pandas as pd
+
+# process pool
+from concurrent.futures import ProcessPoolExecutor
+
+# typing
+from typing import Dict, Iterator, List, Tuple
+
+# progress bar
+from tqdm import tqdm
+
+# SQLManager
+from databases import SQLDatabaseManager
+
+# local dependencies
+from .utilities import PIL_AVAILABLE
+
+# image files hashed by the index
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+# set bits of every byte value, for numpy versions without bitwise_count
+_POPCOUNT_TABLE = np.array(
+    [bin(i).count('1') for i in range(256)], dtype=np.uint8
+)
+
+'''
+Perceptual hashes
+
+'''
+def _dct_matrix(size: int) -> np.ndarray:
+    '''
+    Builds the orthonormal DCT-II matrix of the given size.
+
+    :param size: The size of the matrix.
+    :return: A (size, size) array.
+    '''
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] *= 1 / np.sqrt(2)
+
+    return matrix * np.sqrt(2 / size)
+
+_DCT_32 = _dct_matrix(32)
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    '''
+    Packs 64 booleans into an integer, most significant bit first.
+
+    :param bits: A boolean array of 64 values.
+    :return: The 64-bit integer.
+    '''
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), 'big')
+
+def compute_image_hashes(path: str) -> Dict:
+    '''
+    Computes the 64-bit dHash and pHash of an image. Runs in a worker
+    process.
+
+    :param path: Path of the image.
+    :return: A dictionary with the 'path', the 'dhash' and 'phash' as hex
+        strings, and an 'error' if the image could not be read.
+    '''
+    from PIL import Image
+
+    result = {'path': path, 'dhash': None, 'phash': None, 'error': None}
+    try:
+        with Image.open(path) as image:
+            gray = image.convert('L')
+
+            # dHash: horizontal gradients of a 9x8 image
+            small = np.asarray(
+                gray.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.float32
+            )
+            dhash = _bits_to_int((small[:, 1:] > small[:, :-1]).ravel())
+
+            # pHash: low frequencies of the DCT of a 32x32 image
+            pixels = np.asarray(
+                gray.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64
+            )
+            dct = _DCT_32 @ pixels @ _DCT_32.T
+            low = dct[:8, :8].ravel()
+            phash = _bits_to_int(low > np.median(low[1:]))
+
+        result['dhash'] = f'{dhash:016x}'
+        result['phash'] = f'{phash:016x}'
+    except Exception as e:
+        result['error'] = str(e) or repr(e)
+
+    return result
+
+'''
+Hamming distance search
+
+'''
+def popcount64(values: np.ndarray) -> np.ndarray:
+    '''
+    Counts the set bits of every value of a uint64 array.
+
+    :param values: A uint64 array.
+    :return: An array of bit counts with the same shape.
+    '''
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+
+    counts = _POPCOUNT_TABLE[values.view(np.uint8)]
+    return counts.reshape(*values.shape, 8).sum(axis=-1)
+
+def _block_masks(radius: int) -> np.ndarray:
+    '''
+    Lists every 16-bit mask with at most `radius` bits set.
+
+    :param radius: Maximum number of bits set.
+    :return: An int64 array of masks.
+    '''
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(16), r):
+            masks.append(sum(1 << b for b in bits))
+
+    return np.array(masks, dtype=np.int64)
+
+def _candidate_pairs(hashes: np.ndarray, threshold: int,
+                     batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    '''
+    Yields batches of pairs of hashes that may be within `threshold` bits of
+    each other. Hashes are split into four 16-bit blocks; two hashes within
+    `threshold` bits have, by the pigeonhole principle, at least one block
+    within `threshold // 4` bits, so only pairs of such blocks are
+    candidates. Blocks are bucketed by value, so looking up the hashes whose
+    block differs by a given mask takes constant time.
+
+    :param hashes: A uint64 array of distinct hashes.
+    :param threshold: The maximum Hamming distance.
+    :param batch_size: Approximate number of pairs per batch.
+    :return: An iterator of (i, j) index arrays. A pair may be yielded more
+        than once, from different blocks.
+    '''
+    masks = _block_masks(threshold // 4)
+    positions = np.arange(len(hashes))
+    for b in range(4):
+        block = ((hashes >> np.uint64(16 * b)) & np.uint64(0xFFFF)).astype(np.int64)
+        order = np.argsort(block, kind='stable')
+        bucket_starts = np.zeros((1 << 16) + 1, dtype=np.int64)
+        bucket_starts[1:] = np.cumsum(np.bincount(block, minlength=1 << 16))
+
+        for mask in masks:
+            keys = block ^ mask
+
+            # each pair of distinct buckets is visited from its lower bucket
+            rows = positions if mask == 0 else positions[keys > block]
+            left = bucket_starts[keys[rows]]
+            counts = bucket_starts[keys[rows] + 1] - left
+
+            # expand every (i, matching j) pair, in batches
+            ends = np.cumsum(counts)
+            bounds = np.searchsorted(
+                ends, np.arange(batch_size, int(ends[-1]) if len(ends) else 0, batch_size)
+            )
+            for chunk in np.split(np.arange(len(rows)), bounds):
+                chunk_counts = counts[chunk]
+                total = int(chunk_counts.sum())
+                if not total:
+                    continue
+
+                offsets = np.arange(total) - np.repeat(
+                    np.cumsum(chunk_counts) - chunk_counts, chunk_counts
+                )
+                i = np.repeat(rows[chunk], chunk_counts)
+                j = order[np.repeat(left[chunk], chunk_counts) + offsets]
+                if mask == 0:
+                    keep = i < j
+                    i, j = i[keep], j[keep]
+
+                yield np.minimum(i, j), np.maximum(i, j)
+
+def hamming_pairs(hashes: np.ndarray, threshold: int,
+                  batch_size: int = 1 << 22) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Finds every pair of hashes within `threshold` bits of each other.
+    Candidate pairs are verified with batched XOR and popcount.
+
+    :param hashes: A uint64 array of distinct hashes.
+    :param threshold: The maximum Hamming distance.
+    :param batch_size: Approximate number of candidate pairs verified per
+        batch.
+    :return: Two arrays with the indexes (i, j), i < j, of the matching
+        pairs.
+    '''
+    n = len(hashes)
+    matches = []
+    for i, j in _candidate_pairs(hashes, threshold, batch_size):
+        distance = popcount64(hashes[i] ^ hashes[j])
+        keep = distance <= threshold
+        matches.append(i[keep] * n + j[keep])
+
+    if not matches:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    matches = np.unique(np.concatenate(matches))
+    return matches // n, matches % n
+
+def cluster_pairs(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    '''
+    Groups items connected by pairs with union-find.
+
+    :param n: The number of items.
+    :param i: First item of every pair.
+    :param j: Second item of every pair.
+    :return: An array with the root item of every item's cluster.
+    '''
+    parent = list(range(n))
+
+    def find(x: int) -> int:
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for a, b in zip(i.tolist(), j.tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return np.array([find(x) for x in range(n)])
+
+# Perceptual hash index class
+class PerceptualHashIndex:
+    '''
+    PerceptualHashIndex
+
+    This class computes perceptual hashes (dHash and pHash) of thumbnails
+    and keyframes on a process pool, stores them in the run database and
+    groups near-duplicate images by Hamming distance.
+    '''
+    def __init__(self, output: str, sql_database: SQLDatabaseManager,
+                 max_workers: int = None) -> None:
+        '''
+        Initializes the PerceptualHashIndex.
+
+        :param output: The directory path of the collection.
+        :param sql_database: SQLDatabaseManager where hashes are stored.
+        :param max_workers: Maximum number of worker processes.
+        '''
+        self.output = output
+        self.sql_database = sql_database
+        self.max_workers = max_workers
+
+    def _list_images(self) -> List[Tuple[str, str, str]]:
+        '''
+        Lists the thumbnails and keyframes of the collection.
+
+        :return: A list of (path, source, post_id) tuples.
+        '''
+        images = []
+        for path in glob.glob(f'{self.output}/thumbnails/*'):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                post_id = os.path.basename(path).split('.')[0]
+                images.append((path, 'thumbnail', post_id))
+
+        for path in glob.glob(f'{self.output}/keyframes/*/*'):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                post_id = os.path.basename(os.path.dirname(path))
+                images.append((path, 'keyframe', post_id))
+
+        return images
+
+    def build(self) -> int:
+        '''
+        Hashes the images not yet in the index.
+
+        :return: The number of images hashed.
+        '''
+        if not PIL_AVAILABLE:
+            print ('Perceptual hashing requires Pillow: pip install Pillow')
+            return 0
+
+        indexed = set(self.sql_database.get_perceptual_hashes()['path'])
+        images = [i for i in self._list_images() if i[0] not in indexed]
+        if not images:
+            return 0
+
+        rows = []
+        failures = 0
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(
+                compute_image_hashes, [i[0] for i in images], chunksize=64
+            )
+            for (path, source, post_id), result in tqdm(
+                    zip(images, results), total=len(images),
+                    desc='Hashing images', unit='image'
+                ):
+                if result['error'] is not None:
+                    failures += 1
+                    continue
+
+                rows.append(
+                    (path, source, post_id, result['dhash'], result['phash'])
+                )
+
+        self.sql_database.insert_perceptual_hashes(rows)
+        print (f'> {len(rows)} images hashed, {failures} failures')
+
+        return len(rows)
+
+    def find_near_duplicates(self, hash_type: str = 'phash',
+                             threshold: int = 8) -> pd.DataFrame:
+        '''
+        Groups the indexed images whose hashes are within `threshold` bits
+        of each other.
+
+        :param hash_type: The hash compared: 'phash' or 'dhash'.
+        :param threshold: The maximum Hamming distance.
+        :return: A DataFrame with the 'cluster_id', 'path', 'source' and
+            'post_id' of every image in a cluster of two or more images.
+        '''
+        columns = ['cluster_id', 'path', 'source', 'post_id']
+        data = self.sql_database.get_perceptual_hashes()
+        if data.empty:
+            return pd.DataFrame(columns=columns)
+
+        # identical hashes are grouped before the distance search
+        values = np.array([int(i, 16) for i in data[hash_type]], dtype=np.uint64)
+        unique, inverse = np.unique(values, return_inverse=True)
+
+        i, j = hamming_pairs(unique, threshold)
+        roots = cluster_pairs(len(unique), i, j)[inverse]
+
+        data = data.assign(cluster_id=roots)
+        sizes = data.groupby('cluster_id')['path'].transform('size')
+        data = data[sizes > 1]
+
+        # number clusters by size
+        order = data['cluster_id'].value_counts().index
+        data = data.assign(
+            cluster_id=data['cluster_id'].map(
+                {root: n + 1 for n, root in enumerate(order)}
+            )
+        )
+
+        return data.sort_values(['cluster_id', 'path'])[columns]
+
+    def export_near_duplicates(self, hash_type: str = 'phash',
+                               threshold: int = 8) -> None:
+        '''
+        Writes the near-duplicate clusters to near_duplicates.csv.
+
+        :param hash_type: The hash compared: 'phash' or 'dhash'.
+        :param threshold: The maximum Hamming distance.
+        '''
+        clusters = self.find_near_duplicates(hash_type, threshold)
+        clusters.to_csv(
+            f'{self.output}/near_duplicates.csv',
+            index=False,
+            encoding='utf-8'
+        )
+        print (
+            f"> {clusters['cluster_id'].nunique()} near-duplicate clusters "
+            f"({len(clusters)} images) saved to near_duplicates.csv"
+        )
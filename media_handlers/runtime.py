@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import asyncio
+import threading
+
+# typing
+from typing import Any, Coroutine
+
+# Async runtime class
+class AsyncRuntime:
+    '''
+    AsyncRuntime
+
+    This class runs an asyncio event loop in a background thread for the
+    whole collection. Synchronous code, in the main thread or in any other
+    thread (e.g. the Streamlit script thread), submits coroutines to it, so
+    connection pools bound to the loop survive across calls.
+    '''
+    def __init__(self, name: str = 'tikspyder-async') -> None:
+        '''
+        Initializes the AsyncRuntime and starts its event loop thread.
+
+        :param name: Name of the event loop thread.
+        '''
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop,
+            name=name,
+            daemon=True
+        )
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        '''
+        Runs the event loop until it is stopped, then closes it.
+        '''
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    @property
+    def closed(self) -> bool:
+        '''
+        :return: Whether the runtime has been closed.
+        '''
+        return not self._thread.is_alive()
+
+    def run(self, coro: Coroutine) -> Any:
+        '''
+        Runs a coroutine in the event loop and waits for its result.
+
+        :param coro: The coroutine to run.
+        :return: The result of the coroutine.
+        :raises RuntimeError: If called from inside the event loop, where the
+            coroutine must be awaited instead, or after the runtime closed.
+        '''
+        if self.closed:
+            coro.close()
+            raise RuntimeError('The async runtime is closed.')
+
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError(
+                'AsyncRuntime.run() cannot be called from its own event '
+                'loop; await the coroutine instead.'
+            )
+
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result()
+
+    def close(self) -> None:
+        '''
+        Stops the event loop and waits for its thread to finish.
+        '''
+        if self.closed:
+            return
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
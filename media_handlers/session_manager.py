@@ -3,10 +3,12 @@
 # import modules
 import os
 import glob
+import time
+import shutil
+import random
 import aiohttp
 import asyncio
-import requests
-import subprocess
+import functools
 
 # progress bar
 from tqdm import tqdm
@@ -15,54 +17,149 @@ from tqdm import tqdm
 from aiohttp import ClientSession
 
 # typing
-from typing import Dict, List
+from typing import Any, Coroutine, Dict, List, Optional, Tuple
+
+# SQLManager
+from databases import SQLDatabaseManager
+
+# process pool
+from concurrent.futures import ProcessPoolExecutor
+
+# local dependencies
+from .runtime import AsyncRuntime
+from .media_store import MediaStore
+from .concurrency import AIMDController, AsyncConcurrencyGate
+from .utilities import AUDIO_EXTRACTION_MODES, PIL_AVAILABLE, \
+    THUMBNAIL_FORMATS, build_frame_options, detect_image_extension, \
+    extract_audio_track, frame_settings_key, normalize_image, \
+    postprocess_video
+
+# download errors
+class _RetryableError(Exception):
+    '''
+    A download attempt failed but may succeed if retried.
+    '''
+
+class _PermanentError(Exception):
+    '''
+    A download attempt failed and retrying would not help.
+    '''
+
+class _ThrottledError(_RetryableError):
+    '''
+    The server throttled the request.
+    '''
+
+class _NotModified(Exception):
+    '''
+    A conditional request found the file unchanged.
+    '''
 
 # HTTP session class
 class RequestSession:
     '''
     RequestSession
 
-    This class handles HTTP requests and asynchronous tasks for interacting
-    with the SerpAPI response and processing related content links
+    This class handles asynchronous media downloads (thumbnails and videos)
+    and the ffmpeg post-processing of downloaded videos. Downloads run in a
+    background event loop that owns a single aiohttp session for the whole
+    collection; call close() when done.
 
     '''
-    def __init__(self) -> None:
+    def __init__(self, chunk_size: int = 64 * 1024, max_concurrency: int = 32,
+                 max_per_host: int = 8, connect_timeout: float = 10.0,
+                 read_timeout: float = 60.0, max_retries: int = 3,
+                 sql_database: SQLDatabaseManager = None,
+                 refresh_media: bool = False,
+                 media_store: MediaStore = None,
+                 concurrency: AIMDController = None) -> None:
         '''
         Initializes the RequestSession object.
+
+        :param chunk_size: Size in bytes of the chunks in which downloaded
+            files are streamed to disk.
+        :param max_concurrency: Maximum number of simultaneous media
+            downloads.
+        :param max_per_host: Maximum number of simultaneous media downloads
+            from the same host.
+        :param connect_timeout: Timeout in seconds to connect to a host.
+        :param read_timeout: Timeout in seconds between two reads of a
+            response body.
+        :param max_retries: Number of times a failed media download is
+            retried.
+        :param sql_database: Optional SQLDatabaseManager where downloads that
+            still fail after every retry are queued, and where downloaded
+            media is indexed.
+        :param refresh_media: Whether to revalidate media that was already
+            downloaded with conditional requests instead of skipping it.
+        :param media_store: Optional MediaStore that deduplicates downloaded
+            files by content.
+        :param concurrency: Optional AIMDController adapting the number of
+            simultaneous download attempts, up to the connector limits.
         '''
-        # request session
-        headers = {'accept': 'application/json'}
-        self.req_session = requests.Session()
-        self.req_session.headers.update(headers)
+        # long-lived event loop running in a background thread
+        self.runtime = AsyncRuntime()
+        self.loop = self.runtime.loop
+
+        # media downloads are streamed to disk in fixed-size chunks
+        self.chunk_size = chunk_size
+
+        # connection limits and timeouts for media downloads
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+
+        # session and connector shared by every media download, created in
+        # the loop
+        self._connector = None
+        self._session = None
+
+        # adaptive limit of simultaneous download attempts
+        self.concurrency = concurrency
+        self._gate = None
 
-        # asynchronous event loop
-        self.loop = asyncio.get_event_loop()
+        # retry policy: jittered exponential backoff
+        self.max_retries = max_retries
+        self.backoff_base = 1.0
+        self.backoff_max = 30.0
+        self.sql_database = sql_database
+
+        # accepted content types per media type
+        self.content_types = {
+            'image': 'image/',
+            'video': 'video/'
+        }
+        self.generic_content_types = [
+            'application/octet-stream',
+            'binary/octet-stream'
+        ]
+
+        # content-addressed store for downloaded files
+        self.media_store = media_store
+
+        # skip media already downloaded, or revalidate it in refresh mode
+        self.refresh_media = refresh_media
+        self.media_stats = {
+            'downloaded': 0,
+            'skipped': 0,
+            'not_modified': 0,
+            'bytes_downloaded': 0,
+            'bytes_saved': 0
+        }
     
-    def load_related_content(self, url: str, api_key: str) -> List[Dict]:
+    def _extract_post_id(self, link: str) -> str:
         '''
-        Loads related content from the given URL using the provided API key.
+        Extracts the post ID from a TikTok link.
 
-        :param url: The URL to load related content from.
-        :param api_key: SerpAPI key for authentication.
-        :return: A list of dictionaries containing the related content data.
+        :param link: The TikTok link.
+        :return: The post ID.
         '''
-        params = {'api_key': api_key}
-
-        def fetch_content(url: str) -> Dict:
-            response = self.req_session.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+        return link.split('/')[-1].split('?')[0]
 
-        try:
-            content = fetch_content(url)
-            see_more_link = content.get('serpapi_see_more_link')
-            if see_more_link:
-                content = fetch_content(see_more_link)
-            return content
-        except requests.RequestException as e:
-            print (f'An error occurred: {e}')
-            return {}
-    
     def _build_media_filename_path(self, output: str, link: str, file_extension: str) -> str:
         '''
         Builds the filename path for saving the image based on the TikTok link.
@@ -73,65 +170,454 @@ class RequestSession:
         :return: The full path (including filename) where the image will be
             saved.
         '''
-        post_id = link.split('/')[-1].split('?')[0]
+        post_id = self._extract_post_id(link)
         return f'{output}/{post_id}.{file_extension}'
+
+    def _find_existing_media(self, filename: str) -> Optional[str]:
+        '''
+        Finds a downloaded file for the given filename path, whatever its
+        extension, since images are saved with the detected format.
+
+        :param filename: The path built by _build_media_filename_path.
+        :return: The path of the existing file, or None.
+        '''
+        if os.path.exists(filename):
+            return filename
+
+        base = os.path.splitext(filename)[0]
+        for path in glob.glob(f'{glob.escape(base)}.*'):
+            if not path.endswith('.part') and '.normalized.' not in path:
+                return path
+
+        return None
+
+    def _final_media_filename(self, filename: str, temp_filename: str,
+                              content_type: str = None,
+                              media_type: str = None) -> str:
+        '''
+        Selects the final filename of a download. Images take the extension
+        of their actual format, detected from the first bytes of the file or
+        the Content-Type header.
+
+        :param filename: The requested path of the file.
+        :param temp_filename: The temporary file holding the download.
+        :param content_type: Optional Content-Type of the response.
+        :param media_type: Optional type of media: 'image' or 'video'.
+        :return: The path the file should be saved to.
+        '''
+        if media_type != 'image':
+            return filename
+
+        with open(temp_filename, 'rb') as f:
+            header = f.read(32)
+
+        extension = detect_image_extension(header, content_type)
+        if extension is None:
+            return filename
+
+        return f'{os.path.splitext(filename)[0]}.{extension}'
     
+    @property
+    def connector(self) -> aiohttp.TCPConnector:
+        '''
+        :return: The TCP connector shared by every media download, created
+            on first use.
+        '''
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.max_per_host
+            )
+
+        return self._connector
+
+    @property
+    def session(self) -> ClientSession:
+        '''
+        :return: The aiohttp session shared by every media download, created
+            on first use inside the event loop.
+        '''
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=self.connector,
+                connector_owner=False,
+                timeout=self.timeout
+            )
+
+        return self._session
+
+    def run(self, coro: Coroutine) -> Any:
+        '''
+        Runs a coroutine in the session's event loop from synchronous code.
+
+        :param coro: The coroutine to run.
+        :return: The result of the coroutine.
+        '''
+        return self.runtime.run(coro)
+
+    async def _fetch_once(self, session: ClientSession, url: str,
+                          temp_filename: str, media_type: str = None,
+                          conditional: Dict = None) -> Dict:
+        '''
+        Makes a single download attempt, resuming a partial temporary file
+        with an HTTP Range request when one exists.
+
+        :param session: The aiohttp ClientSession object.
+        :param url: The URL of the file to download.
+        :param temp_filename: The temporary file the body is written to.
+        :param media_type: Optional type of media expected: 'image' or
+            'video'.
+        :param conditional: Optional media_index entry of the file, whose
+            ETag and Last-Modified validators make the request conditional.
+        :return: A dictionary with the 'size' of the complete file, its
+            'content_type' and its 'etag' and 'last_modified' validators.
+        :raises _NotModified: If the server reports the file is unchanged.
+        :raises _RetryableError: If the attempt failed but may succeed later.
+        :raises _PermanentError: If retrying would not help.
+        '''
+        offset = 0
+        headers = {}
+        if os.path.exists(temp_filename):
+            offset = os.path.getsize(temp_filename)
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+
+        if conditional and not offset:
+            if conditional.get('etag'):
+                headers['If-None-Match'] = conditional['etag']
+            if conditional.get('last_modified'):
+                headers['If-Modified-Since'] = conditional['last_modified']
+
+        async with session.get(url, headers=headers) as res:
+            if res.status == 304:
+                raise _NotModified()
+
+            if res.status == 416:
+                # stale partial file: start over
+                os.remove(temp_filename)
+                raise _RetryableError('requested range not satisfiable')
+
+            if res.status in (429, 503):
+                raise _ThrottledError(f'status code: {res.status}')
+
+            if res.status == 408 or res.status >= 500:
+                raise _RetryableError(f'status code: {res.status}')
+
+            if res.status not in (200, 206):
+                raise _PermanentError(f'status code: {res.status}')
+
+            # check the content type
+            content_type = res.headers.get('Content-Type', '').split(';')[0].strip()
+            expected = self.content_types.get(media_type)
+            if expected and content_type and not (
+                content_type.startswith(expected) or
+                content_type in self.generic_content_types
+            ):
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+                raise _PermanentError(f'unexpected content type: {content_type}')
+
+            # expected size of the complete file
+            if res.status == 206:
+                mode = 'ab'
+                content_range = res.headers.get('Content-Range', '')
+                total = content_range.rsplit('/', 1)[-1]
+                expected_size = int(total) if total.isdigit() else None
+            else:
+                # the server ignored the Range header
+                mode = 'wb'
+                expected_size = res.content_length
+
+            with open(temp_filename, mode) as f:
+                async for chunk in res.content.iter_chunked(self.chunk_size):
+                    f.write(chunk)
+
+            validators = {
+                'content_type': content_type,
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified')
+            }
+
+        size = os.path.getsize(temp_filename)
+        if expected_size is not None and size != expected_size:
+            raise _RetryableError(
+                f'incomplete download: {size} of {expected_size} bytes'
+            )
+
+        return {'size': size, **validators}
+
+    async def _fetch_limited(self, session: ClientSession, url: str,
+                             temp_filename: str, media_type: str = None,
+                             conditional: Dict = None) -> Dict:
+        '''
+        Makes a download attempt once the concurrency limit allows it, and
+        reports its outcome to the concurrency controller.
+
+        Takes the same parameters, returns the same value and raises the
+        same exceptions as _fetch_once.
+        '''
+        if self.concurrency is None:
+            return await self._fetch_once(
+                session, url, temp_filename, media_type, conditional
+            )
+
+        if self._gate is None:
+            self._gate = AsyncConcurrencyGate(self.concurrency)
+
+        started = await self._gate.acquire()
+        success = throttled = False
+        try:
+            result = await self._fetch_once(
+                session, url, temp_filename, media_type, conditional
+            )
+            success = True
+            return result
+        except _NotModified:
+            success = True
+            raise
+        except _ThrottledError:
+            throttled = True
+            raise
+        finally:
+            await self._gate.release(started, success, throttled)
+
     async def fetch_file(self, session: ClientSession, url: str,
-                         filename: str) -> None:
+                         filename: str, link: str = None,
+                         media_type: str = None,
+                         conditional: Dict = None,
+                         queue_failures: bool = True) -> Optional[int]:
         '''
         Fetches a file from a URL and saves it to the output directory.
 
+        The response body is streamed in chunks to a temporary file that is
+        renamed once complete, so memory stays bounded by the chunk size and
+        partial downloads never appear under the final filename. Failed
+        attempts are retried with jittered exponential backoff, resuming the
+        partial file with Range requests. Downloads that still fail are
+        added to the retry queue of the run database.
+
         :param session: The aiohttp ClientSession object.
         :param url: The URL of the file to download.
         :param filename: The path (including filename) where the file will be
-            saved.
+            saved. Images take the extension of their actual format.
+        :param link: Optional TikTok link corresponding to the file.
+        :param media_type: Optional type of media expected: 'image' or
+            'video'.
+        :param conditional: Optional media_index entry of a file downloaded
+            before, to revalidate it with a conditional request.
+        :param queue_failures: Whether downloads that still fail are added
+            to the retry queue. Callers with another source for the file
+            disable it.
+        :return: The number of bytes written, or None if the download failed.
         '''
-        try:
-            async with session.get(url) as res:
-                if res.status == 200:
-                    file_data = await res.read()
-                    with open(filename, 'wb') as f:
-                        f.write(file_data)
-                else:
-                    print (
-                        f'Failed to download {url}, status code: {res.status}'
+        temp_filename = f'{filename}.part'
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # full jitter backoff
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, delay))
+
+            try:
+                result = await self._fetch_limited(
+                    session, url, temp_filename, media_type, conditional
+                )
+
+                # atomic rename, with the detected image format
+                final_filename = self._final_media_filename(
+                    filename, temp_filename, result['content_type'], media_type
+                )
+                os.replace(temp_filename, final_filename)
+                if final_filename != filename and os.path.exists(filename):
+                    # refreshed file saved in a different format
+                    os.remove(filename)
+
+                self.media_stats['downloaded'] += 1
+                self.media_stats['bytes_downloaded'] += result['size']
+
+                # deduplicate the content, hashing off the event loop
+                sha256 = None
+                if self.media_store is not None:
+                    sha256 = await asyncio.get_running_loop().run_in_executor(
+                        None, self.media_store.ingest, final_filename
                     )
-        except Exception as e:
-            print (f'An error occurred while downloading {url}: {e}')
+
+                # index the downloaded file, off the event loop
+                if self.sql_database is not None and link is not None:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, functools.partial(
+                            self.sql_database.upsert_media_index,
+                            post_id=self._extract_post_id(link),
+                            media_type=media_type, path=final_filename,
+                            url=url, etag=result['etag'],
+                            last_modified=result['last_modified'],
+                            size=result['size'], sha256=sha256
+                        )
+                    )
+
+                return result['size']
+            except _NotModified:
+                self.media_stats['not_modified'] += 1
+                self.media_stats['bytes_saved'] += conditional.get('size') or 0
+                return 0
+            except _PermanentError as e:
+                error = str(e)
+                break
+            except (_RetryableError, aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                error = str(e) or repr(e)
+
+        print (f'Failed to download {url}: {error}')
+        if self.sql_database is not None and queue_failures:
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(
+                    self.sql_database.enqueue_media_retry,
+                    url=url, link=link, filename=filename,
+                    media_type=media_type, error=error
+                )
+            )
+
+        return None
     
     async def download_files(self, urls: List[str], links: List[str],
-                             output: str, file_extension: str) -> None:
+                             output: str, file_extension: str,
+                             media_type: str = None,
+                             queue_failures: bool = True) -> Dict:
         '''
         Downloads files from a list of URLs asynchronously.
 
+        Downloads share one connector that bounds the number of simultaneous
+        connections, globally and per host, and apply connect and read
+        timeouts. A throughput report is printed at the end of the batch.
+
         :param urls: A list of file URLs to download.
         :param links: A list of TikTok links corresponding to the files.
         :param output: The directory path where the files will be saved.
         :param file_extension: The file extension of the media file.
+        :param media_type: Optional type of media expected: 'image' or
+            'video'.
+        :param queue_failures: Whether failed downloads are added to the
+            retry queue.
+        :return: A dictionary with the batch throughput statistics.
         '''
-        async with aiohttp.ClientSession() as session:
-            tasks = [
-                self.fetch_file(
-                    session=session, url=url,
-                    filename=self._build_media_filename_path(output, link, file_extension)
-                ) for url, link in zip(urls, links)
-            ]
-            await asyncio.gather(*tasks)
+        start = time.perf_counter()
+
+        # index lookups and file checks, off the event loop
+        pending, skipped, bytes_saved = await asyncio.get_running_loop().run_in_executor(
+            None, self._select_pending_downloads,
+            urls, links, output, file_extension, media_type
+        )
+        self.media_stats['skipped'] += skipped
+        self.media_stats['bytes_saved'] += bytes_saved
+        session = self.session
+        tasks = [
+            self.fetch_file(
+                session=session, url=url, filename=filename,
+                link=link, media_type=media_type, conditional=conditional,
+                queue_failures=queue_failures
+            ) for url, link, filename, conditional in pending
+        ]
+        results = await asyncio.gather(*tasks)
+
+        # throughput report
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        sizes = [i for i in results if i is not None]
+        stats = {
+            'files': len(sizes),
+            'skipped': len(urls) - len(pending),
+            'failures': len(results) - len(sizes),
+            'bytes': sum(sizes),
+            'seconds': elapsed
+        }
+        if results:
+            print (
+                f"> {stats['files']} files in {elapsed:.1f}s "
+                f"({stats['files'] / elapsed:.1f} files/s, "
+                f"{stats['bytes'] / elapsed / 1024 ** 2:.2f} MB/s), "
+                f"{stats['skipped']} skipped, "
+                f"{stats['failures']} failures"
+            )
+
+        return stats
     
-    def start_media_download(self, urls: List[str], links: List[str],
-                             output: str, media_type: str) -> None:
+    def _select_pending_downloads(self, urls: List[str], links: List[str],
+                                  output: str, file_extension: str,
+                                  media_type: str = None) -> List[Tuple]:
         '''
-        Starts the asynchronous download of files from a list of URLs.
+        Selects the files of a batch that need to be downloaded. Posts
+        already present on disk are skipped, or revalidated with conditional
+        requests in refresh mode, and posts repeated in the batch are
+        downloaded once.
+
+        :param urls: A list of file URLs to download.
+        :param links: A list of TikTok links corresponding to the files.
+        :param output: The directory path where the files will be saved.
+        :param file_extension: The file extension of the media file.
+        :param media_type: Optional type of media: 'image' or 'video'.
+        :return: A list of (url, link, filename, conditional) tuples, and
+            the number and bytes of the files skipped.
+        '''
+        index = {}
+        if self.sql_database is not None and media_type is not None:
+            index = self.sql_database.get_media_index(media_type)
+
+        pending = []
+        seen = set()
+        skipped = bytes_saved = 0
+        for url, link in zip(urls, links):
+            post_id = self._extract_post_id(link)
+            if post_id in seen:
+                continue
+            seen.add(post_id)
+
+            filename = self._build_media_filename_path(output, link, file_extension)
+            entry = index.get(post_id)
+            if entry and os.path.exists(entry['path']):
+                path = entry['path']
+            else:
+                entry = None
+                path = self._find_existing_media(filename)
+
+            if path is None:
+                pending.append((url, link, filename, None))
+                continue
+
+            # already downloaded
+            if entry is None:
+                entry = {'path': path, 'size': os.path.getsize(path)}
+                if self.sql_database is not None and media_type is not None:
+                    self.sql_database.upsert_media_index(
+                        post_id=post_id, media_type=media_type, path=path,
+                        size=entry['size']
+                    )
+
+            if self.refresh_media and (entry.get('etag') or entry.get('last_modified')):
+                pending.append((url, link, path, entry))
+            else:
+                skipped += 1
+                bytes_saved += entry.get('size') or 0
+
+        return pending, skipped, bytes_saved
+
+    async def download_media(self, urls: List[str], links: List[str],
+                             output: str, media_type: str,
+                             queue_failures: bool = True) -> None:
+        '''
+        Downloads media files into the media type's directory. Can be awaited
+        from coroutines running in this session's event loop; synchronous
+        code uses start_media_download.
 
         :param urls: A list of file URLs to download.
         :param links: A list of TikTok links corresponding to the files.
         :param output: The directory path where the files will be saved.
         :param media_type: The type of media to download.
+        :param queue_failures: Whether failed downloads are added to the
+            retry queue.
         '''
+        # images take the extension of their actual format on download
         media_object = {
             'image': {
                 'path': 'thumbnails',
-                'file_extension': 'png'
+                'file_extension': 'jpg'
             },
             'video': {
                 'path': 'downloaded_videos',
@@ -144,113 +630,523 @@ class RequestSession:
             os.makedirs(path)
         
         file_extension = media_object[media_type]['file_extension']
-        self.loop.run_until_complete(
-            self.download_files(urls=urls, links=links, output=path,
-                                file_extension=file_extension)
+        await self.download_files(urls=urls, links=links, output=path,
+                                  file_extension=file_extension,
+                                  media_type=media_type,
+                                  queue_failures=queue_failures)
+
+    def start_media_download(self, urls: List[str], links: List[str],
+                             output: str, media_type: str,
+                             queue_failures: bool = True) -> None:
+        '''
+        Starts the asynchronous download of files from a list of URLs.
+
+        :param urls: A list of file URLs to download.
+        :param links: A list of TikTok links corresponding to the files.
+        :param output: The directory path where the files will be saved.
+        :param media_type: The type of media to download.
+        :param queue_failures: Whether failed downloads are added to the
+            retry queue.
+        '''
+        self.run(
+            self.download_media(urls=urls, links=links, output=output,
+                                media_type=media_type,
+                                queue_failures=queue_failures)
         )
 
-    def extract_audio_from_videos(self, output: str) -> None:
+    async def retry_failed_downloads(self, max_attempts: int = 3) -> None:
+        '''
+        Retries the downloads queued in the run database, including those
+        left over by previous runs with the same output directory.
+
+        :param max_attempts: Maximum number of rounds a queued download is
+            attempted.
         '''
-        Extracts audio from video files.
+        if self.sql_database is None:
+            return
 
-        :param output: The directory path where audios will be saved.
+        loop = asyncio.get_running_loop()
+        items = await loop.run_in_executor(
+            None, self.sql_database.get_media_retries, max_attempts
+        )
+        if not items:
+            return
+
+        print (f'> Retrying {len(items)} failed media downloads...')
+        session = self.session
+
+        async def retry(item: Dict) -> None:
+            folder = os.path.dirname(item['filename'])
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+            size = await self.fetch_file(
+                session=session, url=item['url'],
+                filename=item['filename'], link=item['link'],
+                media_type=item['media_type']
+            )
+            if size is not None:
+                await loop.run_in_executor(
+                    None, self.sql_database.complete_media_retry,
+                    item['url'], item['filename']
+                )
+
+        await asyncio.gather(*[retry(item) for item in items])
+
+    def normalize_thumbnails(self, output: str, image_format: str = 'webp',
+                             max_size: int = 320, keep_originals: bool = False,
+                             max_workers: int = None) -> Dict:
         '''
+        Re-encodes the downloaded thumbnails to one format and maximum size
+        on a process pool. Originals are moved to 'thumbnails_originals' when
+        kept, or deleted.
+
+        :param output: The directory path of the collection.
+        :param image_format: Target file extension: 'webp', 'jpg' or 'png'.
+        :param max_size: Maximum width and height in pixels.
+        :param keep_originals: Whether to keep the original thumbnails.
+        :param max_workers: Maximum number of worker processes.
+        :return: A dictionary with the normalization statistics.
+        '''
+        stats = {'files': 0, 'failures': 0, 'bytes_before': 0, 'bytes_after': 0}
+        if not PIL_AVAILABLE:
+            print ('Thumbnail normalization requires Pillow: pip install Pillow')
+            return stats
+
+        if image_format not in THUMBNAIL_FORMATS:
+            raise ValueError(f'Unsupported thumbnail format: {image_format}')
+
+        path = f'{output}/thumbnails'
+        files = [
+            i for i in glob.glob(f'{path}/*')
+            if os.path.isfile(i) and not i.endswith('.part') and
+            '.normalized.' not in i
+        ]
+        if not files:
+            return stats
+
+        originals_path = f'{output}/thumbnails_originals'
+        if keep_originals and not os.path.exists(originals_path):
+            os.makedirs(originals_path)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                normalize_image,
+                files,
+                [image_format] * len(files),
+                [max_size] * len(files),
+                chunksize=16
+            )
+
+            for result in tqdm(results, total=len(files),
+                               desc='Normalizing thumbnails', unit='image'):
+                if result['error'] is not None:
+                    stats['failures'] += 1
+                    print (f"Error normalizing {result['path']}: {result['error']}")
+                    continue
+
+                if result['output'] is None:
+                    continue
+
+                # replace the original with the normalized image
+                original = result['path']
+                stats['files'] += 1
+                stats['bytes_before'] += os.path.getsize(original)
+                stats['bytes_after'] += result['size']
+                if keep_originals:
+                    shutil.move(
+                        original,
+                        f'{originals_path}/{os.path.basename(original)}'
+                    )
+                else:
+                    os.remove(original)
+
+                filename = f'{os.path.splitext(original)[0]}.{image_format}'
+                os.replace(result['output'], filename)
+
+                sha256 = None
+                if self.media_store is not None:
+                    sha256 = self.media_store.ingest(filename)
+
+                if self.sql_database is not None:
+                    post_id = os.path.basename(original).split('.')[0]
+                    self.sql_database.update_media_index_path(
+                        post_id=post_id, media_type='image',
+                        path=filename, size=result['size'], sha256=sha256
+                    )
+
+        # drop the blobs of deleted originals
+        if self.media_store is not None and not keep_originals:
+            self.media_store.prune()
+
+        print (
+            f"> {stats['files']} thumbnails normalized to {image_format} "
+            f"({stats['bytes_before'] / 1024 ** 2:.1f} MB -> "
+            f"{stats['bytes_after'] / 1024 ** 2:.1f} MB), "
+            f"{stats['failures']} failures"
+        )
+
+        return stats
+
+    def report_media_stats(self) -> None:
+        '''
+        Prints the media downloaded during the run and the bytes saved by
+        skipping or revalidating media that was already downloaded.
+        '''
+        stats = self.media_stats
+        print (
+            f"\n> Media: {stats['downloaded']} downloaded "
+            f"({stats['bytes_downloaded'] / 1024 ** 2:.1f} MB), "
+            f"{stats['skipped']} already present, "
+            f"{stats['not_modified']} not modified, "
+            f"{stats['bytes_saved'] / 1024 ** 2:.1f} MB saved"
+        )
+
+        if self.concurrency is not None and self.concurrency.adaptive:
+            self.concurrency.report()
+
+    async def aclose(self) -> None:
+        '''
+        Closes the session and connector shared by media downloads.
+        '''
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+
+    def close(self) -> None:
+        '''
+        Closes the shared session and stops the background event loop.
+        '''
+        if self.runtime.closed:
+            return
+
+        self.run(self.aclose())
+        self.runtime.close()
+
+    def extract_audio_from_videos(self, output: str, mode: str = 'mp3',
+                                  max_workers: int = None,
+                                  sample_rate: int = 16000) -> Dict:
+        '''
+        Extracts the audio of the downloaded videos on a process pool, one
+        ffmpeg process per worker. Videos whose audio already exists in
+        'downloaded_audios' are skipped, so only new downloads are processed
+        on later runs. The time spent on every file is recorded in the
+        audio_extractions table.
+
+        :param output: The directory path of the collection.
+        :param mode: 'mp3' (re-encoded), 'copy' (the stream copied into M4A,
+            no re-encoding) or 'wav' (mono PCM at a fixed sample rate, for
+            analysis).
+        :param max_workers: Maximum number of worker processes. Defaults to
+            the number of CPUs.
+        :param sample_rate: Sample rate of the 'wav' mode in Hz.
+        :return: A dictionary with the extraction statistics.
+        '''
+        if mode not in AUDIO_EXTRACTION_MODES:
+            raise ValueError(f'Unsupported audio extraction mode: {mode}')
+
+        stats = {'files': 0, 'skipped': 0, 'failures': 0, 'seconds': 0.0}
+
         # build audio path
         audio_path = f'{output}/downloaded_audios'
         if not os.path.exists(audio_path):
             os.makedirs(audio_path)
 
-        # get all video files
-        path = f'{output}/downloaded_videos'
-        files = glob.glob(f'{path}/*.mp4')
+        # completed downloads only: '<post_id>.mp4', not yt-dlp's
+        # '<post_id>.f<format>.mp4' intermediate files
+        extension = AUDIO_EXTRACTION_MODES[mode]
+        videos, audios = [], []
+        for file in glob.glob(f'{output}/downloaded_videos/*.mp4'):
+            name = os.path.basename(file)
+            if name.count('.') != 1:
+                continue
+
+            audio = f'{audio_path}/{name.split(".")[0]}.{extension}'
+            if os.path.exists(audio):
+                stats['skipped'] += 1
+                continue
+
+            videos.append(file)
+            audios.append(audio)
+
+        if not videos:
+            print (f"> Audio: {stats['skipped']} videos already extracted")
+            return stats
+
+        # ffmpeg runs are long compared to the dispatch, so files are sent
+        # one at a time to keep every worker busy
+        start = time.perf_counter()
+        timings = []
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            results = executor.map(
+                extract_audio_track,
+                videos,
+                audios,
+                [mode] * len(videos),
+                [sample_rate] * len(videos)
+            )
+
+            for result in tqdm(results, total=len(videos),
+                               desc='Extracting audio', unit='video'):
+                stats['seconds'] += result['seconds']
+                if result['error'] is not None:
+                    stats['failures'] += 1
+                    print (f"Error extracting audio from {result['video']}: {result['error']}")
+                else:
+                    stats['files'] += 1
+
+                timings.append((
+                    result['audio'], result['video'],
+                    os.path.basename(result['video']).split('.')[0],
+                    mode, result['seconds'], result['size'], result['error']
+                ))
+
+        if self.sql_database is not None:
+            self.sql_database.insert_audio_extractions(timings)
+
+        elapsed = time.perf_counter() - start
+        print (
+            f"> Audio ({mode}): {stats['files']} extracted, "
+            f"{stats['skipped']} already extracted, {stats['failures']} "
+            f"failures, {elapsed:.1f}s ({stats['seconds']:.1f}s of ffmpeg "
+            f"time on {max_workers or os.cpu_count()} workers)"
+        )
+
+        return stats
+
+    def _outdated_frames(self, post_ids: List[str],
+                         frame_options: Dict) -> List[str]:
+        '''
+        Finds the videos whose frames were sampled with other settings,
+        according to the run database. Videos of runs that did not record
+        their settings were sampled with the defaults.
+
+        :param post_ids: The post IDs of the videos.
+        :param frame_options: The settings built by build_frame_options.
+        :return: The post IDs of the videos to sample again.
+        '''
+        if self.sql_database is None:
+            return []
+
+        settings = frame_settings_key(frame_options)
+        default = frame_settings_key(build_frame_options())
+        previous = self.sql_database.get_frame_settings()
+
+        return [i for i in post_ids if (previous.get(i) or default) != settings]
 
-        # extract audio from each video
+    def postprocess_videos(self, output: str, files: List[str] = None,
+                           audio_mode: str = None, frame_options: Dict = None,
+                           max_workers: int = None,
+                           sample_rate: int = 16000) -> Dict[str, Optional[str]]:
+        '''
+        Writes the sampled frames, the audio and the probe metadata of videos
+        with one ffmpeg process per video, so each file is read and demuxed once.
+        Jobs run on a process pool; the decoder threads of each job are
+        sized so that all jobs together use every CPU core once. Outputs that
+        already exist are not written again, except frames sampled with
+        other settings, which are replaced.
+
+        :param output: The directory path of the collection.
+        :param files: Optional video paths. Defaults to every downloaded
+            video.
+        :param audio_mode: 'mp3', 'copy' or 'wav' to write the audio to
+            'downloaded_audios', or None for frames only.
+        :param frame_options: The frame sampling settings built by
+            build_frame_options. Defaults to every keyframe as JPEG.
+        :param max_workers: Maximum number of simultaneous ffmpeg processes.
+            Defaults to the number of CPUs.
+        :param sample_rate: Sample rate of the 'wav' mode in Hz.
+        :return: A dictionary mapping every video to its error, or None if
+            it was processed.
+        '''
+        if audio_mode is not None and audio_mode not in AUDIO_EXTRACTION_MODES:
+            raise ValueError(f'Unsupported audio extraction mode: {audio_mode}')
+
+        if files is None:
+            files = [
+                i for i in glob.glob(f'{output}/downloaded_videos/*.mp4')
+                if os.path.basename(i).count('.') == 1
+            ]
+
+        frame_options = frame_options or build_frame_options()
+        settings = frame_settings_key(frame_options)
+        outdated = set(self._outdated_frames(
+            [os.path.basename(i).split('.')[0] for i in files], frame_options
+        ))
+        audio_path = f'{output}/downloaded_audios'
+        if audio_mode is not None and not os.path.exists(audio_path):
+            os.makedirs(audio_path)
+
+        # outputs still missing for every video
+        jobs = []
+        resampled = 0
         for file in files:
-            try:
-                # get id from video filename
-                video_id = os.path.basename(file).split('.')[0]
+            post_id = os.path.basename(file).split('.')[0]
+            audio = None
+            if audio_mode is not None:
+                audio = f'{audio_path}/{post_id}.{AUDIO_EXTRACTION_MODES[audio_mode]}'
+                if os.path.exists(audio):
+                    audio = None
+
+            keyframes_dir = f'{output}/keyframes/{post_id}'
+            pattern = f"{keyframes_dir}/keyframe_%04d.{frame_options['image_format']}"
+            if os.path.isdir(keyframes_dir) and os.listdir(keyframes_dir):
+                if post_id in outdated:
+                    # frames of other settings are replaced
+                    shutil.rmtree(keyframes_dir)
+                    resampled += 1
+                else:
+                    pattern = None
+
+            if audio is not None or pattern is not None:
+                jobs.append((file, audio, pattern))
+
+        errors = {file: None for file in files}
+        if not jobs:
+            return errors
 
-                # FFmpeg command to extract audio
-                cmd = [
-                    'ffmpeg',
-                    '-i', file,
-                    '-q:a', '0',
-                    '-map', 'a',
-                    '-y',
-                    f'{audio_path}/{video_id}.mp3'
-                ]
+        if resampled:
+            print (
+                f'> {resampled} videos sampled with other frame settings '
+                f'are sampled again'
+            )
 
-                subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            except Exception as e:
-                print (f'Error extracting audio: {e}')
+        # ffmpeg decodes with several threads, so fewer jobs than cores
+        # each get a share of the rest
+        cpus = os.cpu_count() or 1
+        workers = min(max_workers or cpus, len(jobs))
+        threads = max(1, cpus // workers)
 
-    def extract_keyframes_from_videos(self, output: str, max_concurrent: int) -> None:
+        probes, timings = [], []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    postprocess_video, file, audio, audio_mode or 'copy',
+                    pattern, frame_options, sample_rate, threads
+                )
+                for file, audio, pattern in jobs
+            ]
+
+            for future, (file, audio, pattern) in tqdm(
+                    zip(futures, jobs), total=len(jobs),
+                    desc='Post-processing videos', unit='video'
+                ):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[file] = str(e)
+                    print (f'Error post-processing {file}: {e}')
+                    continue
+
+                post_id = os.path.basename(file).split('.')[0]
+                errors[file] = result['error']
+                if result['error'] is not None:
+                    print (f"Error post-processing {file}: {result['error']}")
+
+                if result['probe'] is not None:
+                    # settings of the frames written by this run
+                    frames_written = pattern is not None and result['error'] is None
+                    probe = result['probe']
+                    probes.append((
+                        file, post_id, probe['duration'], probe['bitrate'],
+                        probe['video_codec'], probe['width'], probe['height'],
+                        probe['fps'], probe['audio_codec'],
+                        probe['sample_rate'], probe['channels'],
+                        result['keyframes'], result['seconds'],
+                        settings if frames_written else None
+                    ))
+
+                if audio is not None:
+                    size = os.path.getsize(audio) if result['audio'] else None
+                    timings.append((
+                        audio, file, post_id, audio_mode, result['seconds'],
+                        size, result['error']
+                    ))
+
+        if self.sql_database is not None:
+            self.sql_database.insert_media_probes(probes)
+            self.sql_database.insert_audio_extractions(timings)
+
+        return errors
+
+    def run_keyframe_jobs(self, output: str, max_concurrent: int,
+                          worker: str, lease_seconds: float = 900,
+                          queue_existing: bool = False,
+                          engine: str = 'skip', audio_mode: str = None,
+                          sample_rate: int = 16000,
+                          frame_options: Dict = None) -> int:
         '''
-        Extracts keyframes from video files.
+        Post-processes the videos queued as 'keyframes' jobs in the run
+        database, claiming them in batches with a lease so that several
+        workers can share the queue. Each video is read once by a single
+        ffmpeg process writing its keyframes, its probe metadata and,
+        optionally, its audio. Finished jobs of videos sampled with other
+        frame settings are queued again along with the existing videos.
 
-        :param output: The directory path where keyframes will be saved.
+        :param output: The directory path of the collection.
         :param max_concurrent: Maximum number of concurrent ffmpeg processes.
+        :param worker: The identifier of the worker.
+        :param lease_seconds: Time after which jobs not finished by the
+            worker may be claimed by others.
+        :param queue_existing: Whether to queue first every video already in
+            downloaded_videos, e.g. those of runs without a job queue.
+        :param engine: The keyframe extraction engine: 'skip' or 'select'.
+        :param audio_mode: 'mp3', 'copy' or 'wav' to also write the audio, or
+            None.
+        :param sample_rate: Sample rate of the 'wav' audio mode in Hz.
+        :param frame_options: The frame sampling settings built by
+            build_frame_options. Defaults to every keyframe, extracted with
+            `engine`, as JPEG.
+        :return: The number of jobs run.
         '''
-        # build keyframes path
-        keyframes_path = f'{output}/keyframes'
-        if not os.path.exists(keyframes_path):
-            os.makedirs(keyframes_path)
+        if queue_existing:
+            # completed downloads only: '<post_id>.mp4', not yt-dlp's
+            # '<post_id>.f<format>.mp4' intermediate files
+            videos = [
+                f'downloaded_videos/{os.path.basename(i)}'
+                for i in glob.glob(f'{output}/downloaded_videos/*.mp4')
+                if os.path.basename(i).count('.') == 1
+            ]
+            self.sql_database.enqueue_download_jobs(videos, job_type='keyframes')
 
-        # get all video files
-        path = f'{output}/downloaded_videos'
-        files = glob.glob(f'{path}/*.mp4')
+        frame_options = frame_options or build_frame_options(engine=engine)
+        if queue_existing:
+            # videos sampled with other frame settings
+            post_ids = {os.path.basename(i).split('.')[0]: i for i in videos}
+            outdated = self._outdated_frames(list(post_ids), frame_options)
+            count = self.sql_database.requeue_done_download_jobs(
+                [post_ids[i] for i in outdated], job_type='keyframes'
+            )
+            if count:
+                print (f'> {count} videos queued again for the new frame settings')
 
-        # videos ids already processed
-        processed_videos = [i.split('\\')[-1] for i in glob.glob(f'{keyframes_path}/*')]
+        batch_size = max_concurrent * 4
+        count = 0
+        try:
+            while True:
+                videos = self.sql_database.claim_download_jobs(
+                    worker=worker, limit=batch_size,
+                    lease_seconds=lease_seconds, job_type='keyframes'
+                )
+                if not videos:
+                    break
 
-        async def extract_keyframes(file, pbar):
-            try:
-                # get id from video filename
-                video_id = os.path.basename(file).split('.')[0]
-                if video_id not in processed_videos:
-                    # create subdirectory for this video_id
-                    video_keyframes_dir = f'{keyframes_path}/{video_id}'
-                    if not os.path.exists(video_keyframes_dir):
-                        os.makedirs(video_keyframes_dir)
-                    
-                    # FFmpeg command to extract keyframes
-                    cmd = [
-                        'ffmpeg',
-                        '-i', file,
-                        '-vf', 'select=eq(pict_type\\,I)',
-                        '-vsync', 'vfr',
-                        '-q:v', '2',
-                        f'{video_keyframes_dir}/keyframe_%04d.jpg'
-                    ]
-
-                    # run FFmpeg as async subprocess
-                    process = await asyncio.create_subprocess_exec(
-                        *cmd,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE
+                errors = self.postprocess_videos(
+                    output=output, files=[f'{output}/{i}' for i in videos],
+                    audio_mode=audio_mode,
+                    frame_options=frame_options,
+                    max_workers=max_concurrent, sample_rate=sample_rate
+                )
+                for video in videos:
+                    self.sql_database.finish_download_job(
+                        video, worker, errors.get(f'{output}/{video}')
                     )
-                    await process.communicate()
-            except Exception as e:
-                print (f'Error extracting keyframes: {e}')
-            finally:
-                pbar.update(1)
-
-        async def process_all_videos():
-            # create progress bar in the main thread
-            pbar = tqdm(total=len(files), desc='Extracting keyframes', unit='video')
-            
-            # use semaphore to limit concurrent processes
-            semaphore = asyncio.Semaphore(max_concurrent)
-            
-            async def process_with_semaphore(file):
-                async with semaphore:
-                    await extract_keyframes(file, pbar)
-            
-            # create tasks for all videos
-            tasks = [process_with_semaphore(file) for file in files]
-            await asyncio.gather(*tasks)
-            
-            pbar.close()
-
-        # run the async event loop
-        self.loop.run_until_complete(process_all_videos())
+
+                count += len(videos)
+        except KeyboardInterrupt:
+            self.sql_database.release_download_jobs(worker)
+            raise
+
+        return count
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import os
+import threading
+
+# typing
+from typing import Dict, List
+
+# Tor circuit pool class
+class TorCircuitPool:
+    '''
+    TorCircuitPool
+
+    This class gives every download worker its own Tor circuit. Tor isolates
+    streams by SOCKS credentials (IsolateSOCKSAuth, on by default), so each
+    worker connects with its own username and is spread over the configured
+    SocksPorts. Renewing a worker's circuit only changes its password: the
+    next connection gets a fresh circuit without NEWNYM, without waiting and
+    without touching the circuits of the other workers. A circuit that fails
+    several requests in a row is renewed by the pool.
+    '''
+    def __init__(self, socks_ports: List[int] = None,
+                 host: str = '127.0.0.1', max_failures: int = 2) -> None:
+        '''
+        Initializes the TorCircuitPool.
+
+        :param socks_ports: The Tor SocksPorts workers are spread over.
+            Default is [9050].
+        :param host: The host of the Tor SOCKS proxy.
+        :param max_failures: The consecutive failures after which a circuit
+            is renewed. Default is 2.
+        '''
+        self.host = host
+        self.socks_ports = list(socks_ports or [9050])
+        self.max_failures = max_failures
+
+        # circuit of each worker thread
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._next_worker = 0
+        self.circuits = {}
+
+    def _circuit(self) -> Dict:
+        '''
+        Returns the circuit of the calling thread, assigning one on first
+        use.
+
+        :return: A dictionary with the circuit settings and health counters.
+        '''
+        circuit = getattr(self._local, 'circuit', None)
+        if circuit is None:
+            pid = os.getpid()
+            with self._lock:
+                worker = self._next_worker
+                self._next_worker += 1
+
+                # worker processes have one thread each, so the process id
+                # also offsets the port
+                port = self.socks_ports[(worker + pid) % len(self.socks_ports)]
+                circuit = {
+                    'username': f'tikspyder-{pid}-{worker}',
+                    'port': port,
+                    'generation': 0,
+                    'requests': 0,
+                    'failures': 0,
+                    'consecutive_failures': 0,
+                    'renewals': 0
+                }
+                self.circuits[circuit['username']] = circuit
+
+            self._local.circuit = circuit
+
+        return circuit
+
+    def proxy_url(self, port: int, username: str, password: str) -> str:
+        '''
+        Builds the URL of a Tor SOCKS proxy with isolation credentials.
+
+        :param port: The SocksPort.
+        :param username: The SOCKS username.
+        :param password: The SOCKS password.
+        :return: The proxy URL.
+        '''
+        return f'socks5://{username}:{password}@{self.host}:{port}'
+
+    def proxy(self) -> str:
+        '''
+        Returns the proxy URL of the calling thread's circuit.
+
+        :return: The proxy URL.
+        '''
+        circuit = self._circuit()
+        return self.proxy_url(
+            circuit['port'], circuit['username'], str(circuit['generation'])
+        )
+
+    def renew(self) -> None:
+        '''
+        Moves the calling thread to a new circuit. Connections opened with
+        the previous proxy URL keep their circuit, so the caller must drop
+        them.
+        '''
+        circuit = self._circuit()
+        with self._lock:
+            circuit['generation'] += 1
+            circuit['renewals'] += 1
+            circuit['consecutive_failures'] = 0
+
+    def report_result(self, success: bool) -> bool:
+        '''
+        Records the outcome of a request made on the calling thread's
+        circuit, and renews the circuit once it reaches max_failures
+        consecutive failures.
+
+        :param success: Whether the request succeeded.
+        :return: True if the circuit was renewed, so the caller must drop
+            the connections of the previous one.
+        '''
+        circuit = self._circuit()
+        with self._lock:
+            circuit['requests'] += 1
+            if success:
+                circuit['consecutive_failures'] = 0
+                return False
+
+            circuit['failures'] += 1
+            circuit['consecutive_failures'] += 1
+            if circuit['consecutive_failures'] < self.max_failures:
+                return False
+
+        self.renew()
+        return True
+
+    def snapshot(self) -> Dict:
+        '''
+        Returns a copy of the calling thread's circuit, so that worker
+        processes can send their counters back to the parent.
+
+        :return: A dictionary with the circuit settings and health counters.
+        '''
+        circuit = self._circuit()
+        with self._lock:
+            return dict(circuit)
+
+    def merge(self, circuit: Dict) -> None:
+        '''
+        Records the counters of a circuit of another process. Counters are
+        cumulative, so the latest snapshot of a circuit replaces the
+        previous one.
+
+        :param circuit: A dictionary returned by snapshot.
+        '''
+        with self._lock:
+            self.circuits[circuit['username']] = circuit
+
+    def report(self) -> None:
+        '''
+        Prints the requests, failures and renewals of the circuits, per
+        SocksPort.
+        '''
+        with self._lock:
+            circuits = list(self.circuits.values())
+
+        if not circuits:
+            return
+
+        print (f'> Tor circuits: {len(circuits)} workers')
+        for port in self.socks_ports:
+            on_port = [i for i in circuits if i['port'] == port]
+            if not on_port:
+                continue
+
+            requests = sum(i['requests'] for i in on_port)
+            failures = sum(i['failures'] for i in on_port)
+            renewals = sum(i['renewals'] for i in on_port)
+            rate = failures / requests * 100 if requests else 0
+            print (
+                f'  port {port}: {len(on_port)} workers, {requests} requests, '
+                f'{failures} failures ({rate:.1f}%), {renewals} renewals'
+            )
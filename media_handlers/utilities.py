@@ -0,0 +1,674 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import os
+import re
+import json
+import time
+import shutil
+import subprocess
+import importlib.util
+
+# typing
+from typing import Dict, List, Optional, Tuple
+
+# image normalization requires the optional Pillow package
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# file extensions of the image formats served by the CDNs
+IMAGE_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/pjpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+    'image/heic': 'heic',
+    'image/heif': 'heic',
+    'image/avif': 'avif'
+}
+
+# Pillow format names of the normalized thumbnail formats
+THUMBNAIL_FORMATS = {
+    'webp': 'WEBP',
+    'jpg': 'JPEG',
+    'png': 'PNG'
+}
+
+# yt-dlp format selection of the archival download profile: best quality,
+# no H.265
+ARCHIVAL_FORMAT = '(bv*+ba/b)[vcodec!=?h265]'
+
+# audio extraction modes and their file extensions
+AUDIO_EXTRACTION_MODES = {
+    'mp3': 'mp3',
+    'copy': 'm4a',
+    'wav': 'wav'
+}
+
+# keyframe extraction engines
+KEYFRAME_ENGINES = ('skip', 'select')
+
+# frame sampling modes of the keyframe stage
+FRAME_SAMPLING_MODES = ('keyframes', 'scene', 'interval', 'uniform')
+
+# image formats of sampled frames
+FRAME_FORMATS = ('jpg', 'webp')
+
+# download profiles and their yt-dlp format options; {height} is the
+# height filter and {max_height} the height cap of the profile
+DOWNLOAD_PROFILES = {
+    'archival': {'format': ARCHIVAL_FORMAT},
+    'lightweight': {
+        'format': (
+            'b{height}[vcodec!=?h265]/'
+            'bv*{height}[vcodec!=?h265]+ba/'
+            'b{height}/b'
+        ),
+        'format_sort': ['res:{max_height}']
+    }
+}
+
+'''
+Download profiles
+
+'''
+def build_format_options(profile: str, max_height: int = 480) -> Dict:
+    '''
+    Builds the yt-dlp format options of a download profile. The archival
+    profile fetches the best quality, muxing separate video and audio
+    streams when needed; the lightweight profile caps the height and
+    prefers progressive formats, which need no mux step.
+
+    :param profile: The download profile, one of DOWNLOAD_PROFILES.
+    :param max_height: Maximum video height of the lightweight profile.
+    :return: A dictionary of yt-dlp options.
+    '''
+    if profile not in DOWNLOAD_PROFILES:
+        raise ValueError(f'Unsupported download profile: {profile}')
+
+    options = DOWNLOAD_PROFILES[profile]
+    height = f'[height<=?{max_height}]'
+    format_options = {'format': options['format'].format(height=height)}
+    if 'format_sort' in options:
+        format_options['format_sort'] = [
+            i.format(max_height=max_height) for i in options['format_sort']
+        ]
+
+    return format_options
+
+'''
+Detect image formats
+
+'''
+def detect_image_extension(header: bytes, content_type: str = None) -> Optional[str]:
+    '''
+    Detects the file extension of an image from its first bytes, falling
+    back to the Content-Type response header.
+
+    :param header: The first bytes of the file (at least 12).
+    :param content_type: Optional Content-Type of the response.
+    :return: The file extension, e.g. 'jpg', or None if unknown.
+    '''
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[4:8] == b'ftyp':
+        brand = header[8:12]
+        if brand in (b'avif', b'avis'):
+            return 'avif'
+        if brand in (b'heic', b'heix', b'heim', b'heis', b'mif1', b'msf1'):
+            return 'heic'
+
+    if content_type:
+        return IMAGE_CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+
+    return None
+
+'''
+Normalize thumbnails
+
+'''
+def normalize_image(path: str, image_format: str, max_size: int,
+                    quality: int = 80) -> Dict:
+    '''
+    Re-encodes an image to the given format, downscaled to fit within
+    `max_size` pixels. Runs in a worker process.
+
+    The normalized image is written next to the original with a
+    '.normalized' suffix; the caller decides what to do with the original.
+
+    :param path: Path of the image.
+    :param image_format: Target file extension: 'webp', 'jpg' or 'png'.
+    :param max_size: Maximum width and height in pixels.
+    :param quality: Encoder quality for lossy formats.
+    :return: A dictionary with the original 'path', the 'output' path (None
+        if the image was left unchanged) and its 'size', or an 'error'.
+    '''
+    from PIL import Image
+
+    result = {'path': path, 'output': None, 'size': None, 'error': None}
+    try:
+        with Image.open(path) as image:
+            current_format = (image.format or '').upper()
+            if current_format == THUMBNAIL_FORMATS[image_format] and \
+                    max(image.size) <= max_size and \
+                    path.endswith(f'.{image_format}'):
+                return result
+
+            image.thumbnail((max_size, max_size))
+            if image_format == 'jpg' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            output = f'{os.path.splitext(path)[0]}.normalized.{image_format}'
+            image.save(
+                output,
+                format=THUMBNAIL_FORMATS[image_format],
+                quality=quality,
+                optimize=True
+            )
+
+        result['output'] = output
+        result['size'] = os.path.getsize(output)
+    except Exception as e:
+        result['error'] = str(e) or repr(e)
+
+    return result
+
+'''
+ffmpeg commands
+
+'''
+def build_audio_codec_options(mode: str, sample_rate: int = 16000) -> List[str]:
+    '''
+    Builds the ffmpeg codec and format options of an audio output.
+
+    :param mode: 'mp3', 'copy' (stream copy into M4A), 'aac' or 'wav' (mono
+        16-bit PCM, the input expected by most speech and audio analysis
+        tools).
+    :param sample_rate: Sample rate of the 'wav' mode in Hz.
+    :return: The options as a list of arguments.
+    '''
+    return {
+        'mp3': ['-c:a', 'libmp3lame', '-q:a', '0', '-f', 'mp3'],
+        'copy': ['-c:a', 'copy', '-f', 'mp4'],
+        'aac': ['-c:a', 'aac', '-b:a', '128k', '-f', 'mp4'],
+        'wav': [
+            '-ac', '1', '-ar', str(sample_rate), '-c:a', 'pcm_s16le',
+            '-f', 'wav'
+        ]
+    }[mode]
+
+def audio_codec_attempts(mode: str) -> List[str]:
+    '''
+    Returns the audio modes to try in turn: a stream that cannot be copied
+    is re-encoded to AAC.
+
+    :param mode: 'mp3', 'copy', 'aac' or 'wav'.
+    :return: The modes, in order.
+    '''
+    return [mode, 'aac'] if mode == 'copy' else [mode]
+
+def build_audio_command(video: str, audio: str, mode: str,
+                        sample_rate: int = 16000) -> List[str]:
+    '''
+    Builds the ffmpeg command that writes the audio stream of a video.
+
+    :param video: Path of the video.
+    :param audio: Path of the audio file to write.
+    :param mode: 'mp3', 'copy', 'aac' or 'wav'.
+    :param sample_rate: Sample rate of the 'wav' mode in Hz.
+    :return: The command as a list of arguments.
+    '''
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-i', video,
+        '-map', '0:a:0',
+        '-vn',
+        *build_audio_codec_options(mode, sample_rate),
+        '-y', audio
+    ]
+
+def build_keyframes_command(video: str, pattern: str,
+                            engine: str = 'skip') -> List[str]:
+    '''
+    Builds the ffmpeg command that saves the keyframes of a video as JPEG
+    images.
+
+    The 'select' engine decodes every frame and keeps the I-frames with a
+    filter. The 'skip' engine tells the decoder to skip every frame that is
+    not a keyframe, so only keyframes are decoded; it is several times
+    faster and yields the same images for TikTok's H.264 streams, whose
+    I-frames are keyframes.
+
+    :param video: Path of the video.
+    :param pattern: Output path pattern, e.g. '<dir>/keyframe_%04d.jpg'.
+    :param engine: 'skip' or 'select'.
+    :return: The command as a list of arguments.
+    '''
+    if engine not in KEYFRAME_ENGINES:
+        raise ValueError(f'Unsupported keyframe engine: {engine}')
+
+    if engine == 'select':
+        return [
+            'ffmpeg',
+            '-i', video,
+            '-vf', 'select=eq(pict_type\\,I)',
+            '-vsync', 'vfr',
+            '-q:v', '2',
+            '-y', pattern
+        ]
+
+    return [
+        'ffmpeg',
+        '-skip_frame', 'nokey',
+        '-i', video,
+        '-vsync', 'vfr',
+        '-q:v', '2',
+        '-y', pattern
+    ]
+
+def extract_audio_track(video: str, audio: str, mode: str,
+                        sample_rate: int = 16000) -> Dict:
+    '''
+    Extracts the audio track of a video with ffmpeg. Runs in a worker
+    process. The 'copy' mode copies the stream into an M4A file and falls
+    back to AAC when the stream cannot be copied.
+
+    The audio is written to a '.part' file first, so an interrupted run
+    leaves no incomplete audio behind.
+
+    :param video: Path of the video.
+    :param audio: Path of the audio file to write.
+    :param mode: Extraction mode: 'mp3', 'copy' or 'wav'.
+    :param sample_rate: Sample rate of the 'wav' mode in Hz.
+    :return: A dictionary with the 'video' and 'audio' paths, the 'mode',
+        the 'seconds' spent, the 'size' of the audio, and the 'error' or None.
+    '''
+    result = {
+        'video': video, 'audio': audio, 'mode': mode,
+        'seconds': 0.0, 'size': None, 'error': None
+    }
+
+    temp = f'{audio}.part'
+    start = time.perf_counter()
+    for attempt in audio_codec_attempts(mode):
+        cmd = build_audio_command(video, temp, attempt, sample_rate)
+        try:
+            process = subprocess.run(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            result['error'] = str(e)
+            break
+
+        if process.returncode == 0:
+            os.replace(temp, audio)
+            result['size'] = os.path.getsize(audio)
+            result['error'] = None
+            break
+
+        result['error'] = process.stderr.decode('utf-8', errors='replace').strip() \
+            or f'ffmpeg exited with code {process.returncode}'
+
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    if result['error'] is not None and os.path.exists(temp):
+        os.remove(temp)
+
+    return result
+
+'''
+Single-pass post-processing
+
+'''
+def build_frame_options(sampling: str = 'keyframes', engine: str = 'skip',
+                        scene_threshold: float = 0.3, interval: float = 2.0,
+                        frames: int = 10, max_frames: int = None,
+                        image_format: str = 'jpg', quality: int = None,
+                        max_width: int = None) -> Dict:
+    '''
+    Builds the frame sampling settings of the keyframe stage.
+
+    :param sampling: 'keyframes' (every keyframe), 'scene' (frames whose
+        scene-change score exceeds the threshold), 'interval' (one frame
+        every `interval` seconds) or 'uniform' (`frames` frames spread over
+        the video).
+    :param engine: The keyframe extraction engine of the 'keyframes' mode:
+        'skip' or 'select'.
+    :param scene_threshold: Scene-change score, from 0 to 1, of the 'scene'
+        mode.
+    :param interval: Seconds between frames of the 'interval' mode.
+    :param frames: Number of frames per video of the 'uniform' mode.
+    :param max_frames: Maximum number of frames per video, or None.
+    :param image_format: 'jpg' or 'webp'.
+    :param quality: Image quality from 1 to 100. Defaults to ffmpeg's
+        highest JPEG quality and a WebP quality of 80.
+    :param max_width: Maximum width in pixels; larger frames are downscaled.
+    :return: A dictionary with the settings.
+    '''
+    if sampling not in FRAME_SAMPLING_MODES:
+        raise ValueError(f'Unsupported frame sampling mode: {sampling}')
+
+    if image_format not in FRAME_FORMATS:
+        raise ValueError(f'Unsupported frame format: {image_format}')
+
+    if engine not in KEYFRAME_ENGINES:
+        raise ValueError(f'Unsupported keyframe engine: {engine}')
+
+    return {
+        'sampling': sampling,
+        'engine': engine,
+        'scene_threshold': scene_threshold,
+        'interval': interval,
+        'frames': frames,
+        'max_frames': max_frames,
+        'image_format': image_format,
+        'quality': quality,
+        'max_width': max_width
+    }
+
+def frame_settings_key(frame_options: Dict) -> str:
+    '''
+    Serializes the frame settings that change the saved images, so that
+    frames sampled with other settings can be told apart. The engine and
+    the options of other sampling modes are left out.
+
+    :param frame_options: The settings built by build_frame_options.
+    :return: The settings as a JSON string.
+    '''
+    sampling = frame_options['sampling']
+    mode_options = {
+        'keyframes': [],
+        'scene': ['scene_threshold'],
+        'interval': ['interval'],
+        'uniform': ['frames']
+    }[sampling]
+    keys = ['sampling', *mode_options, 'max_frames', 'image_format',
+            'quality', 'max_width']
+
+    return json.dumps({i: frame_options[i] for i in keys}, sort_keys=True)
+
+def build_frame_output_options(frame_options: Dict,
+                               duration: float = None) -> Tuple[List[str], List[str]]:
+    '''
+    Builds the ffmpeg input and output options that sample the frames of a
+    video.
+
+    :param frame_options: The settings built by build_frame_options.
+    :param duration: Duration of the video in seconds, needed by the
+        'uniform' mode and to spread max_frames over the video. Without
+        it, the first max_frames frames are kept.
+    :return: The input options, placed before '-i', and the output options.
+    '''
+    sampling = frame_options['sampling']
+    input_options, filters = [], []
+    max_frames = frame_options['max_frames']
+
+    # with a frame cap, frames are kept at least duration / max_frames
+    # seconds apart, so they span the whole video instead of its opening
+    gap = duration / max_frames if max_frames and duration else None
+    spread = f'(isnan(prev_selected_t)+gte(t-prev_selected_t\\,{gap:.3f}))' \
+        if gap else None
+
+    if sampling == 'keyframes':
+        # the decoders skip non-key frames; every audio frame is a key
+        # frame, so the audio is unaffected
+        if frame_options['engine'] == 'skip':
+            input_options += ['-skip_frame', 'nokey']
+            if spread:
+                filters.append(f'select={spread}')
+        else:
+            select = 'eq(pict_type\\,I)'
+            filters.append(f'select={select}*{spread}' if spread else f'select={select}')
+    elif sampling == 'scene':
+        # the first frame, then every scene change
+        select = f"(eq(n\\,0)+gt(scene\\,{frame_options['scene_threshold']}))"
+        filters.append(f'select={select}*{spread}' if spread else f'select={select}')
+    elif sampling == 'interval':
+        interval = max(frame_options['interval'], gap or 0)
+        filters.append(f'fps=1/{interval:g}')
+    elif sampling == 'uniform':
+        frames = min(frame_options['frames'], max_frames or frame_options['frames'])
+        filters.append(f'fps={frames}/{duration}' if duration else 'fps=1')
+        max_frames = frames
+
+    if frame_options['max_width']:
+        filters.append(f"scale=min(iw\\,{frame_options['max_width']}):-2")
+
+    output_options = ['-map', '0:v:0']
+    if filters:
+        output_options += ['-vf', ','.join(filters)]
+
+    output_options += ['-vsync', 'vfr']
+    if max_frames:
+        output_options += ['-frames:v', str(max_frames)]
+
+    # quality on a 1 to 100 scale: JPEG maps it to ffmpeg's 31 to 2 scale
+    quality = frame_options['quality']
+    if frame_options['image_format'] == 'webp':
+        output_options += ['-c:v', 'libwebp', '-quality', str(quality or 80)]
+    else:
+        q = 2 if quality is None else round(31 - (min(100, max(1, quality)) - 1) * 29 / 99)
+        output_options += ['-q:v', str(q)]
+
+    return input_options, output_options
+
+def build_postprocess_command(video: str, audio: str = None,
+                              audio_mode: str = 'copy', pattern: str = None,
+                              frame_options: Dict = None,
+                              sample_rate: int = 16000, threads: int = 0,
+                              duration: float = None) -> List[str]:
+    '''
+    Builds one ffmpeg command that opens a video once and writes its audio
+    and its sampled frames as separate outputs. The input details ffmpeg
+    logs on stderr serve as probe metadata.
+
+    :param video: Path of the video.
+    :param audio: Path of the audio file to write, or None.
+    :param audio_mode: 'mp3', 'copy', 'aac' or 'wav'.
+    :param pattern: Frames path pattern, e.g. '<dir>/keyframe_%04d.jpg', or
+        None.
+    :param frame_options: The settings built by build_frame_options.
+        Defaults to every keyframe as JPEG.
+    :param sample_rate: Sample rate of the 'wav' mode in Hz.
+    :param threads: Decoder threads, 0 to let ffmpeg decide.
+    :param duration: Duration of the video in seconds, needed by the
+        'uniform' sampling mode.
+    :return: The command as a list of arguments.
+    '''
+    input_options, output_options = [], []
+    if pattern is not None:
+        input_options, output_options = build_frame_output_options(
+            frame_options or build_frame_options(), duration
+        )
+
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'info',
+        '-threads', str(threads), *input_options, '-i', video
+    ]
+    if audio is not None:
+        cmd += [
+            '-map', '0:a:0', '-vn',
+            *build_audio_codec_options(audio_mode, sample_rate),
+            '-y', audio
+        ]
+
+    if pattern is not None:
+        cmd += [*output_options, '-y', pattern]
+
+    return cmd
+
+def probe_video(video: str) -> Dict:
+    '''
+    Reads the probe metadata of a video from the header ffmpeg logs when it
+    is run without outputs. No frame is decoded.
+
+    :param video: Path of the video.
+    :return: A dictionary of probe fields; fields not found are None.
+    '''
+    process = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-i', video],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    return parse_ffmpeg_probe(process.stderr.decode('utf-8', errors='replace'))
+
+def parse_ffmpeg_probe(stderr: str) -> Dict:
+    '''
+    Reads the duration, bitrate and first video and audio streams of the
+    input from the log ffmpeg writes at the 'info' level.
+
+    :param stderr: The standard error of ffmpeg.
+    :return: A dictionary of probe fields; fields not found are None.
+    '''
+    probe = {
+        'duration': None, 'bitrate': None, 'video_codec': None,
+        'width': None, 'height': None, 'fps': None, 'audio_codec': None,
+        'sample_rate': None, 'channels': None
+    }
+
+    # the input section ends where the outputs are described
+    text = re.split(r'^(?:Output #0|Stream mapping)', stderr, maxsplit=1,
+                    flags=re.M)[0]
+
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', text)
+    if match:
+        h, m, sec = match.groups()
+        probe['duration'] = int(h) * 3600 + int(m) * 60 + float(sec)
+
+    match = re.search(r'Duration:.*bitrate: (\d+) kb/s', text)
+    if match:
+        probe['bitrate'] = int(match.group(1))
+
+    match = re.search(r'Stream #0:\d+.*?: Video: (\w+).*', text)
+    if match:
+        probe['video_codec'] = match.group(1)
+        line = match.group(0)
+        size = re.search(r', (\d{2,5})x(\d{2,5})', line)
+        if size:
+            probe['width'], probe['height'] = int(size.group(1)), int(size.group(2))
+
+        fps = re.search(r', (\d+(?:\.\d+)?) fps', line)
+        if fps:
+            probe['fps'] = float(fps.group(1))
+
+    match = re.search(r'Stream #0:\d+.*?: Audio: (\w+).*', text)
+    if match:
+        probe['audio_codec'] = match.group(1)
+        line = match.group(0)
+        rate = re.search(r', (\d+) Hz', line)
+        if rate:
+            probe['sample_rate'] = int(rate.group(1))
+
+        channels = re.search(r'Hz, ([^,]+)', line)
+        if channels:
+            probe['channels'] = channels.group(1).strip()
+
+    return probe
+
+def postprocess_video(video: str, audio: str = None, audio_mode: str = 'copy',
+                      pattern: str = None, frame_options: Dict = None,
+                      sample_rate: int = 16000, threads: int = 0) -> Dict:
+    '''
+    Writes the audio and the sampled frames of a video with a single ffmpeg
+    process. Runs in a worker process. In the 'copy' mode, streams that
+    cannot be copied are re-encoded to AAC; videos without an audio stream
+    still get their keyframes.
+
+    The audio is written to a '.part' file first and the keyframes of a
+    failed run are removed, so an interrupted job leaves nothing behind.
+
+    :param video: Path of the video.
+    :param audio: Path of the audio file to write, or None.
+    :param audio_mode: 'mp3', 'copy' or 'wav'.
+    :param pattern: Frames path pattern, or None.
+    :param frame_options: The settings built by build_frame_options.
+    :param sample_rate: Sample rate of the 'wav' mode in Hz.
+    :param threads: Decoder threads, 0 to let ffmpeg decide.
+    :return: A dictionary with the 'video', 'audio' (None if not written)
+        and 'keyframes' (frames) count, the 'probe' metadata, the 'seconds' spent and
+        the 'error' or None.
+    '''
+    result = {
+        'video': video, 'audio': None, 'keyframes': 0, 'probe': None,
+        'seconds': 0.0, 'error': None
+    }
+
+    temp = f'{audio}.part' if audio is not None else None
+    keyframes_dir = os.path.dirname(pattern) if pattern is not None else None
+    if keyframes_dir is not None:
+        os.makedirs(keyframes_dir, exist_ok=True)
+
+    start = time.perf_counter()
+
+    # uniform sampling and frame caps spread the frames over the duration,
+    # read from the header first
+    duration = None
+    frame_options = frame_options or build_frame_options()
+    if pattern is not None and (frame_options['sampling'] == 'uniform' or
+                                frame_options['max_frames']):
+        try:
+            duration = probe_video(video)['duration']
+        except OSError:
+            pass
+
+    for mode in audio_codec_attempts(audio_mode):
+        cmd = build_postprocess_command(
+            video, temp, mode, pattern, frame_options, sample_rate, threads,
+            duration
+        )
+        try:
+            process = subprocess.run(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            result['error'] = str(e)
+            break
+
+        stderr = process.stderr.decode('utf-8', errors='replace')
+        result['probe'] = parse_ffmpeg_probe(stderr)
+
+        # no audio stream: keyframes only
+        if process.returncode != 0 and temp is not None and \
+                result['probe']['video_codec'] is not None and \
+                result['probe']['audio_codec'] is None:
+            temp = None
+            if pattern is None:
+                result['error'] = None
+                break
+
+            process = subprocess.run(
+                build_postprocess_command(
+                    video, None, mode, pattern, frame_options, sample_rate,
+                    threads, duration
+                ),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            stderr = process.stderr.decode('utf-8', errors='replace')
+
+        if process.returncode == 0:
+            result['error'] = None
+            if temp is not None:
+                os.replace(temp, audio)
+                result['audio'] = audio
+            break
+
+        lines = [i for i in stderr.strip().splitlines() if i.strip()]
+        result['error'] = lines[-1] if lines else \
+            f'ffmpeg exited with code {process.returncode}'
+
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    if result['error'] is not None:
+        if temp is not None and os.path.exists(temp):
+            os.remove(temp)
+
+        if keyframes_dir is not None:
+            shutil.rmtree(keyframes_dir, ignore_errors=True)
+    elif keyframes_dir is not None:
+        result['keyframes'] = len(os.listdir(keyframes_dir))
+
+    return result
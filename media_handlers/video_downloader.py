@@ -3,12 +3,20 @@
 # import modules
 import os
 import time
+import socket
+import requests
+import itertools
+import threading
+
+# download queue
+from collections import deque
 
 # threads
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    FIRST_COMPLETED, as_completed, wait
 
 # typing
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 
 # pathlib
 from pathlib import Path
@@ -18,10 +26,17 @@ from tqdm import tqdm
 
 # yt_dlp module
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+
+# SQLManager
+from databases import SQLDatabaseManager
 
-# stem module
-from stem import Signal
-from stem.control import Controller
+# local dependencies
+from .media_store import MediaStore
+from .tor_pool import TorCircuitPool
+from .concurrency import AIMDController, TokenBucket
+from .utilities import ARCHIVAL_FORMAT, build_format_options, \
+    extract_audio_track
 
 # Video downloader class
 class VideoDownloader:
@@ -29,38 +44,117 @@ class VideoDownloader:
     VideoDownloader class
 
     This class handles the downloading of TikTok videos and their audio using
-    yt-dlp and threading for concurrent downloads.
+    yt-dlp and threading for concurrent downloads. Each worker thread keeps
+    its own YoutubeDL instances for all its URLs.
     '''
-    def __init__(self, output: str, use_tor: bool = False) -> None:
+    def __init__(self, output: str, use_tor: bool = False,
+                 sql_database: SQLDatabaseManager = None,
+                 derive_audio: bool = False, audio_format: str = 'm4a',
+                 audio_workers: int = None,
+                 tor_socks_ports: List[int] = None,
+                 concurrency: AIMDController = None,
+                 download_profile: str = 'archival', max_height: int = 480,
+                 bandwidth_limit: float = None) -> None:
         '''
         Initializes the VideoDownloader with default download options.
         Downloads both video and audio when initialized.
 
         :param output: The original directory path provided by the user
         :param use_tor: Boolean indicating whether to use Tor for downloads
+        :param sql_database: Optional SQLDatabaseManager where downloaded
+            files are indexed.
+        :param derive_audio: Whether to extract the audio from the downloaded
+            video with ffmpeg instead of downloading it a second time.
+        :param audio_format: Format of derived audio: 'm4a' (stream copy,
+            falling back to AAC) or 'mp3'.
+        :param audio_workers: Maximum number of concurrent ffmpeg processes
+            deriving audio. Defaults to the number of CPUs.
+        :param tor_socks_ports: Tor SocksPorts the download workers are
+            spread over. Default is [9050].
+        :param concurrency: Optional AIMDController adapting the number of
+            simultaneous downloads. By default, all workers download at once.
+        :param download_profile: 'archival' (best quality) or 'lightweight'
+            (capped height, progressive formats preferred).
+        :param max_height: Maximum video height of the lightweight profile.
+        :param bandwidth_limit: Optional cap in bytes per second on the
+            combined download rate of all workers.
         '''
-        # initialize Tor proxy settings
+        # downloaded files are deduplicated by content
+        self.output = output
+        self.sql_database = sql_database
+        self.media_store = MediaStore(
+            self._sanitize_output_path(output), sql_database
+        )
+
+        # YoutubeDL instances per worker thread, recreated when the
+        # generation changes, the thread's Tor circuit is renewed or after a
+        # fatal error
+        self._local = threading.local()
+        self._generation = 0
+        self._instances = []
+        self._instances_lock = threading.Lock()
+
+        # audio derived locally from the downloaded video
+        self.derive_audio = derive_audio
+        self.audio_format = audio_format
+        self.audio_workers = audio_workers or os.cpu_count() or 1
+        self.audio_path = f'{self._sanitize_output_path(output)}/downloaded_audios'
+        self._audio_executor = None
+        self._audio_futures = []
+
+        # simultaneous downloads
+        self.concurrency = concurrency
+
+        # jobs of the run database claimed by this downloader
+        self.job_worker = f'{socket.gethostname()}-{os.getpid()}'
+        self.job_lease_seconds = 900
+        self._jobs_claimed = False
+
+        # bytes fetched by yt-dlp; with a lighter profile, also the bytes
+        # the archival profile would have fetched for the same videos
+        self.download_stats = {
+            'videos': 0,
+            'bytes': 0,
+            'seconds': 0.0,
+            'muxed': 0,
+            'estimated_videos': 0,
+            'estimated_bytes': 0,
+            'archival_bytes': 0
+        }
+        self._stats_lock = threading.Lock()
+
+        # format selection and bandwidth shared by the workers
+        self.download_profile = download_profile
+        self.max_height = max_height
+        self.bandwidth_limit = bandwidth_limit
+        self.bandwidth = TokenBucket(bandwidth_limit) if bandwidth_limit else None
+
+        # each worker thread downloads over its own Tor circuit
         self.use_tor = use_tor
-        self.proxy = 'socks5://127.0.0.1:9050'
+        self.tor_pool = TorCircuitPool(socks_ports=tor_socks_ports)
 
-        # Common options for both video and audio
+        # Common options for both video and audio; errors are raised so
+        # that failed jobs keep their error
         common_options = {
             'no_warnings': True,
             'quiet': True,
-            'ignoreerrors': True,
+            'ignoreerrors': False,
             'noprogress': True
         }
 
-        if self.use_tor:
-            common_options['proxy'] = self.proxy
-
         # video download options
         self.video_options = {
             **common_options,
-            'format': '(bv*+ba/b)[vcodec!=?h265]',
+            **build_format_options(download_profile, max_height),
             'outtmpl': self._build_output_directory(output, 'downloaded_videos')
         }
 
+        # format ranking of the archival profile, to estimate its sizes
+        self.archival_options = {
+            **common_options,
+            **build_format_options('archival')
+        }
+
         # audio download options
         self.audio_options = {
             **common_options,
@@ -110,105 +204,674 @@ class VideoDownloader:
         
         return f'{path}/%(id)s.%(ext)s'
 
+    def _get_ydl(self, kind: str) -> YoutubeDL:
+        '''
+        Returns the calling thread's YoutubeDL instance for video or audio
+        downloads, creating it on first use or when the instances of the
+        thread are outdated.
+
+        :param kind: The type of download: 'video' or 'audio', or
+            'archival' for the instance that only ranks formats with the
+            archival profile.
+        :return: A YoutubeDL instance.
+        '''
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            self._reset_thread_instances()
+            local.generation = self._generation
+
+        ydl = local.instances.get(kind)
+        if ydl is None:
+            options = {
+                'video': self.video_options,
+                'audio': self.audio_options,
+                'archival': self.archival_options
+            }[kind]
+            if self.use_tor:
+                options = {**options, 'proxy': self.tor_pool.proxy()}
+
+            ydl = YoutubeDL(options)
+            if self.bandwidth is not None:
+                ydl.add_progress_hook(self._throttle)
+
+            local.instances[kind] = ydl
+            with self._instances_lock:
+                self._instances.append(ydl)
+
+        return ydl
+
+    def _throttle(self, status: Dict) -> None:
+        '''
+        yt-dlp progress hook that takes the bytes received since the last
+        call from the shared bandwidth bucket, slowing the download thread
+        down when the cap is reached.
+
+        :param status: The progress dictionary passed by yt-dlp.
+        '''
+        if status.get('status') != 'downloading':
+            return
+
+        local = self._local
+        filename = status.get('tmpfilename') or status.get('filename')
+        downloaded = status.get('downloaded_bytes') or 0
+        if getattr(local, 'progress_file', None) != filename:
+            local.progress_file = filename
+            local.progress_bytes = 0
+
+        received = downloaded - local.progress_bytes
+        local.progress_bytes = downloaded
+        if received > 0:
+            self.bandwidth.consume(received)
+
+    def _reset_thread_instances(self) -> None:
+        '''
+        Closes the calling thread's YoutubeDL instances so that they are
+        recreated on next use.
+        '''
+        local = self._local
+        for ydl in getattr(local, 'instances', {}).values():
+            # instances already closed by close_instances are skipped
+            with self._instances_lock:
+                is_open = ydl in self._instances
+                if is_open:
+                    self._instances.remove(ydl)
+
+            if is_open:
+                ydl.close()
+
+        local.instances = {}
+
+    def close_instances(self) -> None:
+        '''
+        Closes every YoutubeDL instance created by the worker threads.
+        '''
+        with self._instances_lock:
+            instances, self._instances = self._instances, []
+            self._generation += 1
+
+        for ydl in instances:
+            ydl.close()
+
     def renew_tor_ip(self) -> None:
         '''
-        Requests a new Tor circuit to change the IP address.
+        Moves the calling worker to a new Tor circuit to change its IP
+        address. The worker's YoutubeDL instances are recreated, so no
+        connection of the old circuit is reused; other workers keep their
+        circuits.
         '''
-        try:
-            with Controller.from_port(port=9051) as controller:
-                controller.authenticate()
-                controller.signal(Signal.NEWNYM)
-                time.sleep(5)
-        except Exception as e:
-            print (f'Error renewing Tor IP: {e}')
+        self.tor_pool.renew()
+        self._reset_thread_instances()
 
-    def download_content(self, url: str) -> None:
+    def fetch_content(self, url: str) -> Dict:
         '''
-        Downloads both video and audio from the specified URL using yt-dlp.
+        Downloads the video, and the audio unless it is derived locally, from
+        the specified URL using yt-dlp. Runs in download threads or worker
+        processes, so it does not touch the database.
 
         :param url: The URL of the TikTok video to download.
+        :return: A dictionary with the 'url', the 'video' and 'audio'
+            downloads, each a dictionary with the post 'id' and the 'paths'
+            of the downloaded files, or None, and the last 'error'.
         '''
+        result = {'url': url, 'video': None, 'audio': None, 'error': None}
         max_attempts = 3 if self.use_tor else 1
         for attempt in range(max_attempts):
             try:
                 # download video
-                with YoutubeDL(self.video_options) as ydl:
-                    ydl.download(url)
+                ydl = self._get_ydl('video')
+                info = ydl.extract_info(url, download=True)
+                result['video'] = self._summarize_download(info)
+                if result['video'] and self.download_profile != 'archival':
+                    result['video']['archival_bytes'] = \
+                        self._estimate_archival_size(info)
 
                 # download audio
-                with YoutubeDL(self.audio_options) as ydl:
-                    ydl.download(url)
+                if not self.derive_audio:
+                    info = self._get_ydl('audio').extract_info(url, download=True)
+                    result['audio'] = self._summarize_download(info)
+
+                if self.use_tor and \
+                        self.tor_pool.report_result(result['video'] is not None):
+                    self._reset_thread_instances()
                 
-                return
+                return result
                 
             except Exception as e:
                 print (f'Error downloading {url}: {e}')
+                result['error'] = str(e)
+
+                # errors other than a failed download may leave the
+                # instances in a bad state
+                if not isinstance(e, DownloadError):
+                    self._reset_thread_instances()
                 
-                if self.use_tor and attempt < max_attempts - 1:
+                # the pool renews circuits that keep failing; Tor builds
+                # the new circuit on the next connection
+                if self.use_tor and self.tor_pool.report_result(False):
                     print ('Renewing Tor circuit...')
-                    self.renew_tor_ip()
+                    self._reset_thread_instances()
 
-                    # wait for circuit to be established
-                    time.sleep(5)
-                else:
+                if not self.use_tor or attempt == max_attempts - 1:
                     break
 
-    def download_videos(self, urls: List[str], max_workers: int) -> None:
+        return result
+
+    def _summarize_download(self, info: Dict) -> Optional[Dict]:
         '''
-        Downloads multiple videos concurrently using a thread pool.
+        Keeps the parts of a yt-dlp info dictionary needed to store the
+        download, small enough to send between processes.
 
-        :param urls: A list of TikTok video URLs to download.
-        :param max_workers: The maximum number of threads to use for
-            downloading.
-        '''
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_url = {
-                executor.submit(self.download_content, url): url
-                for url in urls
-            }
-            for future in tqdm(
-                    as_completed(future_to_url),
-                    total=len(future_to_url),
-                    desc='Downloading content'
+        :param info: The info dictionary returned by yt-dlp, or None if the
+            download failed.
+        :return: A dictionary with the post 'id' and the 'paths' of the
+            downloaded files, or None.
+        '''
+        if not info:
+            return None
+
+        downloads = info.get('requested_downloads') or []
+        paths = [i.get('filepath') for i in downloads if i.get('filepath')]
+
+        # separate video and audio formats need ffmpeg to merge them
+        merged = any(len(i.get('requested_formats') or []) > 1 for i in downloads)
+        return {'id': info.get('id'), 'paths': paths, 'merged': merged}
+
+    def _format_size(self, formats: List[Dict]) -> Optional[int]:
+        '''
+        Adds up the sizes yt-dlp reports for a format selection.
+
+        :param formats: The selected formats. A merged format lists its parts
+            in 'requested_formats'.
+        :return: The size in bytes, or None if a size is unknown.
+        '''
+        total = 0
+        for f in formats:
+            parts = f.get('requested_formats') or [f]
+            for part in parts:
+                size = part.get('filesize') or part.get('filesize_approx')
+                if not size:
+                    return None
+
+                total += size
+
+        return total
+
+    def _estimate_archival_size(self, info: Dict) -> Optional[int]:
+        '''
+        Estimates the bytes the archival profile would have fetched for a
+        video, from the formats listed by the extractor. The formats come
+        ranked by the profile that downloaded them, so a copy is ranked
+        again without its format_sort before the archival format is
+        selected.
+
+        :param info: The info dictionary returned by yt-dlp.
+        :return: The size in bytes, or None if it cannot be estimated.
+        '''
+        if not info.get('formats'):
+            return None
+
+        ydl = self._get_ydl('archival')
+        info = {**info, 'formats': [dict(i) for i in info['formats']]}
+        ydl.sort_formats(info)
+        formats = info['formats']
+
+        # the selection context yt-dlp builds for the listed formats
+        selector = ydl.build_format_selector(ARCHIVAL_FORMAT)
+        selected = list(selector({
+            'formats': formats,
+            'has_merged_format': any(
+                'none' not in (i.get('acodec'), i.get('vcodec'))
+                for i in formats
+            ),
+            'incomplete_formats': (
+                all(i.get('vcodec') == 'none' for i in formats) or
+                all(i.get('acodec') == 'none' for i in formats)
+            )
+        }))
+
+        return self._format_size(selected[:1])
+
+    def _handle_result(self, result: Dict) -> None:
+        '''
+        Stores and indexes the files of a download and queues the audio
+        extraction when audio is derived locally.
+
+        :param result: The dictionary returned by fetch_content.
+        '''
+        url = result['url']
+        paths = self._store_download(url, result['video'], 'video')
+
+        if self.derive_audio:
+            # extract the audio from the local file on the ffmpeg pool
+            for path in paths:
+                self._audio_futures.append(
+                    self._audio_executor.submit(
+                        self.extract_audio, url, path, result['video']['id']
+                    )
+                )
+        else:
+            self._store_download(url, result['audio'], 'audio')
+
+    def download_content(self, url: str) -> Dict:
+        '''
+        Downloads both video and audio from the specified URL using yt-dlp,
+        once the concurrency limit allows it.
+
+        :param url: The URL of the TikTok video to download.
+        :return: The dictionary returned by fetch_content.
+        '''
+        started = self.concurrency.acquire()
+        result = None
+        try:
+            result = self.fetch_content(url)
+        finally:
+            self._release_slot(started, result)
+
+        self._handle_result(result)
+        return result
+
+    def _finish_job(self, url: str, result: Optional[Dict],
+                    error: str = None) -> None:
+        '''
+        Marks the download job of a URL as done or failed in the run
+        database, when jobs are used, and queues the keyframe extraction of
+        the downloaded video.
+
+        :param url: The URL of the TikTok video.
+        :param result: The dictionary returned by fetch_content, or None if
+            the download raised.
+        :param error: The exception raised by the download, if any.
+        '''
+        if not self._jobs_claimed:
+            return
+
+        if error is None and (result is None or result['video'] is None):
+            error = (result or {}).get('error') or 'no video downloaded'
+
+        if error is None:
+            # paths relative to the collection, shared by every host
+            output = self._sanitize_output_path(self.output)
+            self.sql_database.enqueue_download_jobs(
+                [
+                    Path(os.path.relpath(i, output)).as_posix()
+                    for i in result['video']['paths'] if os.path.exists(i)
+                ],
+                job_type='keyframes'
+            )
+
+        self.sql_database.finish_download_job(url, self.job_worker, error)
+
+    def _release_slot(self, started: float, result: Optional[Dict]) -> None:
+        '''
+        Reports the outcome of a download to the concurrency controller.
+
+        :param started: The start time of the download.
+        :param result: The dictionary returned by fetch_content, or None if
+            it raised.
+        '''
+        success = result is not None and result['video'] is not None
+        error = (result or {}).get('error') or ''
+        throttled = any(
+            f'HTTP Error {status}' in error for status in (403, 429, 503)
+        )
+        self.concurrency.release(started, success, throttled)
+
+    def _store_download(self, url: str, download: Dict,
+                        media_type: str) -> List[str]:
+        '''
+        Adds the files downloaded by yt-dlp to the media store and indexes
+        them.
+
+        :param url: The URL of the TikTok video.
+        :param download: The download summary built by _summarize_download,
+            or None if the download failed.
+        :param media_type: The type of media: 'video' or 'audio'.
+        :return: The paths of the downloaded files.
+        '''
+        if not download:
+            return []
+
+        paths = []
+        for path in download['paths']:
+            if not os.path.exists(path):
+                continue
+
+            size = os.path.getsize(path)
+            with self._stats_lock:
+                stats = self.download_stats
+                stats['bytes'] += size
+                if media_type == 'video':
+                    stats['videos'] += 1
+                    stats['muxed'] += int(download.get('merged', False))
+                    if download.get('archival_bytes'):
+                        stats['estimated_videos'] += 1
+                        stats['estimated_bytes'] += size
+                        stats['archival_bytes'] += download['archival_bytes']
+
+            self._index_file(url, download['id'], path, media_type)
+            paths.append(path)
+
+        return paths
+
+    def _index_file(self, url: str, post_id: str, path: str,
+                    media_type: str) -> None:
+        '''
+        Adds a file to the media store and indexes it.
+
+        :param url: The URL of the TikTok video.
+        :param post_id: The TikTok post ID.
+        :param path: The path of the file.
+        :param media_type: The type of media: 'video' or 'audio'.
+        '''
+        sha256 = self.media_store.ingest(path)
+        if self.sql_database is not None:
+            self.sql_database.upsert_media_index(
+                post_id=post_id, media_type=media_type, path=path,
+                url=url, size=os.path.getsize(path), sha256=sha256
+            )
+
+    def extract_audio(self, url: str, video: str,
+                      post_id: str) -> Optional[str]:
+        '''
+        Extracts the audio track of a downloaded video with ffmpeg. M4A audio
+        is copied without re-encoding when the stream allows it.
+
+        :param url: The URL of the TikTok video.
+        :param video: Path of the downloaded video.
+        :param post_id: The TikTok post ID.
+        :return: The path of the audio file, or None if extraction failed.
+        '''
+        audio = f'{self.audio_path}/{post_id}.{self.audio_format}'
+        if os.path.exists(audio):
+            return audio
+
+        mode = 'copy' if self.audio_format == 'm4a' else self.audio_format
+        result = extract_audio_track(video, audio, mode)
+        if result['error'] is None:
+            self._index_file(url, post_id, audio, 'audio')
+            return audio
+
+        print (f"Error extracting audio from {video}: {result['error']}")
+        return None
+
+    def extract_audio_files(self, videos: List[Tuple[str, str, str]]) -> None:
+        '''
+        Extracts the audio of videos downloaded by other means, e.g. from
+        direct URLs, on the ffmpeg pool.
+
+        :param videos: A list of (url, video path, post ID) tuples.
+        '''
+        if not videos:
+            return
+
+        if not os.path.exists(self.audio_path):
+            os.makedirs(self.audio_path)
+
+        with ThreadPoolExecutor(max_workers=self.audio_workers) as executor:
+            futures = [executor.submit(self.extract_audio, *i) for i in videos]
+            for _ in tqdm(
+                    as_completed(futures), total=len(futures),
+                    desc='Extracting audio'
                 ):
-                url = future_to_url[future]
-                try:
-                    future.result()
-                except Exception as e:
-                    print (f'{url} generated an exception: {e}')
+                pass
+
+    def download_videos(self, urls: List[str], max_workers: int,
+                        backend: str = 'thread') -> None:
+        '''
+        Downloads multiple videos concurrently using a thread or process
+        pool.
+
+        :param urls: A list of TikTok video URLs to download.
+        :param max_workers: The maximum number of threads or processes to use
+            for downloading.
+        :param backend: The pool running yt-dlp: 'thread' or 'process'.
+            yt-dlp's extraction and post-processing are CPU-bound Python, so
+            large batches scale further across processes.
+        '''
+        self._download_batches([urls], max_workers, backend)
+
+    def _download_batches(self, batches: Iterable[List[str]],
+                          max_workers: int, backend: str = 'thread') -> None:
+        '''
+        Downloads batches of videos on a single thread or process pool. The
+        next batch is taken when fewer downloads than workers are left, so
+        the pool, its YoutubeDL instances and Tor circuits are kept across
+        batches.
+
+        :param batches: An iterable of lists of TikTok video URLs, consumed
+            as the downloads go on.
+        :param max_workers: The maximum number of threads or processes to use
+            for downloading.
+        :param backend: The pool running yt-dlp: 'thread' or 'process'.
+        '''
+        # without an adaptive controller, every worker downloads at once
+        if self.concurrency is None or not self.concurrency.adaptive:
+            self.concurrency = AIMDController(
+                min_limit=max_workers, max_limit=max_workers
+            )
+        max_workers = self.concurrency.max_limit
+        start = time.monotonic()
+
+        if self.derive_audio:
+            if not os.path.exists(self.audio_path):
+                os.makedirs(self.audio_path)
+
+            self._audio_executor = ThreadPoolExecutor(
+                max_workers=self.audio_workers
+            )
+
+        if backend == 'process':
+            self._download_with_processes(iter(batches), max_workers)
+        else:
+            self._download_with_threads(iter(batches), max_workers)
+
+        # wait for the audio extraction of the last videos
+        if self._audio_executor is not None:
+            wait(self._audio_futures)
+            self._audio_executor.shutdown()
+            self._audio_executor = None
+            self._audio_futures = []
+
+        self.download_stats['seconds'] += time.monotonic() - start
+
+    def _download_with_threads(self, batches: Iterable[List[str]],
+                               max_workers: int) -> None:
+        '''
+        Downloads videos on a thread pool. Each worker thread keeps its
+        YoutubeDL instances until every batch is downloaded.
+
+        :param batches: An iterator of lists of TikTok video URLs.
+        :param max_workers: The maximum number of threads.
+        '''
+        future_to_url = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+                tqdm(total=0, desc='Downloading content') as pbar:
+
+            def submit_batch() -> None:
+                urls = next(batches, None) or []
+                pbar.total += len(urls)
+                pbar.refresh()
+                for url in urls:
+                    future = executor.submit(self.download_content, url)
+                    future_to_url[future] = url
+
+            submit_batch()
+            while future_to_url:
+                done, _ = wait(future_to_url, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = future_to_url.pop(future)
+                    try:
+                        self._finish_job(url, future.result())
+                    except Exception as e:
+                        print (f'{url} generated an exception: {e}')
+                        self._finish_job(url, None, str(e))
+
+                    pbar.update(1)
+
+                # take the next batch before the workers run out of URLs
+                if len(future_to_url) < max_workers:
+                    submit_batch()
+
+        self.close_instances()
+
+    def _download_with_processes(self, batches: Iterable[List[str]],
+                                 max_workers: int) -> None:
+        '''
+        Downloads videos on a process pool. Each process keeps its own
+        YoutubeDL instances until every batch is downloaded; results come
+        back to this process, which stores and indexes the files. URLs are
+        submitted as the concurrency limit allows.
+
+        :param batches: An iterator of lists of TikTok video URLs.
+        :param max_workers: The maximum number of processes.
+        '''
+        pending_urls = deque()
+        future_to_url = {}
+        # the bandwidth cap is shared out between the processes
+        bandwidth_limit = self.bandwidth_limit / max_workers \
+            if self.bandwidth_limit else None
+        initargs = (
+            self.output, self.use_tor, self.derive_audio,
+            self.video_options, self.audio_options, self.tor_pool.socks_ports,
+            self.download_profile, bandwidth_limit
+        )
+
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_download_process,
+                                 initargs=initargs) as executor, \
+                tqdm(total=0, desc='Downloading content') as pbar:
+
+            def submit_ready() -> None:
+                # take the next batch before the workers run out of URLs
+                if not pending_urls and len(future_to_url) < max_workers:
+                    urls = next(batches, None) or []
+                    pending_urls.extend(urls)
+                    pbar.total += len(urls)
+                    pbar.refresh()
+
+                while pending_urls and self.concurrency.try_acquire():
+                    url = pending_urls.popleft()
+                    future = executor.submit(_download_in_process, url)
+                    future_to_url[future] = (url, time.monotonic())
+
+            submit_ready()
+            while future_to_url:
+                done, _ = wait(future_to_url, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, started = future_to_url.pop(future)
+                    result = error = None
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print (f'{url} generated an exception: {e}')
+                        error = str(e)
+
+                    self._release_slot(started, result)
+                    if result is not None:
+                        # circuit counters of the download process
+                        if result.get('circuit'):
+                            self.tor_pool.merge(result.pop('circuit'))
+
+                        try:
+                            self._handle_result(result)
+                        except Exception as e:
+                            print (f'{url} generated an exception: {e}')
+                            error = str(e)
+
+                    self._finish_job(url, result, error)
+
+                    pbar.update(1)
+
+                submit_ready()
+
+    def report_download_stats(self) -> None:
+        '''
+        Prints the bytes of the files fetched by yt-dlp, in total and per
+        video.
+        '''
+        stats = self.download_stats
+        per_video = stats['bytes'] / stats['videos'] if stats['videos'] else 0
+        audio = 'derived locally' if self.derive_audio else 'downloaded'
+        print (
+            f"\n> {stats['videos']} videos, "
+            f"{stats['bytes'] / 1024 ** 2:.1f} MB fetched "
+            f"({per_video / 1024 ** 2:.2f} MB per video, audio {audio})"
+        )
+
+        if self.download_profile == 'archival' or not stats['videos']:
+            return
+
+        # savings against the archival formats, at the observed throughput
+        line = f'> Profile {self.download_profile} (max {self.max_height}p)'
+        if stats['estimated_videos']:
+            saved = stats['archival_bytes'] - stats['estimated_bytes']
+            rate = stats['bytes'] / stats['seconds'] if stats['seconds'] else 0
+            line += (
+                f": {saved / 1024 ** 2:.1f} MB saved against archival "
+                f"({stats['estimated_videos']} videos with known sizes)"
+            )
+            if rate:
+                line += f', about {saved / rate:.0f}s of download time'
+
+        print (line)
+        print (
+            f"  {stats['videos'] - stats['muxed']} of {stats['videos']} "
+            f"videos needed no ffmpeg merge"
+        )
+
+    def check_tor(self) -> bool:
+        '''
+        Tests the Tor connection when Tor is enabled. Downloads fall back to
+        a normal connection if it does not work.
+
+        :return: True if downloads go through Tor, False otherwise.
+        '''
+        if self.use_tor:
+            self.use_tor = self._test_tor_connection()
+
+        return self.use_tor
 
     def _test_tor_connection(self) -> bool:
         '''
-        Tests if Tor is available and working.
+        Tests if Tor is available and working. SocksPorts that are not open
+        are removed from the circuit pool.
         
         :return: True if Tor is available and working, False otherwise.
         '''
         try:
-            # test if port is open
-            import socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(('127.0.0.1', 9050))
-            if result != 0:
+            # test if ports are open
+            open_ports = []
+            for port in self.tor_pool.socks_ports:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    if sock.connect_ex((self.tor_pool.host, port)) == 0:
+                        open_ports.append(port)
+                    else:
+                        print (f'\nTor SOCKS port ({port}) is not open.')
+
+            if not open_ports:
                 print ('\n\n')
-                print ('Tor SOCKS port (9050) is not open. Is Tor running?')
+                print ('No Tor SOCKS port is open. Is Tor running?')
                 print ('Falling back to normal connection.\n')
                 return False
+
+            self.tor_pool.socks_ports = open_ports
             
-            # if port is open, test connection
-            import requests
+            # if a port is open, test connection
             print ('\n\nTesting Tor connection...')
+            proxy = self.tor_pool.proxy_url(open_ports[0], 'tikspyder-test', '0')
             response = requests.get(
                 'https://check.torproject.org/api/ip',
                 proxies={
-                    'http': self.proxy,
-                    'https': self.proxy
+                    'http': proxy,
+                    'https': proxy
                 },
                 timeout=10
             )
             
             if response.status_code == 200:
                 data = response.json()
-                print (f'Tor connection successful. Exit node IP: {data.get("IP")}\n\n')
+                print (f'Tor connection successful. Exit node IP: {data.get("IP")}')
+                print (f'Workers spread over SocksPorts {open_ports}\n\n')
                 return True
             else:
                 print ('Tor enabled but connection check failed. Using normal connection.\n\n')
@@ -218,26 +881,152 @@ class VideoDownloader:
             print (f'\nTor connection failed ({e}). Using normal connection.\n')
             return False
 
-    def start_download(self, urls: List[str], max_workers: int) -> None:
+    def download_jobs(self, max_workers: int, backend: str = 'thread') -> int:
+        '''
+        Downloads the queued jobs of the run database, claiming them in
+        batches with a lease. Jobs left running by an interrupted or crashed
+        run are claimed again once their lease expires; on Ctrl+C the
+        claimed jobs go back to the queue.
+
+        :param max_workers: The maximum number of threads or processes to use
+            for downloading.
+        :param backend: The pool running yt-dlp: 'thread' or 'process'.
+        :return: The number of jobs run.
         '''
-        Starts the download process for a list of TikTok video URLs.
+        batch_size = max_workers * 4
+        claimed = []
+
+        def claim_batches():
+            while True:
+                urls = self.sql_database.claim_download_jobs(
+                    worker=self.job_worker, limit=batch_size,
+                    lease_seconds=self.job_lease_seconds
+                )
+                if not urls:
+                    return
+
+                claimed.extend(urls)
+                yield urls
+
+        # the pool is only started when there are jobs to run
+        batches = claim_batches()
+        first = next(batches, None)
+        if first is None:
+            return 0
+
+        self._jobs_claimed = True
+        try:
+            self._download_batches(
+                itertools.chain([first], batches), max_workers, backend
+            )
+        except KeyboardInterrupt:
+            self.sql_database.release_download_jobs(self.job_worker)
+            raise
+        finally:
+            self._jobs_claimed = False
+
+        return len(claimed)
+
+    def report_download_jobs(self) -> None:
+        '''
+        Prints the download jobs of the run database by status.
+        '''
+        counts = self.sql_database.get_download_job_counts()
+        print (
+            f"> Download jobs: {counts['done']} done, "
+            f"{counts['failed']} failed, {counts['queued']} queued, "
+            f"{counts['running']} running"
+        )
+        if counts['failed']:
+            print ('  Failed jobs keep their last error in the download_jobs '
+                   'table; run again with --retry-failed to retry them.')
+
+    def start_download(self, urls: List[str], max_workers: int,
+                       backend: str = 'thread',
+                       retry_failed: bool = False) -> None:
+        '''
+        Starts the download process for a list of TikTok video URLs. With a
+        run database, URLs are queued as download jobs, so an interrupted
+        download resumes where it stopped and failed URLs are recorded.
 
         :param urls: A list of TikTok video URLs to download.
         :param max_workers: The maximum number of threads to use for
             downloading. Default is 5.
+        :param backend: The pool running yt-dlp: 'thread' or 'process'.
+        :param retry_failed: Whether to queue again the jobs that failed in
+            previous runs.
         '''
-        if self.use_tor:
-            # test Tor connection and update use_tor flag accordingly
-            self.use_tor = self._test_tor_connection()
-            
-            # remove proxy settings if Tor connection failed
-            if not self.use_tor:
-                for options in [self.video_options, self.audio_options]:
-                    options.pop('proxy', None)
+        # test Tor connection and update use_tor flag accordingly
+        self.check_tor()
         
         print ('> Starting download...\n')
         
         # download videos
-        self.download_videos(urls=urls, max_workers=max_workers)
+        if self.sql_database is not None:
+            self.sql_database.enqueue_download_jobs(urls)
+            if retry_failed:
+                count = self.sql_database.requeue_failed_download_jobs()
+                print (f'> {count} failed jobs queued again')
+
+            self.download_jobs(max_workers=max_workers, backend=backend)
+        else:
+            self.download_videos(
+                urls=urls, max_workers=max_workers, backend=backend
+            )
+
+        self.report_download_stats()
+        self.media_store.report()
+        if self.use_tor:
+            self.tor_pool.report()
+        if self.concurrency.adaptive:
+            self.concurrency.report()
+            self.concurrency.export_timeline(self._sanitize_output_path(self.output))
+        if self.sql_database is not None:
+            self.report_download_jobs()
 
         print ('\n\nDownload complete.')
+
+# VideoDownloader of each download process
+_process_downloader = None
+
+def _init_download_process(output: str, use_tor: bool, derive_audio: bool,
+                           video_options: Dict, audio_options: Dict,
+                           tor_socks_ports: List[int], download_profile: str,
+                           bandwidth_limit: Optional[float]) -> None:
+    '''
+    Creates the VideoDownloader of a download process, with the options of
+    the parent downloader.
+
+    :param output: The original directory path provided by the user
+    :param use_tor: Boolean indicating whether to use Tor for downloads
+    :param derive_audio: Whether audio is derived locally by the parent.
+    :param video_options: yt-dlp options for video downloads.
+    :param audio_options: yt-dlp options for audio downloads.
+    :param tor_socks_ports: Tor SocksPorts the download workers are spread
+        over.
+    :param download_profile: The download profile of the parent.
+    :param bandwidth_limit: The share of the bandwidth cap of this process,
+        in bytes per second, or None.
+    '''
+    global _process_downloader
+    _process_downloader = VideoDownloader(
+        output=output, use_tor=use_tor, derive_audio=derive_audio,
+        tor_socks_ports=tor_socks_ports, download_profile=download_profile,
+        bandwidth_limit=bandwidth_limit
+    )
+    _process_downloader.video_options = video_options
+    _process_downloader.audio_options = audio_options
+
+def _download_in_process(url: str) -> Dict:
+    '''
+    Downloads a URL with the VideoDownloader of the current process.
+
+    :param url: The URL of the TikTok video to download.
+    :return: The dictionary returned by VideoDownloader.fetch_content,
+        with the counters of the process's Tor 'circuit' when Tor is used.
+    '''
+    result = _process_downloader.fetch_content(url)
+    if _process_downloader.use_tor:
+        result['circuit'] = _process_downloader.tor_pool.snapshot()
+
+    return result
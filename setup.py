@@ -11,15 +11,18 @@ setup(
     install_requires=[
         "aiohttp",
         "apify-client",
+        "httpx[http2]",
+        "numpy",
         "pandas",
         "PySocks",
         "requests",
-        "serpapi",
-        "stem",
         "streamlit",
         "tqdm",
         "yt-dlp[default]"
     ],
+    extras_require={
+        'thumbnails': ["Pillow"],
+    },
     entry_points={
         'console_scripts': [
             'tikspyder=main:main',
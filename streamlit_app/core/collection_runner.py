@@ -2,15 +2,11 @@
 
 # import modules
 import streamlit as st
-import asyncio
 import time
 
-# import submodules
-from concurrent.futures import ThreadPoolExecutor
-
 # local imports
 from data_collectors import TikTokDataCollector
-from media_handlers import VideoDownloader
+from media_handlers import VideoDownloader, RequestSession, DownloadPlanner
 from utils import create_output_data_path
 from ..components.progress import create_progress_tracker, update_progress, \
     mark_step_complete
@@ -68,29 +64,21 @@ def run_collection(search_config, apify_config, collection_config, config_attrs)
     # Create progress tracker
     overall_progress, status_text, step_progress, steps = create_progress_tracker()
     
-    def run_collection_thread():
-        """Run collection in separate thread with own event loop"""
-        # Create new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    def run_data_collection():
+        """Run collection; the collector owns its background event loop"""
+        collector = TikTokDataCollector(args=args)
         
         try:
-            # Create collector in this thread
-            collector = TikTokDataCollector(args=args)
-            
             # Execute the main collection process
             collector.collect_search_data()
             
             # Generate files
             collector.generate_data_files()
             
-            # Get collected videos for download
-            collected_videos = collector.get_collected_videos() if args['download'] else []
-            
-            return collector, collected_videos
+            return collector
             
         finally:
-            loop.close()
+            collector.close()
     
     try:
         # Create output directory
@@ -113,10 +101,8 @@ def run_collection(search_config, apify_config, collection_config, config_attrs)
             overall_progress.progress(45)
             time.sleep(0.1)
         
-        # Run collection in separate thread to avoid asyncio conflicts
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(run_collection_thread)
-            collector, collected_videos = future.result()
+        # Run collection
+        collector = run_data_collection()
         
         # Mark data collection steps as complete
         mark_step_complete(1, step_progress, "Search results collected")
@@ -134,19 +120,33 @@ def run_collection(search_config, apify_config, collection_config, config_attrs)
         if args['download']:
             update_progress(5, overall_progress, status_text, step_progress, steps, "Downloading...", 80)
             
-            if collected_videos:
-                st.info(f'📹 Found {len(collected_videos)} videos to download')
-                
-                downloader = VideoDownloader(
-                    output=args['output'],
-                    use_tor=args['use_tor']
+            downloader = VideoDownloader(
+                output=args['output'],
+                use_tor=args['use_tor'],
+                sql_database=collector.sql_database
+            )
+            request_session = RequestSession(
+                sql_database=collector.sql_database,
+                media_store=downloader.media_store
+            )
+            planner = DownloadPlanner(
+                output=collector.output,
+                sql_database=collector.sql_database,
+                request_session=request_session,
+                downloader=downloader
+            )
+            try:
+                planner.run(
+                    max_workers=args['max_workers'],
+                    user=collector.user
                 )
-                downloader.start_download(
-                    urls=collected_videos,
-                    max_workers=args['max_workers']
-                )
-                
-                mark_step_complete(5, step_progress, f"{len(collected_videos)} videos downloaded")
+            finally:
+                request_session.close()
+            
+            downloaded = planner.stats['direct'] + planner.stats['ytdlp']
+            if downloaded:
+                st.info(f'📹 {downloaded} videos downloaded, {planner.stats["missing"]} missing')
+                mark_step_complete(5, step_progress, f"{downloaded} videos downloaded")
             else:
                 mark_step_complete(5, step_progress, "No new videos to download")
         else:
@@ -6,7 +6,10 @@ import glob
 import subprocess
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def extract_keyframes_sync(output_dir, max_workers=3):
+# local dependencies
+from media_handlers.utilities import build_keyframes_command
+
+def extract_keyframes_sync(output_dir, max_workers=3, engine='skip'):
     """Synchronous keyframes extraction - no async conflicts"""
     # Build keyframes path
     keyframes_path = f'{output_dir}/keyframes'
@@ -42,15 +45,9 @@ def extract_keyframes_sync(output_dir, max_workers=3):
                 os.makedirs(video_keyframes_dir)
             
             # FFmpeg command to extract keyframes
-            cmd = [
-                'ffmpeg',
-                '-i', file,
-                '-vf', 'select=eq(pict_type\\,I)',
-                '-vsync', 'vfr',
-                '-q:v', '2',
-                '-y',  # Overwrite output files
-                f'{video_keyframes_dir}/keyframe_%04d.jpg'
-            ]
+            cmd = build_keyframes_command(
+                file, f'{video_keyframes_dir}/keyframe_%04d.jpg', engine
+            )
 
             # Run FFmpeg synchronously
             subprocess.run(
@@ -2,9 +2,10 @@
 
 # import modules
 import os
+import re
 
 # typing
-from typing import Dict
+from typing import Dict, List
 
 # import submodules
 from configparser import ConfigParser
@@ -26,7 +27,8 @@ def get_config_attrs(config_dir=None) -> Dict:
 
     :param config_dir: Optional path to the config directory.
                        If None, uses the default path.
-    :return: A dictionary containing the SerpAPI and Apify credentials.
+    :return: A dictionary containing the SerpAPI and Apify credentials,
+        including the 'api_keys' and 'apify_tokens' pools.
     '''
     if config_dir is None:
         project_root = get_project_root()
@@ -49,8 +51,24 @@ def get_config_attrs(config_dir=None) -> Dict:
     if 'Apify Token' in config:
         credentials.update(dict(config['Apify Token']))
     
+    # key pools: several comma or newline separated values
+    for key, pool in [('api_key', 'api_keys'), ('apify_token', 'apify_tokens')]:
+        values = split_config_values(credentials.get(key, ''))
+        credentials[pool] = values
+        credentials[key] = values[0] if values else ''
+    
     return credentials
 
+def split_config_values(value: str) -> List[str]:
+    '''
+    Splits a configuration value holding several comma or newline separated
+    entries.
+
+    :param value: The raw configuration value.
+    :return: A list with the non-empty entries.
+    '''
+    return [i.strip() for i in re.split(r'[,\n]', value) if i.strip()]
+
 '''
 Verify date format
 